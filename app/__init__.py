@@ -1,22 +1,46 @@
 # ==============================================================================
 # ARQUIVO: app/__init__.py
 # DESCRIÇÃO: Factory da aplicação Flask, registra os blueprints dos servidores.
-# v2 (Corrigido)
+# v10 (Papel 'events': canal SSE em workers assíncronos)
+#
+# Papéis (APP_ROLE ou argumento de create_app):
+#   all          -> todos os blueprints num só processo (desenvolvimento)
+#   web          -> auth_server + request_server (páginas e proxies)
+#   integration  -> integration_server (API /api)
+#   events       -> events_server (canal SSE; workers gevent em produção)
 # ==============================================================================
-from flask import Flask
+from flask import Flask, Response, g, request, jsonify
 import os
+import time
+from . import metrics, resilience, session_store, singleflight
+from .logging_config import setup_logging
 
-def create_app():
+APP_ROLES = ('all', 'web', 'integration', 'events')
+
+def create_app(role=None):
     """
     Cria e configura a instância da aplicação Flask.
     Esta função é conhecida como 'Application Factory'.
+
+    Args:
+        role (str): Blueprints a registar (ver APP_ROLES); por omissão, APP_ROLE
+            ou 'all'.
     """
+    role = (role or os.environ.get('APP_ROLE', 'all')).lower()
+    if role not in APP_ROLES:
+        raise ValueError(f"APP_ROLE desconhecido: '{role}'. Opções: {', '.join(APP_ROLES)}.")
+    # Logging com níveis por subsistema; a escrita ocorre numa thread dedicada.
+    setup_logging()
+
     app = Flask(__name__, instance_relative_config=True, static_folder='../static')
 
     # Configurações da aplicação
     # A SECRET_KEY é usada pelo Flask para manter as sessões seguras.
     app.config.from_mapping(
         SECRET_KEY=os.environ.get('SECRET_KEY', 'dev_secret_key_change_this'),
+        APP_ROLE=role,
+        # Endereço base do integration_server, usado pelos proxies do request_server.
+        INTEGRATION_API_URL=os.environ.get('INTEGRATION_API_URL', 'http://127.0.0.1:5000'),
     )
 
     # Garante que a pasta 'instance' exista
@@ -25,27 +49,85 @@ def create_app():
     except OSError:
         pass
 
+    # Sessões no servidor: o cookie leva apenas um identificador opaco. A API
+    # de integração não usa sessões.
+    if role != 'integration':
+        session_store.init_app(app)
+
     # --- Registro dos Blueprints dos Servidores ---
     # CORREÇÃO: Importamos o módulo inteiro e depois registramos seu blueprint 'bp'.
     # Isso evita erros de importação e é uma prática padrão no Flask.
     
-    # Servidor de Autenticação
-    from . import auth_server
-    app.register_blueprint(auth_server.bp)
+    if role in ('all', 'web'):
+        # Servidor de Autenticação
+        from . import auth_server
+        app.register_blueprint(auth_server.bp)
 
-    # Servidor de Requisições (Interface do Usuário)
-    from . import request_server
-    app.register_blueprint(request_server.bp)
+        # Servidor de Requisições (Interface do Usuário)
+        from . import request_server
+        app.register_blueprint(request_server.bp)
     
-    # Servidor de Integração (Lógica de Negócio e APIs)
-    from . import integration_server
-    app.register_blueprint(integration_server.bp)
+    if role in ('all', 'integration'):
+        # Servidor de Integração (Lógica de Negócio e APIs)
+        from . import integration_server
+        app.register_blueprint(integration_server.bp)
+
+    if role in ('all', 'events'):
+        # Servidor de Eventos (canal SSE dos dashboards)
+        from . import events_server
+        app.register_blueprint(events_server.bp)
+
+
+    # --- Instrumentação de latência de todas as rotas ---
+    @app.before_request
+    def _start_request_timer():
+        g.request_started_at = time.perf_counter()
+
+    @app.after_request
+    def _record_request_duration(response):
+        started_at = g.pop('request_started_at', None)
+        if started_at is not None:
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            metrics.observe_http_request(endpoint, request.method, response.status_code,
+                                         time.perf_counter() - started_at)
+        return response
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        # Exposição das métricas no formato de texto do Prometheus; os módulos
+        # resilience e singleflight registam as suas em app/metrics.py.
+        body = metrics.render_prometheus()
+        return Response(body, mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    # --- Verificações de saúde (por processo) ---
+    @app.route('/healthz')
+    def healthz():
+        # Liveness: o processo responde.
+        return jsonify({"status": "ok", "role": role})
 
+    @app.route('/readyz')
+    def readyz():
+        # Readiness: as dependências de que este papel precisa respondem.
+        checks = {}
+        if role in ('all', 'integration', 'events'):
+            from .integration_server.utils import blockchain_utils
+            checks['multichain'] = blockchain_utils._make_rpc_request('getinfo') is not None
+        if role == 'web':
+            import requests
+            try:
+                url = app.config['INTEGRATION_API_URL'].rstrip('/') + '/healthz'
+                checks['integration'] = requests.get(url, timeout=2).ok
+            except requests.exceptions.RequestException:
+                checks['integration'] = False
+        ready = all(checks.values())
+        return jsonify({"status": "ready" if ready else "unavailable", "role": role, "checks": checks}), 200 if ready else 503
 
     @app.route('/')
     def index():
         # Redireciona a rota raiz para a página de login
         from flask import redirect, url_for
+        if role in ('integration', 'events'):
+            return jsonify({"status": "ok", "role": role})
         return redirect(url_for('auth.login'))
 
     return app
\ No newline at end of file
@@ -1,33 +1,66 @@
 # ==============================================================================
 # ARQUIVO: app/auth_server/routes.py
 # DESCRIÇÃO: Rotas para autenticação, com lógica de sessão corrigida
-#              e debug prints para análise de falhas de login.
-# VERSÃO: 5.1 (Debug)
+#              e registos de debug para análise de falhas de login.
+# VERSÃO: 6.2 (Aquecimento da cache uma vez por processo, sob lock; só nas páginas)
 # ==============================================================================
 
 # --- 1. IMPORTAÇÕES ---
-import json
 import hashlib
 import datetime
-import requests
-import os 
+import logging
+import threading
 from flask import render_template, request, session, redirect, url_for, flash
 from . import bp
+from .user_directory import user_directory, person_details, details_key
+
+logger = logging.getLogger(__name__)
 
 # --- 2. FUNÇÕES AUXILIARES ---
-def load_users():
+def apply_person_details(details):
+    """
+    Copia os detalhes de pessoa para a sessão. Para os perfis que não são
+    'cliente', o nome do representante é o próprio identificador de login.
+    """
+    session['cliente_nome'] = details.get('client_name', 'Nome não encontrado')
+    session['cliente_cnpj'] = details.get('client_cnpj', 'CNPJ não encontrado')
+    if session.get('user_role') == 'cliente':
+        session['representative_name'] = details.get('rep_name', 'N/A')
+    session.pop('details_key', None)
+
+# Blueprints cujas páginas usam a sessão (os detalhes só são completados aí).
+SESSION_BLUEPRINTS = ('auth', 'request')
+
+_warm_lock = threading.Lock()
+_warm_started = threading.Event()
+
+def warm_person_details():
+    """Aquece a cache com os detalhes de todos os utilizadores, uma vez por processo."""
+    if _warm_started.is_set():
+        return
+    with _warm_lock:
+        if _warm_started.is_set():
+            return
+        _warm_started.set()
+    person_details.warm(user_directory.all())
+
+@bp.before_app_request
+def complete_person_details():
     """
-    Carrega os dados dos utilizadores a partir do ficheiro users.json.
+    Na primeira página servida pelo processo, aquece a cache com os detalhes
+    de todos os utilizadores (no processo que serve os pedidos, para que as
+    threads de fundo existam no worker). Nas sessões abertas antes de os
+    detalhes estarem em cache, completa-os assim que ficarem disponíveis.
+    Ficheiros estáticos e a API não passam por aqui.
     """
-    try:
-        # É uma boa prática usar um caminho absoluto para garantir que o ficheiro é sempre encontrado
-        # Assumindo que users.json está na raiz do projeto, um nível acima de 'app'
-        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-        users_path = os.path.join(base_dir, 'users.json')
-        with open(users_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
+    if request.blueprint not in SESSION_BLUEPRINTS:
+        return
+    warm_person_details()
+    pending_key = session.get('details_key')
+    if pending_key:
+        details = person_details.get(tuple(pending_key))
+        if details:
+            apply_person_details(details)
 
 # --- 3. ROTAS DA APLICAÇÃO ---
 @bp.route('/login', methods=['GET', 'POST'])
@@ -42,67 +75,44 @@ def login():
         senha = request.form.get('senha')
         client_ip = request.remote_addr
 
-        users = load_users()
-    
         senha_hash_digitada = hashlib.sha256(senha.encode('utf-8')).hexdigest()
         
-        # Primeiro, tenta encontrar o utilizador pelo login e representante
-        user_data = next((user for user in users if user['login'] == login and user['representante'] == representante), None)
+        # Procura o utilizador no índice por (login, representante).
+        user_data = user_directory.find(login, representante)
 
         # Verifica se o utilizador não foi encontrado ou se a senha está incorreta
         if not user_data or user_data['senha_hash'] != senha_hash_digitada:
-            # --- INÍCIO DO DEBUG PRINT ---
-            print("\n--- FALHA NO LOGIN ---")
-            print("DADOS DIGITADOS:")
-            print(f"  - Login: '{login}'")
-            print(f"  - Representante: '{representante}'")
-            print(f"  - Senha: '{senha}'")
-            print(f"  - Hash Gerado: {senha_hash_digitada}")
-            print("-" * 20)
-            if user_data:
-                # O utilizador foi encontrado, mas a senha estava errada
-                print("DADOS ESPERADOS (Utilizador Encontrado):")
-                print(f"  - Login: '{user_data['login']}'")
-                print(f"  - Representante: '{user_data['representante']}'")
-                print(f"  - Hash no Ficheiro: {user_data['senha_hash']}")
-            else:
-                # O utilizador nem sequer foi encontrado com a combinação login/representante
-                print("DADOS ESPERADOS: Nenhum utilizador encontrado com o login e representante fornecidos.")
-            print("----------------------\n")
-            # --- FIM DO DEBUG ---
+            # A senha digitada e os hashes nunca são registados.
+            logger.info("Falha no login: login=%r representante=%r ip=%s motivo=%s",
+                        login, representante, client_ip,
+                        'senha incorreta' if user_data else 'utilizador não encontrado')
             
             flash('Login, identificador ou senha inválidos.', 'danger')
             return redirect(url_for('auth.login'))
 
         # Se chegou até aqui, o login foi bem-sucedido
-        details = {}
-        try:
-            payload = {'client_id': user_data.get('nomus_client_id')}
-            
-            if user_data['role'] == 'cliente':
-                payload['rep_id'] = user_data.get('nomus_rep_id')
-            
-            api_response = requests.post("http://127.0.0.1:5000/api/person-details", json=payload, timeout=10)
-            api_response.raise_for_status()
-            details = api_response.json()
-
-            if user_data['role'] != 'cliente':
-                details['rep_name'] = user_data.get('representante')
-
-        except requests.exceptions.RequestException as e:
-            print(f"ERRO ao chamar a API de integração: {e}")
-            details = {"client_name": "N/A", "client_cnpj": "N/A", "rep_name": "N/A"}
-            flash("Aviso: Não foi possível carregar os detalhes do cliente/representante.", "warning")
-
         session.clear()
         session['user_id'] = user_data['login']
         session['user_role'] = user_data['role']
         session['user_ip'] = client_ip
-        session['cliente_nome'] = details.get('client_name', 'Nome não encontrado')
-        session['cliente_cnpj'] = details.get('client_cnpj', 'CNPJ não encontrado')
-        session['representative_name'] = details.get('rep_name', 'N/A')
+        session['representative_name'] = user_data.get('representante') if user_data['role'] != 'cliente' else 'N/A'
         session['senha_contract_hash'] = user_data.get('senha_contract_hash')
+        # Contrato a que o utilizador pertence (ver 'contract_id' no users.json);
+        # repassado ao integration_server em cada pedido.
+        session['contract_id'] = user_data.get('contract_id')
         session['login_time'] = datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+
+        # Os detalhes vêm da cache; se ainda não existirem, o login não espera
+        # pela Nomus: são obtidos em segundo plano e completados na sessão
+        # numa das próximas requisições.
+        key = details_key(user_data)
+        details = person_details.get(key)
+        if details:
+            apply_person_details(details)
+        else:
+            session['cliente_nome'] = 'A carregar...'
+            session['cliente_cnpj'] = 'A carregar...'
+            session['details_key'] = list(key)
         
         flash('Login realizado com sucesso!', 'success')
         return redirect(url_for('request.home'))
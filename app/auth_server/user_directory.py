@@ -0,0 +1,141 @@
+# ==============================================================================
+# ARQUIVO: app/auth_server/user_directory.py
+# DESCRIÇÃO: Diretório de utilizadores e cache dos detalhes de pessoa (nome,
+#              CNPJ, representante) usados no login. O users.json é carregado
+#              uma vez, indexado por (login, representante) e recarregado quando
+#              o ficheiro muda; os detalhes vindos da Nomus ficam em cache e são
+#              obtidos em segundo plano, fora do caminho do login.
+# VERSÃO: 1.1 (Endereço do integration_server configurável)
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import os
+import json
+import time
+import logging
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# --- 2. CONSTANTES ---
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+USERS_PATH = os.path.join(BASE_DIR, 'users.json')
+# Corre fora do contexto da aplicação (threads de fundo): lê o endereço do ambiente.
+PERSON_DETAILS_URL = os.getenv('INTEGRATION_API_URL', 'http://127.0.0.1:5000').rstrip('/') + '/api/person-details'
+# Validade dos detalhes em cache; depois disso são servidos e renovados.
+PERSON_DETAILS_TTL_SECONDS = float(os.getenv('PERSON_DETAILS_TTL_SECONDS', '3600'))
+
+# --- 3. DIRETÓRIO DE UTILIZADORES ---
+
+class UserDirectory:
+    """
+    Índice (login, representante) -> utilizador, recarregado quando a data de
+    modificação ou o tamanho do users.json mudam.
+    """
+    def __init__(self, path=USERS_PATH):
+        self.path = path
+        self._index = {}
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def _current_signature(self):
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def _reload_if_changed(self):
+        signature = self._current_signature()
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature == self._signature:
+                return
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    users = json.load(f)
+                self._index = {(u.get('login'), u.get('representante')): u for u in users}
+                logger.info("Diretório de utilizadores carregado: %d entradas.", len(self._index))
+            except FileNotFoundError:
+                self._index = {}
+            except json.JSONDecodeError as e:
+                # Mantém o índice anterior: um ficheiro a meio de uma edição não
+                # deve impedir os logins.
+                logger.error("users.json inválido (%s); a manter a versão anterior.", e)
+            self._signature = signature
+
+    def find(self, login, representante):
+        self._reload_if_changed()
+        return self._index.get((login, representante))
+
+    def all(self):
+        self._reload_if_changed()
+        return list(self._index.values())
+
+# --- 4. CACHE DOS DETALHES DE PESSOA ---
+
+def details_key(user_data):
+    """Chave dos detalhes de um utilizador: (cliente, representante ou None)."""
+    rep_id = user_data.get('nomus_rep_id') if user_data.get('role') == 'cliente' else None
+    return (user_data.get('nomus_client_id'), rep_id)
+
+class PersonDetailsCache:
+    """
+    Detalhes de pessoa por (client_id, rep_id). `get` nunca espera pela Nomus:
+    devolve o que estiver em cache (mesmo expirado) e agenda a obtenção em
+    segundo plano quando falta ou está expirado.
+    """
+    def __init__(self, url=PERSON_DETAILS_URL, ttl=PERSON_DETAILS_TTL_SECONDS):
+        self.url = url
+        self.ttl = ttl
+        self._entries = {}  # chave -> (detalhes, instante da obtenção)
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='person-details')
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            self.refresh(key)
+        return dict(entry[0]) if entry else None
+
+    def refresh(self, key):
+        """Agenda a obtenção dos detalhes, se ainda não estiver em curso."""
+        with self._lock:
+            if key in self._in_flight:
+                return
+            self._in_flight.add(key)
+        self._executor.submit(self._fetch, key)
+
+    def warm(self, users):
+        """Agenda a obtenção dos detalhes de todos os utilizadores indicados."""
+        for key in {details_key(u) for u in users}:
+            with self._lock:
+                cached = key in self._entries
+            if not cached:
+                self.refresh(key)
+
+    def _fetch(self, key):
+        client_id, rep_id = key
+        try:
+            payload = {'client_id': client_id}
+            if rep_id is not None:
+                payload['rep_id'] = rep_id
+            response = requests.post(self.url, json=payload, timeout=10)
+            response.raise_for_status()
+            details = response.json()
+            with self._lock:
+                self._entries[key] = (details, time.monotonic())
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning("Não foi possível obter os detalhes de pessoa %s: %s", key, e)
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+
+# Instâncias únicas por processo.
+user_directory = UserDirectory()
+person_details = PersonDetailsCache()
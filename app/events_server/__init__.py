@@ -0,0 +1,14 @@
+# ==============================================================================
+# ARQUIVO: app/events_server/__init__.py
+# DESCRIÇÃO: Inicializa o blueprint do servidor de eventos (canal SSE).
+# v1
+# ==============================================================================
+from flask import Blueprint
+
+# Sem prefixo: serve /api-proxy/events (navegadores, com sessão) e
+# /api/events/stream (clientes da API, com X-Contract-Id), os mesmos caminhos
+# que o request_server e o integration_server usavam.
+bp = Blueprint('events', __name__)
+
+# Importa as rotas no final para evitar dependências circulares.
+from . import routes
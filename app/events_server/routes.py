@@ -0,0 +1,82 @@
+# ==============================================================================
+# ARQUIVO: app/events_server/routes.py
+# DESCRIÇÃO: Canal Server-Sent Events dos dashboards. Uma ligação SSE fica
+#              aberta enquanto o navegador escuta; num worker síncrono ocupa
+#              uma thread durante todo esse tempo. Este blueprint é servido
+#              pelo papel 'events', com workers assíncronos (gevent), onde cada
+#              ligação é uma greenlet: milhares de dashboards inativos custam
+#              memória, não threads. O navegador liga-se diretamente aqui (o
+#              proxy reverso encaminha /api-proxy/events), sem passar por uma
+#              thread do request_server e outra do integration_server.
+# VERSÃO: 1.0
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import queue
+import logging
+from flask import jsonify, request, session, Response, stream_with_context
+from . import bp
+from ..integration_server.utils import contracts
+from ..integration_server.utils.event_watcher import watcher, format_sse, DISCONNECT
+
+logger = logging.getLogger(__name__)
+
+# --- 2. CONSTANTES ---
+# Intervalo dos comentários de keep-alive enviados às ligações SSE inativas.
+SSE_HEARTBEAT_SECONDS = 15
+
+# --- 3. FUNÇÕES AUXILIARES ---
+
+@bp.errorhandler(contracts.InvalidContract)
+def handle_invalid_contract(e):
+    return jsonify({"success": False, "message": str(e)}), 400
+
+def sse_response(role, contract_id):
+    """
+    Resposta SSE com os novos pedidos, entregas e notas do contrato destinados
+    ao perfil. Todos os clientes do processo partilham o mesmo ciclo de
+    consulta à blockchain (event_watcher).
+    """
+    subscriber = watcher.subscribe(role, contract_id)
+
+    def generate():
+        try:
+            # Indica ao navegador o intervalo de reconexão automática.
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = subscriber.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is DISCONNECT:
+                    return
+                yield format_sse(event)
+        finally:
+            watcher.unsubscribe(role, contract_id, subscriber)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+# --- 4. ROTAS ---
+
+@bp.route('/api-proxy/events')
+def browser_events():
+    """
+    Canal dos dashboards (EventSource), restrito ao perfil e ao contrato da
+    sessão.
+    """
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "Sessão expirada."}), 401
+    return sse_response(session.get('user_role'), contracts.validate_contract_id(session.get('contract_id')))
+
+@bp.route('/api/events/stream', methods=['GET'])
+def api_events():
+    """
+    Canal para clientes da API: perfil em ?role= e contrato no cabeçalho
+    X-Contract-Id (o contrato padrão se ausente).
+    """
+    role = request.args.get('role')
+    if not role:
+        return jsonify({"success": False, "message": "Parâmetro 'role' obrigatório."}), 400
+    return sse_response(role, contracts.validate_contract_id(request.headers.get(contracts.CONTRACT_HEADER)))
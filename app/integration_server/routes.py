@@ -1,7 +1,7 @@
 # ==============================================================================
 # ARQUIVO: app/integration_server/routes.py
 # DESCRIÇÃO: Rotas da API interna, com a lógica de status e avaliação de pedidos.
-# VERSÃO: 32.0 (Correção da lógica da rota de aprovação de entregas)
+# VERSÃO: 49.4 (Inventário por contrato)
 # ==============================================================================
 
 
@@ -10,29 +10,114 @@ import hashlib
 import os
 import json
 import base64
+import functools
+import logging
 import datetime
-from flask import jsonify, request, send_file
+from flask import jsonify, request, send_file, Response, stream_with_context
 from io import BytesIO
 from . import bp
-from .utils import blockchain_utils, ipfs_utils, nomus_api
-from .utils.pdf_generator import generate_order_pdf
+from .utils import blockchain_utils, ipfs_utils, nomus_api, stream_index, projections, exporter, order_details, contracts
+from .utils.inventory_service import inventory_for
+from .utils.delivery_proof import pipeline as proof_pipeline, ProofError, MAX_UPLOAD_BYTES
+from .utils.previews import preview_cache, CID_PATTERN
+from .utils.financial_sync import delinquency_index, financial_sync
+
+logger = logging.getLogger(__name__)
+
+# O canal SSE (/api/events/stream) é servido por app/events_server.
+
+# Paginação da listagem de pedidos.
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Fonte das leituras: as projeções SQLite mantidas por `run.py consume`
+# (READ_MODEL=projections) ou a blockchain, com índices incrementais em memória.
+# Os pedidos e as notas são lidos por contrato: `orders_for(contract_id)`.
+# As escritas e as leituras que precedem uma escrita (find_order_key,
+# find_delivery) vão sempre à blockchain, qualquer que seja o READ_MODEL: as
+# projeções podem estar atrasadas em relação ao consumidor.
+chain_orders_for = stream_index.PartitionedIndex(stream_index.OrdersIndex, 'orders_stream')
+if projections.projections_enabled():
+    reads = projections.ProjectionReader()
+    orders_for = projections.OrdersProjection
+    notes_for = projections.NotesProjection
+else:
+    reads = blockchain_utils
+    orders_for = chain_orders_for
+    # As notas seguem a stream inteira: os cursores são posições globais, como
+    # nas projeções e nos eventos SSE.
+    notes_for = stream_index.NotesIndex().for_contract
 
 # --- 2. FUNÇÕES AUXILIARES ---
+
+def request_contract_id():
+    """
+    Contrato do utilizador, indicado pelo request_server no cabeçalho
+    X-Contract-Id (o contrato padrão se ausente).
+    """
+    return contracts.validate_contract_id(request.headers.get(contracts.CONTRACT_HEADER))
+
+@bp.before_app_request
+def start_financial_sync():
+    """
+    Arranca a sincronização financeira no processo que serve os pedidos (já
+    depois do fork), se ainda não tiver arrancado: `run.py production` fá-lo
+    ao iniciar cada worker; com outro servidor, no primeiro pedido, incluindo
+    as verificações /healthz e /readyz.
+    """
+    financial_sync.ensure_started()
+
+@bp.errorhandler(contracts.InvalidContract)
+def handle_invalid_contract(e):
+    return jsonify({"success": False, "message": str(e)}), 400
+
+def find_order_key(contract_id, order_txid):
+    """
+    Chave da stream do pedido com o txid indicado na partição do contrato, ou
+    None. Lida da blockchain; se o txid ainda não estiver no índice (publicado
+    há menos de um intervalo de refresh), força a leitura dos itens novos.
+    """
+    index = chain_orders_for(contract_id)
+    original_key = index.key_for_txid(order_txid)
+    if original_key is None:
+        index.refresh(force=True)
+        original_key = index.key_for_txid(order_txid)
+    return original_key
+
+def find_delivery(contract_id, delivery_key):
+    """
+    Registo de uma entrega na partição do contrato, ou None se for de outro
+    contrato. Lido da blockchain (a fusão em cache é posta em dia a cada leitura).
+    """
+    for record in blockchain_utils.get_partition_items('deliveries_stream', contract_id):
+        if record.get('key') == delivery_key:
+            return record
+    return None
+
+CATALOG_PATH = os.path.join(os.path.dirname(__file__), 'config', 'product_catalog.json')
+
+@functools.lru_cache(maxsize=1)
+def _inventory_keys_by_variant():
+    """Mapa código da variante -> chave de inventário (a primeira variante do grupo)."""
+    with open(CATALOG_PATH, 'r', encoding='utf-8') as f:
+        product_catalog = json.load(f)
+    return {variant.get("codigo"): group["variants"][0]["codigo"]
+            for group in product_catalog for variant in group.get("variants", [])}
+
 def get_inventory_key(variant_code):
     try:
-        catalog_path = os.path.join(os.path.dirname(__file__), 'config', 'product_catalog.json')
-        with open(catalog_path, 'r', encoding='utf-8') as f:
-            product_catalog = json.load(f)
-        
-        for group in product_catalog:
-            for variant in group.get("variants", []):
-                if variant.get("codigo") == variant_code:
-                    return group["variants"][0]["codigo"]
-        return None
+        return _inventory_keys_by_variant().get(variant_code)
     except Exception as e:
-        print(f"ERRO ao ler o catálogo de produtos: {e}")
+        logger.error("Erro ao ler o catálogo de produtos: %s", e)
         return None
 
+def get_inventory_state(contract_id):
+    """Estado atual do inventário do contrato por product_code (deltas já agregados)."""
+    if projections.projections_enabled():
+        return {record['product_code']: record
+                for record in reads.get_partition_items('inventory_stream', contract_id) if 'product_code' in record}
+    return inventory_for(contract_id).snapshot()
+
 # --- 3. ROTAS DA API ---
 
 @bp.route('/person-details', methods=['POST'])
@@ -52,39 +137,42 @@ def get_person_details():
 
 @bp.route('/contract/status', methods=['GET'])
 def get_contract_status():
-    contract_metadata = blockchain_utils.get_last_item_from_stream_key('config_stream', 'contract_v1')
-    inventory_dict = blockchain_utils.get_latest_stream_state('inventory_stream')
+    contract_id = request_contract_id()
+    contract_metadata = reads.get_key_state('config_stream', contract_id)
+    inventory_dict = get_inventory_state(contract_id)
     try:
         catalog_path = os.path.join(os.path.dirname(__file__), 'config', 'product_catalog.json')
         with open(catalog_path, 'r', encoding='utf-8') as f:
             product_catalog = json.load(f)
     except Exception as e:
         return jsonify({"error": f"Falha ao carregar catálogo de produtos: {e}"}), 500
-    return jsonify({"contract_info": contract_metadata, "financial_status": {"is_delinquent": False}, "inventory": inventory_dict, "product_catalog": product_catalog})
+    financial_status = delinquency_index.status(contract_id)
+    return jsonify({"contract_info": contract_metadata, "financial_status": financial_status, "inventory": inventory_dict, "product_catalog": product_catalog})
+
+@bp.route('/contract/analytics', methods=['GET'])
+def get_contract_analytics():
+    # Importação local: o NumPy só é carregado quando os indicadores são pedidos.
+    try:
+        from .utils.contract_analytics import get_contract_analytics as get_analytics
+        return jsonify(get_analytics(CATALOG_PATH, request_contract_id()).summary())
+    except Exception as e:
+        logger.exception("Falha ao calcular os indicadores do contrato: %s", e)
+        return jsonify({"error": f"Falha ao calcular os indicadores do contrato: {e}"}), 500
 
 @bp.route('/contract/view', methods=['GET'])
 def view_contract():
+    contract_id = request_contract_id()
     try:
-        contract_metadata = blockchain_utils.get_last_item_from_stream_key('config_stream', 'contract_v1')
+        contract_metadata = reads.get_key_state('config_stream', contract_id)
         if not contract_metadata or not contract_metadata.get("ipfs_hash_encrypted"):
             return jsonify({"error": "Hash do IPFS não encontrado."}), 404
         ipfs_hash = contract_metadata.get("ipfs_hash_encrypted")
         encrypted_data = ipfs_utils.get_from_ipfs(ipfs_hash)
-
-    #teste de criptografia
-        print(f"DEBUG: Bytes do IPFS: {len(encrypted_data)}")
-#fim
         if not encrypted_data: return jsonify({"error": "Não foi possível obter o ficheiro do IPFS."}), 500
         decryption_key = os.getenv('CONTRACT_DECRYPTION_KEY')
 
         if not decryption_key: return jsonify({"error": "Chave de descriptografia não configurada."}), 500
         decrypted_pdf_data = ipfs_utils.decrypt_data(encrypted_data, decryption_key.encode('utf-8'))
-#teste
-        if decrypted_pdf_data:
-            print(f"DEBUG: PDF decriptado com sucesso, {len(decrypted_pdf_data)} bytes")
-        else:
-            print("ERRO: Falha na descriptografia")
-#fim
         if not decrypted_pdf_data: return jsonify({"error": "Falha ao descriptografar o contrato."}), 500
         return send_file(BytesIO(decrypted_pdf_data), mimetype='application/pdf', as_attachment=False)
     except Exception as e:
@@ -92,31 +180,37 @@ def view_contract():
 
 @bp.route('/order/submit', methods=['POST'])
 def submit_order():
-    print("RAW DATA:", request.data)  # bytes crus
-    print("HEADERS:", request.headers)
     data = request.get_json()
-    print(f"DEBUG: Dados recebidos na rota /order/submit: {data}")
+    logger.debug("Pedido recebido em /order/submit com %d bytes.", request.content_length or 0)
     
     if not data: return jsonify({"success": False, "message": "Dados do pedido não recebidos."}), 400
     order_items, signature_image_b64, client_info = data.get('order_items'), data.get('signature_image'), data.get('client_info')
     if not all([order_items, signature_image_b64, client_info]):
         return jsonify({"success": False, "message": "Dados do pedido incompletos."}), 400
+    contract_id = request_contract_id()
+    inventory = inventory_for(contract_id)
+    reserved = []  # (chave de inventário, quantidade) das reservas publicadas
     try:
+        # Agrega as quantidades por chave de inventário e publica um delta por
+        # produto no inventário do contrato; o serviço aplica a reserva sob o
+        # lock do produto.
+        quantities = {}
         for group in order_items:
             for item in group.get('items', []):
                 inventory_key = get_inventory_key(item.get('codigo'))
                 if not inventory_key: continue
-                current_inventory = blockchain_utils.get_last_item_from_stream_key('inventory_stream', inventory_key)
-                if not current_inventory: continue
-                new_consumed_stock = int(current_inventory.get('consumed_stock', 0)) + int(item.get('quantity', 0))
-                updated_inventory_data = { **current_inventory, "consumed_stock": new_consumed_stock }
-                blockchain_utils.publish_to_blockchain('inventory_stream', inventory_key, updated_inventory_data)
+                quantities[inventory_key] = quantities.get(inventory_key, 0) + int(item.get('quantity', 0))
+        for inventory_key, quantity in quantities.items():
+            if inventory.get(inventory_key) is None: continue
+            if inventory.reserve(inventory_key, quantity):
+                reserved.append((inventory_key, quantity))
         
+        # fpdf (e o Pillow que ele importa) só é carregado ao gerar o primeiro PDF.
+        from .utils.pdf_generator import generate_order_pdf
         signature_image_bytes = base64.b64decode(signature_image_b64.split(',')[1])
         pdf_bytes = generate_order_pdf(client_info, order_items, signature_image_bytes)
         decryption_key = os.getenv('CONTRACT_DECRYPTION_KEY').encode('utf-8')
-        encrypted_pdf_bytes = ipfs_utils.encrypt_data(pdf_bytes, decryption_key)
-        ipfs_hash = ipfs_utils.add_to_ipfs(encrypted_pdf_bytes)
+        ipfs_hash = ipfs_utils.encrypt_and_add(pdf_bytes, decryption_key)
         if not ipfs_hash: raise ConnectionError("Falha ao enviar o PDF do pedido para o IPFS.")
         
         order_timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
@@ -129,49 +223,86 @@ def submit_order():
             "ip_origem": client_info.get('ip'), 
             "produtos_solicitados": simplified_items, 
             "hash_pedido_ipfs": ipfs_hash, 
-            "status": "Aguardando avaliação"
+            "status": "Aguardando avaliação",
+            "contract_id": contract_id
         }
         
-        # Publica o pedido uma única vez, usando uma chave consistente
+        # Nos pedidos grandes, os produtos seguem para o IPFS e o registo na
+        # blockchain fica com um resumo, o CID e o hash dos detalhes.
+        order_json_data = order_details.offload(order_json_data, decryption_key)
+
+        # Publica o pedido uma única vez, usando uma chave consistente, também
+        # na partição do contrato.
         order_key = f"order_{client_info.get('id', 'unknown')}_{order_timestamp}"
-        txid = blockchain_utils.publish_to_blockchain('orders_stream', order_key, order_json_data)
+        order_keys = contracts.item_keys(order_key, contract_id)
+        txid = blockchain_utils.publish_to_blockchain('orders_stream', order_keys, order_json_data)
         if not txid: raise ConnectionError("Falha ao publicar o pedido na blockchain.")
 
-        # Adiciona o txid à carga de dados para facilitar a busca no frontend
-        # e publica novamente com a mesma chave original.
-        order_json_data["order_txid"] = txid
-        blockchain_utils.publish_to_blockchain('orders_stream', order_key, order_json_data)
+        # Regista o txid com a mesma chave, para facilitar a busca no frontend.
+        # Basta o delta: as leituras fundem todos os itens da chave.
+        blockchain_utils.publish_to_blockchain('orders_stream', order_keys, {"order_txid": txid})
         
         return send_file(BytesIO(pdf_bytes), mimetype='application/pdf', as_attachment=True, download_name=f"pedido.pdf")
     except Exception as e:
+        # O pedido não foi publicado: devolve ao stock o que já foi reservado.
+        for inventory_key, quantity in reserved:
+            inventory.release(inventory_key, quantity, reason="pedido não publicado")
         return jsonify({"success": False, "message": str(e)}), 500
 
 @bp.route('/orders/list', methods=['GET'])
 def list_orders():
-    print("\n--- DEBUG [LIST ORDERS]: INICIANDO A BUSCA DE PEDIDOS ---")
-    
-    # ALTERAÇÃO: get_all_items_from_stream agora retorna a lista de pedidos
-    # com a chave já inserida no objeto. Não precisamos mais iterar e
-    # agrupar, pois a função já retorna o estado mais recente de cada um.
-    orders = blockchain_utils.get_all_items_from_stream('orders_stream')
-    
-    print(f"--- DEBUG [LIST ORDERS]: Recebido da blockchain: {len(orders)} itens decodificados e agrupados por chave.")
+    """
+    Lista os pedidos do contrato do utilizador, do mais recente para o mais
+    antigo, a partir do índice incremental da partição do contrato.
+
+    Sem parâmetros, retorna a lista completa (formato original). Com qualquer
+    um dos parâmetros abaixo, retorna uma página {"items", "next_cursor"}:
+        limit: Tamanho da página (1 a MAX_PAGE_SIZE, padrão DEFAULT_PAGE_SIZE).
+        cursor: O 'next_cursor' devolvido pela página anterior.
+        status, cnpj: Filtros exatos.
+        date_from, date_to: Intervalo (ISO 8601) sobre data_hora_utc.
+    """
+    filters = {name: request.args.get(name) for name in ('status', 'cnpj', 'date_from', 'date_to')}
+    cursor = request.args.get('cursor')
+    orders_index = orders_for(request_contract_id())
 
-    # Removemos a lógica de `latest_orders` e processamos a lista diretamente.
-    valid_orders = [order for order in orders if isinstance(order, dict)]
-    
-    # Ordena a lista de pedidos por data, do mais recente para o mais antigo.
-    sorted_orders = sorted(valid_orders, key=lambda x: x.get('data_hora_utc', ''), reverse=True)
-    
-    print("\n--- DEBUG [LIST ORDERS]: DADOS FINAIS PARA O FRONTEND ---")
-    if not sorted_orders:
-        print("  - Nenhum pedido encontrado.")
-    for order in sorted_orders:
-        # ALTERAÇÃO: O objeto 'order' já contém todos os dados e a chave.
-        print(f"  - Pedido TXID: {order.get('order_txid')}, Status: '{order.get('status')}', Chave da Stream: '{order.get('key')}'")
-    print("------------------------------------------------------------------\n")
+    if 'limit' not in request.args and not cursor and not any(filters.values()):
+        return jsonify(orders_index.all_sorted())
+
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"success": False, "message": "Parâmetro 'limit' inválido."}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({"success": False, "message": f"'limit' deve estar entre 1 e {MAX_PAGE_SIZE}."}), 400
+
+    try:
+        items, next_cursor = orders_index.page(limit, cursor=cursor, **filters)
+    except stream_index.InvalidCursor as e:
+        return jsonify({"success": False, "message": str(e)}), 400
 
-    return jsonify(sorted_orders)
+    logger.debug("Página de pedidos com %d itens (filtros: %s).", len(items), filters)
+    return jsonify({"items": items, "next_cursor": next_cursor})
+
+@bp.route('/orders/details/<order_txid>', methods=['GET'])
+def get_order_details(order_txid):
+    """
+    Registo completo de um pedido, incluindo os produtos guardados fora da
+    blockchain (ver utils/order_details.py).
+    """
+    orders_index = orders_for(request_contract_id())
+    key = orders_index.key_for_txid(order_txid)
+    record = orders_index.get(key) if key else None
+    if not record:
+        return jsonify({"success": False, "message": "Pedido não encontrado."}), 404
+    decryption_key = os.getenv('CONTRACT_DECRYPTION_KEY')
+    if not decryption_key:
+        return jsonify({"success": False, "message": "Chave de descriptografia não configurada."}), 500
+    try:
+        return jsonify(order_details.expand(record, decryption_key.encode('utf-8')))
+    except order_details.OrderDetailsError as e:
+        logger.error("%s", e)
+        return jsonify({"success": False, "message": str(e)}), 502
 
 @bp.route('/order/review', methods=['POST'])
 def review_order():
@@ -180,48 +311,31 @@ def review_order():
     if not all([order_txid, decision, reviewer_name]) or decision not in ["approved", "rejected"]:
         return jsonify({"success": False, "message": "Dados inválidos."}), 400
 
-    print("\n--- DEBUG [REVIEW ORDER]: INICIANDO BUSCA POR CHAVE ORIGINAL ---")
-    print(f"--- DEBUG [REVIEW ORDER]: order_txid recebido do frontend: '{order_txid}'")
-
-    all_items_raw = blockchain_utils.get_all_items_from_stream('orders_stream')
-
-    original_key = None
-    for item in all_items_raw:
-        # CORREÇÃO: Comparar o order_txid recebido com o 'order_txid' dentro do item,
-        # e usar a 'key' do item para a atualização.
-        if isinstance(item, dict) and item.get('order_txid') == order_txid:
-            original_key = item.get('key')
-            print(f"--- DEBUG [REVIEW ORDER]: Chave original encontrada: '{original_key}'")
-            break
-# ALTERANDO PARA TESTAR
-    # original_key = None
-    # for item in all_items_raw:
-    #     # A nova estrutura de `item` já é o objeto de dados decodificado, com a `key` adicionada.
-    #     # Procuramos o item cujo `order_txid` corresponda ao que foi enviado do frontend.
-    #     if isinstance(item, dict) and item.get('order_txid') == order_txid:
-    #         original_key = item.get('key')
-    #         print(f"--- DEBUG [REVIEW ORDER]: Chave original encontrada: '{original_key}'")
-    #         break
-    
+    logger.debug("A procurar a chave original do pedido com txid '%s'.", order_txid)
+
+    # O índice do contrato mantém o mapa order_txid -> chave original da stream.
+    contract_id = request_contract_id()
+    original_key = find_order_key(contract_id, order_txid)
+
     if not original_key:
-        print(f"--- DEBUG [REVIEW ORDER]: ERRO: Chave original do pedido com txid '{order_txid}' não encontrada. ---")
+        logger.warning("Chave original do pedido com txid '%s' não encontrada.", order_txid)
         return jsonify({"success": False, "message": "Registo original do pedido não encontrado."}), 404
 
     status_update_data = {"status": "Aprovado" if decision == "approved" else "Recusado", "reviewed_by": reviewer_name, "reviewed_at_utc": datetime.datetime.now(datetime.timezone.utc).isoformat()}
     if decision == "rejected" and rejection_reason:
         status_update_data['rejection_reason'] = rejection_reason
     
-    print(f"--- DEBUG [REVIEW ORDER]: Publicando atualização para a chave: '{original_key}'")
-    update_txid = blockchain_utils.publish_to_blockchain('orders_stream', original_key, status_update_data)
+    logger.debug("A publicar atualização para a chave '%s'.", original_key)
+    update_txid = blockchain_utils.publish_to_blockchain('orders_stream', contracts.item_keys(original_key, contract_id), status_update_data)
     if not update_txid:
-        print("--- DEBUG [REVIEW ORDER]: Falha ao publicar atualização. ---")
+        logger.error("Falha ao publicar a avaliação do pedido '%s'.", original_key)
         return jsonify({"success": False, "message": "Falha ao registar a decisão na blockchain."}), 500
 
     status_text = "aprovado" if decision == "approved" else "recusado"
     notification_text = f"O seu pedido (ID: ...{order_txid[-8:]}) foi {status_text}."
-    notification_data = {"Tipo da notificação": f"Pedido {status_text.capitalize()}", "Texto": notification_text, "target_role": "cliente"}
-    blockchain_utils.publish_to_blockchain('notes_stream', f"note_review_{order_txid}", notification_data)
-    print(f"--- DEBUG [REVIEW ORDER]: Publicação de notificação e retorno de sucesso. ---")
+    notification_data = {"Tipo da notificação": f"Pedido {status_text.capitalize()}", "Texto": notification_text, "target_role": "cliente", "contract_id": contract_id}
+    blockchain_utils.publish_to_blockchain('notes_stream', contracts.item_keys(f"note_review_{order_txid}", contract_id), notification_data)
+    logger.info("Pedido '%s' %s por %s.", original_key, status_text, reviewer_name)
     return jsonify({"success": True, "message": f"Pedido {status_text} com sucesso."})
 
 @bp.route('/orders/view/<ipfs_hash>', methods=['GET'])
@@ -237,17 +351,35 @@ def view_order_pdf(ipfs_hash):
     except Exception as e:
         return jsonify({"error": f"Erro interno: {e}"}), 500
 
+@bp.route('/export/<dataset>', methods=['GET'])
+def export_dataset(dataset):
+    """
+    Exporta o histórico de 'orders', 'deliveries' ou 'installments' do
+    contrato do utilizador (?format=csv|jsonl|parquet). A resposta é enviada
+    em streaming.
+    """
+    fmt = request.args.get('format', 'csv').lower()
+    contract_id = request_contract_id()
+    try:
+        chunks = exporter.export(dataset, fmt, contract_id)
+    except exporter.ExportError as e:
+        return jsonify({"error": str(e)}), 400
+    mimetype, extension = exporter.FORMATS[fmt]
+    headers = {"Content-Disposition": f'attachment; filename="{dataset}.{extension}"'}
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
 @bp.route('/deliveries/list', methods=['GET'])
 def list_deliveries():
+    contract_id = request_contract_id()
     try:
-        nomus_ok, nomus_data = nomus_api.get_nomus_deliveries(sales_order_id=3523)
+        nomus_ok, nomus_data = nomus_api.get_nomus_deliveries(sales_order_id=contracts.sales_order_id(contract_id))
         nomus_deliveries_processed = []
         if nomus_ok:
             for entrega in nomus_data:
                 total_pecas = sum(int(item.get('qtde', 0)) for item in entrega.get('itensDocumentoEstoque', []))
                 nomus_deliveries_processed.append({'dataEmissao': entrega.get('dataEmissao', 'N/A'), 'id': entrega.get('id', 'N/A'), 'totalPecas': total_pecas})
         
-        blockchain_deliveries_list = blockchain_utils.get_all_items_from_stream('deliveries_stream')
+        blockchain_deliveries_list = reads.get_partition_items('deliveries_stream', contract_id)
         blockchain_map = {}
         for item in blockchain_deliveries_list:
             if isinstance(item, dict) and 'delivery_id' in item:
@@ -279,17 +411,84 @@ def view_delivery_pdf(ipfs_hash):
         if not decryption_key_str: return jsonify({"error": "Chave de desencriptação de entregas não configurada."}), 500
         decrypted_pdf_data = ipfs_utils.decrypt_data(encrypted_data, decryption_key_str.encode('utf-8'))
         if not decrypted_pdf_data: return jsonify({"error": "Falha ao descriptografar o PDF."}), 500
-        return send_file(BytesIO(decrypted_pdf_data), mimetype='application/pdf', as_attachment=False)
+        # As provas enviadas como fotografia são guardadas em JPEG.
+        mimetype = 'application/pdf' if decrypted_pdf_data.startswith(b'%PDF') else 'image/jpeg'
+        return send_file(BytesIO(decrypted_pdf_data), mimetype=mimetype, as_attachment=False)
     except Exception as e:
         return jsonify({"error": f"Erro interno: {e}"}), 500
     
+# Tipo de documento -> (stream, campo do registo com o CID do documento).
+PREVIEW_SOURCES = {
+    'delivery': ('deliveries_stream', 'ipfs_hash_encrypted'),
+    'order': ('orders_stream', 'hash_pedido_ipfs'),
+}
+
+def cid_in_contract(contract_id, cid, document_type):
+    """Indica se o CID é o documento de um registo da partição do contrato."""
+    stream_name, field = PREVIEW_SOURCES[document_type]
+    return any(record.get(field) == cid for record in reads.get_partition_items(stream_name, contract_id))
+
+def _preview_response(cid, document_type):
+    """
+    Serve a miniatura em cache ou agenda a sua geração (202). Só para os
+    documentos do contrato do utilizador: um CID de outro contrato responde
+    404, sem consultar a cache nem o IPFS.
+    """
+    if not CID_PATTERN.match(cid):
+        return jsonify({"error": "CID inválido."}), 400
+    if not cid_in_contract(request_contract_id(), cid, document_type):
+        return jsonify({"error": "Documento não encontrado."}), 404
+    cached = preview_cache.lookup(cid)
+    if cached is None:
+        preview_cache.warm(cid, document_type)
+        response = jsonify({"status": "pending"})
+        response.headers['Retry-After'] = '2'
+        return response, 202
+    path, mimetype = cached
+    if mimetype is None:
+        return jsonify({"error": "Pré-visualização indisponível para este documento."}), 404
+    # O conteúdo de um CID é imutável: a miniatura pode ficar em cache no navegador.
+    response = send_file(path, mimetype=mimetype, max_age=7 * 24 * 3600)
+    response.headers['Cache-Control'] = 'private, max-age=604800, immutable'
+    return response
+
+@bp.route('/deliveries/preview/<cid>', methods=['GET'])
+def preview_delivery(cid):
+    return _preview_response(cid, 'delivery')
+
+@bp.route('/orders/preview/<cid>', methods=['GET'])
+def preview_order(cid):
+    return _preview_response(cid, 'order')
+
 @bp.route('/notifications/list', methods=['GET'])
 def list_notifications():
+    """
+    Feed de notificações da notes_stream.
+
+    Sem parâmetros, retorna a lista completa (formato original). Com qualquer
+    um dos parâmetros abaixo, retorna {"items", "cursor"}:
+        role: Apenas as notas com este 'target_role'.
+        since: O 'cursor' de uma resposta anterior; retorna apenas notas novas.
+        limit: O número máximo de notas (padrão DEFAULT_PAGE_SIZE).
+    """
     try:
-        all_notes = blockchain_utils.get_all_items_from_stream('notes_stream')
-        valid_notes = [note.get('data') for note in all_notes if isinstance(note.get('data'), dict)]
-        return jsonify(valid_notes)
+        notes_index = notes_for(request_contract_id())
+        if not any(name in request.args for name in ('role', 'since', 'limit')):
+            notes, _ = notes_index.feed()
+            return jsonify(notes)
+
+        try:
+            since = int(request.args['since']) if 'since' in request.args else None
+            limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return jsonify({"success": False, "message": "Parâmetros 'since' e 'limit' devem ser inteiros."}), 400
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            return jsonify({"success": False, "message": f"'limit' deve estar entre 1 e {MAX_PAGE_SIZE}."}), 400
+
+        notes, cursor = notes_index.feed(role=request.args.get('role'), since=since, limit=limit)
+        return jsonify({"items": notes, "cursor": cursor})
     except Exception as e:
+        logger.exception("Erro ao obter notificações: %s", e)
         return jsonify({"success": False, "message": "Erro ao obter notificações."}), 500
     
     # ==============================================================================
@@ -298,17 +497,16 @@ def list_notifications():
 @bp.route('/notifications/consolidated', methods=['GET'])
 def get_consolidated_notes():
     """
-    Rota que consolida todos os alertas do sistema (pedidos, entregas, financeiro)
+    Rota que consolida todos os alertas do contrato (pedidos, entregas, financeiro)
     em uma unica lista para a pagina de alertas do financeiro.
     """
-    print("\n--- DEBUG [ALERTS]: Iniciando consolidacao de alertas ---")
+    contract_id = request_contract_id()
     consolidated_alerts = []
     
     # 1. Obter alertas da notes_stream (aprovacoes/recusas de pedidos)
     try:
-        notes = blockchain_utils.get_all_items_from_stream('notes_stream')
-        for note in notes:
-            note_data = note.get('data', {})
+        notes, _ = notes_for(contract_id).feed()
+        for note_data in notes:
             if note_data.get('Tipo da notificacao') in ["Pedido Aprovado", "Pedido Recusado"]:
                 alert = {
                     "tipo": note_data.get('Tipo da notificacao'),
@@ -316,7 +514,7 @@ def get_consolidated_notes():
                     "informacoes": note_data.get('Texto')
                 }
                 consolidated_alerts.append(alert)
-        print(f"--- DEBUG [ALERTS]: {len(notes)} alertas da notes_stream processados.")
+        logger.debug("%d alertas da notes_stream processados.", len(notes))
     except Exception as e:
         return jsonify({"success": False, "message": f"Erro ao buscar notificacoes da stream: {e}"}), 500
 
@@ -338,39 +536,24 @@ def get_consolidated_notes():
                     "informacoes": f"O romaneio {delivery.get('id')} foi encontrado na Nomus e aguarda confirmacao."
                 }
                 consolidated_alerts.append(alert)
-        print(f"--- DEBUG [ALERTS]: {len(deliveries_list)} romaneios processados.")
+        logger.debug("%d romaneios processados.", len(deliveries_list))
     except Exception as e:
         return jsonify({"success": False, "message": f"Erro ao buscar entregas da Nomus: {e}"}), 500
     
     # 3. Obter status financeiro (inadimplencia)
-    print(f"--- DEBUG [ALERTS]: Verificando status financeiro...")
+    # O indice e mantido pela sincronizacao agendada com a Nomus; a pagina de
+    # alertas nao consulta a Nomus.
     try:
-        financial_installments_stream = blockchain_utils.get_all_items_from_stream('financial_stream')
-        
-        for inst in financial_installments_stream:
-            if isinstance(inst, dict) and not inst.get('paid'):
-                success, nomus_data = nomus_api.get_nomus_contas_receber(inst.get('id_nomus'))
-                
-                if success and nomus_data:
-                    if nomus_data.get('status'):
-                        update_data = {"paid": True}
-                        blockchain_utils.publish_to_blockchain('financial_stream', inst.get('key'), update_data)
-                        print(f"--- DEBUG [ALERTS]: Parcela {inst.get('id_nomus')} atualizada na blockchain (paga).")
-                    else:
-                        due_date_str = inst.get('due_date')
-                        if due_date_str:
-                            due_date = datetime.datetime.strptime(nomus_data.get('dataVencimento'), "%d/%m/%Y").date()
-                            if due_date < datetime.date.today():
-                                alert = {
-                                    "tipo": "Parcela inadimplente",
-                                    "data_hora": due_date.isoformat(),
-                                    "informacoes": f"A parcela {inst.get('id_nomus')} esta em atraso desde {nomus_data.get('dataVencimento')}."
-                                }
-                                consolidated_alerts.append(alert)
-                else:
-                    print(f"--- DEBUG [ALERTS]: Falha ao consultar a API Nomus para a parcela {inst.get('id_nomus')}.")
-
-        print(f"--- DEBUG [ALERTS]: {len(financial_installments_stream)} parcelas financeiras processadas.")
+        overdue_installments = delinquency_index.overdue(contract_id)
+        for inst in overdue_installments:
+            due_date = datetime.date.fromisoformat(inst['due_date'])
+            alert = {
+                "tipo": "Parcela inadimplente",
+                "data_hora": due_date.isoformat(),
+                "informacoes": f"A parcela {inst.get('id_nomus')} esta em atraso desde {due_date.strftime('%d/%m/%Y')}."
+            }
+            consolidated_alerts.append(alert)
+        logger.debug("%d parcelas inadimplentes processadas.", len(overdue_installments))
     except Exception as e:
         return jsonify({"success": False, "message": f"Erro ao buscar dados financeiros da stream: {e}"}), 500
 
@@ -380,7 +563,7 @@ def get_consolidated_notes():
         reverse=True
     )
 
-    print(f"--- DEBUG [ALERTS]: Consolidacao finalizada com {len(sorted_alerts)} alertas.")
+    logger.debug("Consolidacao finalizada com %d alertas.", len(sorted_alerts))
     return jsonify(sorted_alerts)
 # ==============================================================================
 # --- ROTAS DE GESTAO DE ENTREGAS ---
@@ -394,25 +577,17 @@ def list_pending_deliveries():
     Busca todas as entregas que foram confirmadas pelo entregador (tem registo na
     blockchain), mas que ainda nao foram aprovadas pelo financeiro.
     """
-    print("\n--- DEBUG [DELIVERIES]: Rota /api/deliveries/pending-approval acionada ---")
+    contract_id = request_contract_id()
     try:
         # 1. Buscar todos os romaneios da Nomus
-        nomus_ok, nomus_data = nomus_api.get_nomus_deliveries(sales_order_id=3523)
+        nomus_ok, nomus_data = nomus_api.get_nomus_deliveries(sales_order_id=contracts.sales_order_id(contract_id))
         if not nomus_ok:
             raise Exception("Falha ao buscar entregas na Nomus.")
-        
-        print(f"--- DEBUG [DELIVERIES]: Recebido da Nomus: {len(nomus_data)} itens.")
-        
+        logger.debug("Recebidos da Nomus %d romaneios.", len(nomus_data))
+
         # 2. Buscar o estado mais recente de todos os romaneios da blockchain
-        blockchain_deliveries_list = blockchain_utils.get_all_items_from_stream('deliveries_stream')
+        blockchain_deliveries_list = reads.get_partition_items('deliveries_stream', contract_id)
         blockchain_map = {item.get('delivery_id'): item for item in blockchain_deliveries_list if isinstance(item, dict)}
-        
-     
-        if nomus_data:
-            print(f"--- DEBUG [DELIVERIES]: Tipo de ID da Nomus: {type(nomus_data[0]['id']) if 'id' in nomus_data[0] else 'N/A'}")
-        if blockchain_map:
-            print(f"--- DEBUG [DELIVERIES]: Tipo de ID da Blockchain: {type(list(blockchain_map.keys())[0]) if blockchain_map else 'N/A'}")
-       
 
         pending_deliveries = []
         # 3. Iterar sobre os dados da Nomus e unificar/filtrar
@@ -420,39 +595,35 @@ def list_pending_deliveries():
             delivery_id = nomus_delivery.get('id')
             # CORRECAO: Converter o ID do romaneio da Nomus para string antes de usar como chave.
             blockchain_record = blockchain_map.get(str(delivery_id))
-            
-            print(f"--- DEBUG [DELIVERIES]: Processando romaneio Nomus {delivery_id}. Registro na blockchain? {'Sim' if blockchain_record else 'Nao'}")
-            
+
             if blockchain_record:
                 status_blockchain = blockchain_record.get('status')
-                print(f"--- DEBUG [DELIVERIES]: Status do romaneio {delivery_id} na blockchain: '{status_blockchain}'")
-                
+
                 if status_blockchain == 'Confirmado':
                     # Romaneio ja confirmado, deve ser ignorado na lista de pendentes
                     continue
                 elif status_blockchain == 'Aguardando aprovacao':
                     # Romaneio que ja tem prova de entrega, mas nao foi aprovado
                     nomus_delivery.update(blockchain_record)
+                    proof_cid = blockchain_record.get('ipfs_hash_encrypted')
+                    if proof_cid:
+                        # A miniatura começa a ser gerada antes de a lista ser mostrada.
+                        preview_cache.warm(proof_cid, 'delivery')
+                        nomus_delivery['preview_url'] = f"/api-proxy/deliveries/preview/{proof_cid}"
                     pending_deliveries.append(nomus_delivery)
             else:
                 # Romaneio que so existe na Nomus, sem prova de entrega
-                print(f"--- DEBUG [DELIVERIES]: Romaneio {delivery_id} na Nomus nao encontrado na blockchain. Status: 'Aguardando envio'")
                 nomus_delivery['status'] = 'Aguardando envio'
                 nomus_delivery['key'] = str(delivery_id) 
                 pending_deliveries.append(nomus_delivery)
 
-        # DEBUG: Adicionando a logica de validacao solicitada
-        if len(blockchain_deliveries_list) > 0 and len(pending_deliveries) == len(nomus_data):
-            print("--- ERRO CRITICO: A logica de filtragem falhou. O numero de pendentes nao deve ser igual ao numero total da Nomus se a stream nao estiver vazia. ---")
-
-        # DEBUG: Adicionando print para mostrar a lista final
-        print(f"--- DEBUG [DELIVERIES]: {len(pending_deliveries)} entregas pendentes de aprovacao encontradas. Lista final: {pending_deliveries}")
+        logger.debug("%d entregas pendentes de aprovacao encontradas.", len(pending_deliveries))
 
         # 4. Retornar a lista filtrada para o frontend
         return jsonify(pending_deliveries), 200
         
     except Exception as e:
-        print(f"--- DEBUG [DELIVERIES]: ERRO ao listar entregas pendentes: {e}")
+        logger.exception("Erro ao listar entregas pendentes: %s", e)
         return jsonify({"success": False, "message": "Erro ao obter a lista de entregas pendentes."}), 500
 
 @bp.route('/delivery/approve', methods=['POST'])
@@ -461,34 +632,35 @@ def approve_delivery():
     Recebe a decisao do financeiro sobre uma entrega e atualiza o seu status
     na blockchain para 'Confirmado'.
     """
-    print("\n--- DEBUG [DELIVERIES]: Rota /api/delivery/approve acionada ---")
     data = request.get_json()
     delivery_key = data.get('delivery_key') 
     reviewer_name = data.get('reviewer_name')
 
     if not all([delivery_key, reviewer_name]):
-        print(f"--- DEBUG [DELIVERIES]: ERRO - Dados incompletos: {data}")
+        logger.warning("Dados incompletos para aprovacao de entrega: %s", data)
         return jsonify({"success": False, "message": "Dados incompletos para aprovacao."}), 400
 
+    contract_id = request_contract_id()
+    if find_delivery(contract_id, delivery_key) is None:
+        logger.warning("Entrega '%s' não encontrada no contrato '%s'.", delivery_key, contract_id)
+        return jsonify({"success": False, "message": "Entrega não encontrada."}), 404
     try:
         update_data = {
             "status": "Confirmado",
             "approved_by": reviewer_name,
             "approved_at_utc": datetime.datetime.now(datetime.timezone.utc).isoformat()
         }
-        
-        print(f"--- DEBUG [DELIVERIES]: A publicar atualizacao para a chave '{delivery_key}' com os dados: {update_data}")
-        txid = blockchain_utils.publish_to_blockchain('deliveries_stream', delivery_key, update_data)
+
+        txid = blockchain_utils.publish_to_blockchain('deliveries_stream', contracts.item_keys(delivery_key, contract_id), update_data)
 
         if not txid:
-            print(f"--- DEBUG [DELIVERIES]: ERRO - Falha ao publicar na blockchain.")
             raise Exception("Falha ao registar a aprovacao na blockchain.")
 
-        print(f"--- DEBUG [DELIVERIES]: Entrega aprovada com sucesso. TXID da atualizacao: {txid}")
+        logger.info("Entrega '%s' aprovada por %s (txid %s).", delivery_key, reviewer_name, txid)
         return jsonify({"success": True, "message": "Entrega confirmada com sucesso!"}), 200
 
     except Exception as e:
-        print(f"--- DEBUG [DELIVERIES]: ERRO no processo de aprovacao: {e}")
+        logger.error("Erro no processo de aprovacao da entrega '%s': %s", delivery_key, e)
         return jsonify({"success": False, "message": str(e)}), 500
     
 
@@ -502,15 +674,15 @@ def list_deliveries_entregador():
     Busca romaneios que aguardam envio (existem na Nomus mas nao na blockchain)
     e os retorna para o entregador.
     """
-    print("\n--- DEBUG [DELIVERIES]: Rota /api/deliveries/entregador acionada ---")
+    contract_id = request_contract_id()
     try:
         # 1. Buscar todos os romaneios da Nomus
-        nomus_ok, nomus_data = nomus_api.get_nomus_deliveries(sales_order_id=3523)
+        nomus_ok, nomus_data = nomus_api.get_nomus_deliveries(sales_order_id=contracts.sales_order_id(contract_id))
         if not nomus_ok:
             raise Exception("Falha ao buscar entregas na Nomus.")
         
         # 2. Buscar o estado mais recente de todos os romaneios da blockchain
-        blockchain_deliveries_list = blockchain_utils.get_all_items_from_stream('deliveries_stream')
+        blockchain_deliveries_list = reads.get_partition_items('deliveries_stream', contract_id)
         blockchain_map = {item.get('key'): item for item in blockchain_deliveries_list if isinstance(item, dict)}
 
         pending_deliveries = []
@@ -524,61 +696,64 @@ def list_deliveries_entregador():
                 nomus_delivery['status'] = 'Aguardando envio'
                 nomus_delivery['key'] = str(delivery_id)
                 pending_deliveries.append(nomus_delivery)
-        
-        print(f"--- DEBUG [DELIVERIES]: {len(pending_deliveries)} entregas para o entregador encontradas.")
+
+        logger.debug("%d entregas para o entregador encontradas.", len(pending_deliveries))
         return jsonify(pending_deliveries), 200
 
     except Exception as e:
-        print(f"--- DEBUG [DELIVERIES]: ERRO ao listar entregas para o entregador: {e}")
+        logger.exception("Erro ao listar entregas para o entregador: %s", e)
         return jsonify({"success": False, "message": "Erro ao obter a lista de entregas para o entregador."}), 500
 
 @bp.route('/delivery/submit', methods=['POST'])
 def submit_delivery_proof():
     """
-    Recebe a prova de entrega (PDF ou imagem com assinatura) e a submete a blockchain.
+    Recebe a prova de entrega (PDF ou imagem, com assinatura opcional) e agenda
+    o seu processamento: compressão das imagens, encriptação, envio para o IPFS
+    e registo na blockchain. Responde 202 assim que o ficheiro está guardado;
+    o estado pode ser consultado em /delivery/status/<delivery_key>.
     """
-    print("\n--- DEBUG [DELIVERIES]: Rota /api/delivery/submit acionada ---")
+    # Recusa corpos demasiado grandes antes de o multipart ser lido.
+    if request.content_length and request.content_length > MAX_UPLOAD_BYTES + 1024 * 1024:
+        return jsonify({"success": False, "message": "O ficheiro enviado é demasiado grande."}), 413
+
     delivery_key = request.form.get('delivery_key')
     proof_file = request.files.get('proof_file')
     signature_image_b64 = request.form.get('signature_image')
     
-    if not all([delivery_key, proof_file]):
+    if not all([delivery_key, proof_file]) or delivery_key.lower() == "null":
         return jsonify({"success": False, "message": "Dados incompletos para a submissao da prova de entrega."}), 400
 
-    try:
-        # A logica de processamento do arquivo e da assinatura sera implementada aqui
-        # Por enquanto, apenas um placeholder para o fluxo
-
-        # Simula o upload para o IPFS e obtém um hash
-        ipfs_hash = "QmSimulatedIpfsHash" 
-
-        update_data = {
-            "status": "Aguardando aprovacao",
-            "confirmed_at_utc": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-            "ipfs_hash_encrypted": ipfs_hash,
-        }
-        
-        print(f"--- DEBUG [DELIVERIES]: A publicar prova de entrega para a chave '{delivery_key}' com os dados: {update_data}")
-        txid = blockchain_utils.publish_to_blockchain('deliveries_stream', delivery_key, update_data)
-
-        if not txid:
-            print(f"--- DEBUG [DELIVERIES]: ERRO - Falha ao publicar na blockchain.")
-            raise Exception("Falha ao registar a aprovacao na blockchain.")
-
-        print(f"--- DEBUG [DELIVERIES]: Prova de entrega submetida com sucesso. TXID: {txid}")
-        return jsonify({"success": True, "message": "Prova de entrega submetida com sucesso!", "txid": txid}), 200
-
-        if not delivery_key or delivery_key.lower() == "null":
-            return jsonify({"success": False, "message": "Chave de entrega inválida."}), 400
+    decryption_key = os.getenv('DELIVERIES_DECRYPTION_KEY')
+    if not decryption_key:
+        return jsonify({"success": False, "message": "Chave de encriptação de entregas não configurada."}), 500
+    contract_id = request_contract_id()
 
+    try:
+        signature_png = base64.b64decode(signature_image_b64.split(',')[-1]) if signature_image_b64 else None
+        proof_pipeline.submit(delivery_key, proof_file.stream, decryption_key.encode('utf-8'), signature_png, contract_id=contract_id)
+    except (ProofError, ValueError) as e:
+        return jsonify({"success": False, "message": str(e)}), 400
     except Exception as e:
-        print(f"--- DEBUG [DELIVERIES]: ERRO no processo de submissao da prova: {e}")
+        logger.error("Erro no processo de submissao da prova '%s': %s", delivery_key, e)
         return jsonify({"success": False, "message": str(e)}), 500
 
+    logger.info("Prova de entrega '%s' recebida; em processamento.", delivery_key)
+    return jsonify({"success": True, "status": "processing", "message": "Prova de entrega recebida; em processamento."}), 202
+
+@bp.route('/delivery/status/<delivery_key>', methods=['GET'])
+def get_delivery_proof_status(delivery_key):
+    # O estado em memória só existe no processo que recebeu a prova; nos
+    # restantes, o registo na blockchain indica que a prova foi concluída.
+    # Só as provas e os registos do contrato do utilizador.
+    contract_id = request_contract_id()
+    job = proof_pipeline.status(delivery_key, contract_id)
+    if job:
+        return jsonify(job)
+    record = find_delivery(contract_id, delivery_key)
+    if record and record.get('ipfs_hash_encrypted'):
+        return jsonify({"status": "done", "record": record})
+    return jsonify({"status": "unknown"}), 404
 
-# ==============================================================================
-# NOVA ROTA: SUBMISSAO DE PEDIDO PARA POSTGRESQL
-# ==============================================================================
 @bp.route('/order/submit-postgres', methods=['POST'])
 def submit_order_postgres():
     """
@@ -596,6 +771,8 @@ def submit_order_postgres():
 
     try:
        
+        # fpdf (e o Pillow que ele importa) só é carregado ao gerar o primeiro PDF.
+        from .utils.pdf_generator import generate_order_pdf
         signature_image_bytes = base64.b64decode(signature_image_b64.split(',')[1])
         pdf_bytes = generate_order_pdf(client_info, order_items, signature_image_bytes)
         decryption_key = os.getenv('CONTRACT_DECRYPTION_KEY')
@@ -621,5 +798,5 @@ def submit_order_postgres():
         }), 200
 
     except Exception as e:
-        print(f"ERRO: Falha ao submeter pedido ao PostgreSQL: {e}")
+        logger.error("Falha ao submeter pedido ao PostgreSQL: %s", e)
         return jsonify({"success": False, "message": str(e)}), 500
@@ -0,0 +1,218 @@
+# ==============================================================================
+# ARQUIVO: app/integration_server/utils/contract_analytics.py
+# DESCRIÇÃO: Indicadores de consumo do contrato por grupo de produto e por
+#              variante: consumido, saldo, percentual utilizado, valor (a partir
+#              do 'valor_unitario' do catálogo) e ritmo de consumo (burn rate).
+#              Os pedidos de cada contrato são lidos incrementalmente da sua
+#              partição da orders_stream e agregados em lote com NumPy; o
+#              resumo só é recalculado quando chegam pedidos novos (ou muda o
+#              dia).
+# VERSÃO: 1.3 (Pedidos recusados descontados do consumo)
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import json
+import logging
+import datetime
+import threading
+import numpy as np
+from . import blockchain_utils
+from .stream_index import TailedIndex
+from .order_details import quantities_by_code
+
+logger = logging.getLogger(__name__)
+
+# --- 2. CONSTANTES ---
+# Janela (em dias) usada para calcular o ritmo de consumo recente.
+BURN_WINDOW_DAYS = 30
+# Status publicado por review_order quando o pedido é recusado.
+REJECTED_STATUS = 'Recusado'
+
+# --- 3. FUNÇÕES AUXILIARES ---
+
+def parse_brl(value):
+    """Converte um valor monetário do catálogo ('R$ 1.234,56') para float."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    digits = str(value).replace('R$', '').strip().replace('.', '').replace(',', '.')
+    try:
+        return float(digits)
+    except ValueError:
+        return 0.0
+
+def _order_day(data_hora_utc):
+    """Ordinal do dia (UTC) de um pedido, ou None se a data for inválida."""
+    try:
+        return datetime.datetime.fromisoformat(data_hora_utc).date().toordinal()
+    except (TypeError, ValueError):
+        return None
+
+def _round(value, digits=2):
+    return round(float(value), digits)
+
+# --- 4. AGREGADO DE CONSUMO ---
+
+class ContractAnalytics(TailedIndex):
+    """
+    Agregado incremental do consumo do contrato.
+
+    Cada pedido é contado uma única vez, na primeira vez que a sua chave
+    aparece com 'produtos_solicitados' ou com o 'resumo_pedido' dos pedidos
+    guardados fora da blockchain (o mesmo momento em que o consumo é
+    registado no inventário). Quando chega a avaliação 'Recusado' de um
+    pedido contado, as suas linhas são descontadas. As linhas novas ficam
+    num buffer e são somadas aos vetores por variante em lote
+    (np.add.at / np.bincount).
+    """
+    def __init__(self, catalog_path, stream_name='orders_stream', burn_window_days=BURN_WINDOW_DAYS, **kwargs):
+        super().__init__(stream_name, **kwargs)
+        self.burn_window_days = burn_window_days
+        self._load_catalog(catalog_path)
+        self._consumed = np.zeros(len(self.variants), dtype=np.int64)
+        self._daily = {}      # ordinal do dia -> consumo por variante (np.ndarray)
+        self._pending = []    # (índice da variante, quantidade, ordinal do dia)
+        self._counted = {}    # chave do pedido -> linhas somadas
+        self._rejected = set()
+        self._summary = None
+        self._summary_day = None
+
+    def _load_catalog(self, catalog_path):
+        with open(catalog_path, 'r', encoding='utf-8') as f:
+            catalog = json.load(f)
+        self.groups, self.variants = [], []
+        variant_group, contracted, prices = [], [], []
+        for group_index, group in enumerate(catalog):
+            self.groups.append(group["product_group"])
+            contracted.append(int(group.get("quantidade_inicial_contrato", 0)))
+            prices.append(parse_brl(group.get("valor_unitario", 0)))
+            for variant in group.get("variants", []):
+                self.variants.append({"codigo": variant.get("codigo"), "modelo": variant.get("modelo")})
+                variant_group.append(group_index)
+        self._variant_index = {v["codigo"]: i for i, v in enumerate(self.variants)}
+        self._variant_group = np.array(variant_group, dtype=np.int64)
+        self._contracted = np.array(contracted, dtype=np.int64)
+        self._prices = np.array(prices, dtype=np.float64)
+
+    def _apply(self, position, keys, data, item):
+        quantities = quantities_by_code(data)
+        rejected = data.get('status') == REJECTED_STATUS
+        if not quantities and not rejected:
+            return
+        for key in blockchain_utils.record_keys(keys):
+            if quantities and key not in self._counted:
+                rows = self._order_rows(quantities, _order_day(data.get('data_hora_utc')))
+                self._counted[key] = rows
+                if key not in self._rejected:
+                    self._pending.extend(rows)
+            if rejected and key not in self._rejected:
+                self._rejected.add(key)
+                self._pending.extend((index, -quantity, day) for index, quantity, day in self._counted.get(key, ()))
+
+    def _order_rows(self, quantities, day):
+        """Linhas (índice da variante, quantidade, ordinal do dia) de um pedido."""
+        if day is None:
+            return []
+        return [(self._variant_index[code], quantity, day)
+                for code, quantity in quantities.items() if code in self._variant_index]
+
+    def _flush(self):
+        """Soma em lote as linhas pendentes aos agregados."""
+        if not self._pending:
+            return
+        rows = np.array(self._pending, dtype=np.int64)
+        self._pending.clear()
+        np.add.at(self._consumed, rows[:, 0], rows[:, 1])
+        for day in np.unique(rows[:, 2]):
+            mask = rows[:, 2] == day
+            by_variant = np.bincount(rows[mask, 0], weights=rows[mask, 1], minlength=len(self.variants))
+            current = self._daily.get(int(day))
+            self._daily[int(day)] = by_variant if current is None else current + by_variant
+        self._summary = None
+
+    def summary(self):
+        """Resumo do consumo do contrato (ver _compute_summary)."""
+        self.refresh()
+        with self._lock:
+            self._flush()
+            today = datetime.datetime.now(datetime.timezone.utc).date().toordinal()
+            if self._summary is None or self._summary_day != today:
+                self._summary = self._compute_summary(today)
+                self._summary_day = today
+            return self._summary
+
+    def _compute_summary(self, today):
+        n_groups = len(self.groups)
+        consumed_group = np.bincount(self._variant_group, weights=self._consumed, minlength=n_groups)
+        remaining_group = np.maximum(self._contracted - consumed_group, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percent_group = np.where(self._contracted > 0, consumed_group / self._contracted * 100, 0.0)
+
+        # Consumo recente por variante dentro da janela -> unidades/dia.
+        window_start = today - self.burn_window_days + 1
+        recent = np.zeros(len(self.variants))
+        for day, by_variant in self._daily.items():
+            if day >= window_start:
+                recent += by_variant
+        burn_variant = recent / self.burn_window_days
+        burn_group = np.bincount(self._variant_group, weights=burn_variant, minlength=n_groups)
+
+        groups = []
+        for g in range(n_groups):
+            member = np.flatnonzero(self._variant_group == g)
+            group_consumed = consumed_group[g]
+            groups.append({
+                "product_group": self.groups[g],
+                "unit_price": _round(self._prices[g]),
+                "contracted_units": int(self._contracted[g]),
+                "consumed_units": int(group_consumed),
+                "remaining_units": int(remaining_group[g]),
+                "percent_used": _round(percent_group[g]),
+                "consumed_value": _round(group_consumed * self._prices[g]),
+                "remaining_value": _round(remaining_group[g] * self._prices[g]),
+                "burn_rate_per_day": _round(burn_group[g], 3),
+                "days_to_exhaustion": _round(remaining_group[g] / burn_group[g], 1) if burn_group[g] > 0 else None,
+                "variants": [{
+                    **self.variants[v],
+                    "consumed_units": int(self._consumed[v]),
+                    "share_of_group": _round(self._consumed[v] / group_consumed * 100) if group_consumed else 0.0,
+                    "burn_rate_per_day": _round(burn_variant[v], 3),
+                } for v in member],
+            })
+
+        # Série mensal de unidades consumidas por grupo.
+        monthly = {}
+        for day, by_variant in self._daily.items():
+            month = datetime.date.fromordinal(day).strftime('%Y-%m')
+            monthly[month] = monthly.get(month, 0) + np.bincount(self._variant_group, weights=by_variant, minlength=n_groups)
+        timeline = [{"month": month,
+                     "consumed_units": {self.groups[g]: int(units[g]) for g in range(n_groups) if units[g]}}
+                    for month, units in sorted(monthly.items())]
+
+        contracted_value = float(self._contracted @ self._prices)
+        consumed_value = float(consumed_group @ self._prices)
+        return {
+            "generated_at_utc": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "burn_window_days": self.burn_window_days,
+            "totals": {
+                "contracted_units": int(self._contracted.sum()),
+                "consumed_units": int(consumed_group.sum()),
+                "remaining_units": int(remaining_group.sum()),
+                "percent_used": _round(consumed_group.sum() / self._contracted.sum() * 100) if self._contracted.sum() else 0.0,
+                "contracted_value": _round(contracted_value),
+                "consumed_value": _round(consumed_value),
+                "remaining_value": _round(float(remaining_group @ self._prices)),
+            },
+            "groups": groups,
+            "timeline": timeline,
+        }
+
+# --- 5. INSTÂNCIAS DO PROCESSO ---
+_instances = {}  # contrato -> ContractAnalytics
+_instances_lock = threading.Lock()
+
+def get_contract_analytics(catalog_path, contract_id):
+    """Retorna o agregado do contrato, criando-o no primeiro uso."""
+    with _instances_lock:
+        if contract_id not in _instances:
+            _instances[contract_id] = ContractAnalytics(catalog_path, partition=contract_id)
+        return _instances[contract_id]
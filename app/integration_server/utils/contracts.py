@@ -0,0 +1,77 @@
+# ==============================================================================
+# ARQUIVO: app/integration_server/utils/contracts.py
+# DESCRIÇÃO: Contratos como entidade própria. Cada contrato é um registo da
+#              config_stream (chave = ID do contrato) com o PDF encriptado, a
+#              vigência, o cliente e o pedido de venda da Nomus a que as
+#              entregas estão associadas. Os registos de pedidos, entregas,
+#              parcelas e notas de um contrato são publicados também com a
+#              chave da sua partição ('contract:<id>', ver blockchain_utils).
+# VERSÃO: 1.0
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import os
+import re
+import time
+import logging
+import threading
+from . import blockchain_utils
+
+logger = logging.getLogger(__name__)
+
+# --- 2. CONSTANTES ---
+# Contrato dos pedidos sem contrato indicado e dos registos anteriores à
+# partição por contrato.
+DEFAULT_CONTRACT_ID = os.getenv('DEFAULT_CONTRACT_ID', 'contract_v1')
+# Pedido de venda do contrato padrão, quando o registo do contrato não o indica.
+DEFAULT_SALES_ORDER_ID = os.getenv('DEFAULT_SALES_ORDER_ID', '3523')
+# Cabeçalho com que o request_server indica o contrato do utilizador.
+CONTRACT_HEADER = 'X-Contract-Id'
+# Validade da cache dos registos de contrato.
+CONTRACT_CACHE_SECONDS = float(os.getenv('CONTRACT_CACHE_SECONDS', '60'))
+# IDs aceites: são usados como chaves de streams.
+CONTRACT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+class InvalidContract(ValueError):
+    """O ID de contrato recebido não é válido."""
+
+# --- 3. FUNÇÕES AUXILIARES ---
+
+def validate_contract_id(contract_id):
+    """Devolve o ID do contrato (o padrão se vazio) ou levanta InvalidContract."""
+    contract_id = contract_id or DEFAULT_CONTRACT_ID
+    if not CONTRACT_ID_PATTERN.match(contract_id):
+        raise InvalidContract(f"ID de contrato inválido: {contract_id!r}")
+    return contract_id
+
+def contract_of(record):
+    """Contrato de um registo; os registos sem 'contract_id' são do contrato padrão."""
+    return record.get('contract_id') or DEFAULT_CONTRACT_ID
+
+def item_keys(key, contract_id):
+    """Chaves com que um registo do contrato é publicado: a sua e a da partição."""
+    return [key, blockchain_utils.partition_key(contract_id)]
+
+# --- 4. REGISTO DOS CONTRATOS ---
+
+_cache = {}  # contrato -> (registo, instante da leitura)
+_cache_lock = threading.Lock()
+
+def get_contract(contract_id):
+    """Registo do contrato na config_stream (em cache), ou None."""
+    with _cache_lock:
+        entry = _cache.get(contract_id)
+    if entry and time.monotonic() - entry[1] < CONTRACT_CACHE_SECONDS:
+        return dict(entry[0]) if entry[0] else None
+    record = blockchain_utils.get_key_state('config_stream', contract_id)
+    with _cache_lock:
+        _cache[contract_id] = (record, time.monotonic())
+    return dict(record) if record else None
+
+def sales_order_id(contract_id):
+    """Pedido de venda da Nomus associado ao contrato, ou None."""
+    contract = get_contract(contract_id) or {}
+    value = contract.get('sales_order_id')
+    if value is None and contract_id == DEFAULT_CONTRACT_ID:
+        value = DEFAULT_SALES_ORDER_ID
+    return value
@@ -1,14 +1,17 @@
 # ==============================================================================
 # ARQUIVO: app/integration_server/utils/database_utils.py
 # DESCRICAO: Funcoes utilitarias para interagir com o banco de dados PostgreSQL.
-# VERSAO: 1.0
+# VERSAO: 1.1 (Logging com niveis em vez de prints)
 # ==============================================================================
 
 import os
 import psycopg2
 import json
+import logging
 import datetime
 
+logger = logging.getLogger(__name__)
+
 # Funcao para estabelecer a conexao com o banco de dados
 def get_db_connection():
     """
@@ -24,7 +27,7 @@ def get_db_connection():
         )
         return conn
     except Exception as e:
-        print(f"Erro ao conectar ao banco de dados: {e}")
+        logger.error("Erro ao conectar ao banco de dados: %s", e)
         return None
 
 # Funcao para inserir um novo pedido
@@ -64,12 +67,12 @@ def insert_order(client_info, order_hash, encrypted_pdf_bytes, order_items):
             cur.execute(query, list(order_data.values()))
             conn.commit()
             
-            print(f"Pedido com hash {order_hash} inserido com sucesso no PostgreSQL.")
+            logger.info("Pedido com hash %s inserido com sucesso no PostgreSQL.", order_hash)
             return True
             
     except Exception as e:
         conn.rollback()
-        print(f"Erro ao inserir pedido no banco de dados: {e}")
+        logger.error("Erro ao inserir pedido no banco de dados: %s", e)
         return False
         
     finally:
@@ -0,0 +1,210 @@
+# ==============================================================================
+# ARQUIVO: app/integration_server/utils/delivery_proof.py
+# DESCRIÇÃO: Processamento das provas de entrega enviadas pelo entregador. O
+#              ficheiro recebido (já num ficheiro temporário) é, num worker:
+#              reduzido e recomprimido se for uma imagem, encriptado com a
+#              DELIVERIES_DECRYPTION_KEY, enviado para o IPFS em blocos e, por
+#              fim, registado na deliveries_stream, na partição do contrato.
+# VERSÃO: 1.2 (Estado das provas por contrato)
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import os
+import hashlib
+import logging
+import datetime
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from . import blockchain_utils, ipfs_utils
+from .contracts import DEFAULT_CONTRACT_ID, item_keys
+
+logger = logging.getLogger(__name__)
+
+# --- 2. CONSTANTES ---
+# Tamanho máximo aceite para o ficheiro original.
+MAX_UPLOAD_BYTES = int(os.getenv('DELIVERY_PROOF_MAX_BYTES', str(25 * 1024 * 1024)))
+# Maior dimensão (px) e qualidade JPEG das fotografias guardadas.
+IMAGE_MAX_DIMENSION = int(os.getenv('DELIVERY_PROOF_MAX_DIMENSION', '1600'))
+IMAGE_JPEG_QUALITY = 80
+# Acima deste tamanho os ficheiros temporários passam da memória para o disco.
+SPOOL_MAX_BYTES = 1024 * 1024
+# Provas processadas em simultâneo; as restantes aguardam na fila do executor.
+WORKERS = int(os.getenv('DELIVERY_PROOF_WORKERS', '2'))
+
+PDF_MAGIC = b'%PDF'
+
+class ProofError(ValueError):
+    """Prova de entrega inválida (tipo de ficheiro não suportado, demasiado grande...)."""
+
+# --- 3. ETAPAS DO PROCESSAMENTO ---
+
+def spool_upload(stream, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Copia o ficheiro recebido, em blocos, para um ficheiro temporário que o
+    worker possa ler depois de o pedido HTTP terminar.
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    size = 0
+    for block in iter(lambda: stream.read(64 * 1024), b''):
+        size += len(block)
+        if size > max_bytes:
+            spooled.close()
+            raise ProofError(f"O ficheiro excede o tamanho máximo de {max_bytes // (1024 * 1024)} MB.")
+        spooled.write(block)
+    if size == 0:
+        spooled.close()
+        raise ProofError("O ficheiro recebido está vazio.")
+    spooled.seek(0)
+    return spooled
+
+def _compress_image(source):
+    """
+    Reduz uma imagem para IMAGE_MAX_DIMENSION e recomprime-a em JPEG.
+
+    Returns:
+        SpooledTemporaryFile: A imagem recomprimida, ou None se não for imagem.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+    try:
+        image = Image.open(source)
+    except UnidentifiedImageError:
+        return None
+    with image:
+        # Nos JPEG, draft() descodifica já numa escala reduzida, pelo que uma
+        # fotografia de telemóvel nunca chega a ocupar a resolução total.
+        image.draft('RGB', (IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        image.save(output, format='JPEG', quality=IMAGE_JPEG_QUALITY, optimize=True)
+    output.seek(0)
+    return output
+
+def prepare_document(spooled):
+    """
+    Normaliza a prova: PDFs seguem inalterados, imagens são recomprimidas.
+
+    Returns:
+        tuple: (ficheiro, content_type).
+    """
+    header = spooled.read(len(PDF_MAGIC))
+    spooled.seek(0)
+    if header == PDF_MAGIC:
+        return spooled, 'application/pdf'
+    compressed = _compress_image(spooled)
+    if compressed is None:
+        raise ProofError("Formato não suportado: envie um PDF ou uma imagem.")
+    spooled.close()
+    return compressed, 'image/jpeg'
+
+def encrypt_and_upload(document, key_bytes):
+    """
+    Encripta o documento e envia-o para o IPFS, reutilizando o CID se o mesmo
+    conteúdo já tiver sido enviado com a mesma chave.
+
+    Returns:
+        tuple: (cid, sha256 do conteúdo, tamanho do conteúdo).
+    """
+    # Os tokens Fernet não são encriptáveis por blocos; o documento já vem
+    # reduzido (as imagens) ou limitado a MAX_UPLOAD_BYTES (os PDFs).
+    data = document.read()
+    content_sha256 = hashlib.sha256(data).hexdigest()
+    key_identifier = ipfs_utils.key_id(key_bytes)
+    cid = ipfs_utils.lookup_cid(content_sha256, key_identifier)
+    if not cid:
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as encrypted:
+            encrypted.write(ipfs_utils.encrypt_data(data, key_bytes))
+            encrypted.seek(0)
+            cid = ipfs_utils.add_file_to_ipfs(encrypted)
+        if cid:
+            ipfs_utils.remember_cid(content_sha256, key_identifier, cid, len(data))
+    return cid, content_sha256, len(data)
+
+def process_proof(delivery_key, spooled, original_size, key_bytes, signature_png=None, contract_id=DEFAULT_CONTRACT_ID):
+    """
+    Executa todas as etapas de uma prova e publica o registo da entrega.
+
+    Returns:
+        str: O txid do registo publicado.
+    """
+    document, content_type = prepare_document(spooled)
+    with document:
+        cid, content_sha256, stored_size = encrypt_and_upload(document, key_bytes)
+    if not cid:
+        raise ConnectionError("Falha ao enviar a prova de entrega para o IPFS.")
+
+    update_data = {
+        "status": "Aguardando aprovacao",
+        "confirmed_at_utc": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "ipfs_hash_encrypted": cid,
+        "content_type": content_type,
+        "content_sha256": content_sha256,
+        "original_size": original_size,
+        "stored_size": stored_size,
+        "contract_id": contract_id,
+    }
+    if signature_png:
+        signature_cid = ipfs_utils.encrypt_and_add(signature_png, key_bytes)
+        if signature_cid:
+            update_data["signature_ipfs_hash_encrypted"] = signature_cid
+
+    txid = blockchain_utils.publish_to_blockchain('deliveries_stream', item_keys(delivery_key, contract_id), update_data)
+    if not txid:
+        raise ConnectionError("Falha ao registar a prova de entrega na blockchain.")
+    logger.info("Prova de entrega '%s' registada (%s, %d -> %d bytes, txid %s).",
+                delivery_key, content_type, original_size, stored_size, txid)
+    return txid
+
+# --- 4. EXECUÇÃO EM SEGUNDO PLANO ---
+
+class ProofPipeline:
+    """
+    Executa as provas num pool de workers, fora das threads dos pedidos HTTP,
+    e guarda o estado das provas submetidas por este processo.
+    """
+    def __init__(self, workers=WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='delivery-proof')
+        self._jobs = {}  # (contrato, chave da entrega) -> {"status": ..., "txid"/"message": ...}
+        self._lock = threading.Lock()
+
+    def submit(self, delivery_key, stream, key_bytes, signature_png=None, contract_id=DEFAULT_CONTRACT_ID):
+        """
+        Copia o ficheiro para um temporário e agenda o processamento.
+
+        Raises:
+            ProofError: Se o ficheiro estiver vazio ou for demasiado grande.
+        """
+        spooled = spool_upload(stream)
+        spooled.seek(0, os.SEEK_END)
+        original_size = spooled.tell()
+        spooled.seek(0)
+        with self._lock:
+            self._jobs[(contract_id, delivery_key)] = {"status": "processing"}
+        self._executor.submit(self._run, delivery_key, spooled, original_size, key_bytes, signature_png, contract_id)
+
+    def _run(self, delivery_key, spooled, original_size, key_bytes, signature_png, contract_id):
+        try:
+            txid = process_proof(delivery_key, spooled, original_size, key_bytes, signature_png, contract_id)
+            result = {"status": "done", "txid": txid}
+        except ProofError as e:
+            logger.warning("Prova de entrega '%s' recusada: %s", delivery_key, e)
+            result = {"status": "failed", "message": str(e)}
+        except Exception as e:
+            logger.exception("Falha ao processar a prova de entrega '%s': %s", delivery_key, e)
+            result = {"status": "failed", "message": str(e)}
+        finally:
+            spooled.close()
+        with self._lock:
+            self._jobs[(contract_id, delivery_key)] = result
+
+    def status(self, delivery_key, contract_id=DEFAULT_CONTRACT_ID):
+        """Estado de uma prova do contrato submetida neste processo, ou None."""
+        with self._lock:
+            job = self._jobs.get((contract_id, delivery_key))
+            return dict(job) if job else None
+
+# Instância única por processo.
+pipeline = ProofPipeline()
@@ -0,0 +1,133 @@
+# ==============================================================================
+# ARQUIVO: app/integration_server/utils/event_watcher.py
+# DESCRIÇÃO: Observador único das streams de pedidos, entregas e notas. Uma
+#              thread segue as streams a partir do seu fim atual e distribui
+#              cada item novo, como evento, aos clientes ligados por SSE
+#              (Server-Sent Events) de acordo com o seu perfil e contrato.
+# VERSÃO: 1.1 (Eventos entregues apenas aos clientes do contrato do item)
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from . import blockchain_utils
+from .stream_index import StreamTail
+from .contracts import DEFAULT_CONTRACT_ID
+
+logger = logging.getLogger(__name__)
+
+# --- 2. CONSTANTES ---
+POLL_INTERVAL_SECONDS = float(os.getenv('EVENT_WATCHER_POLL_SECONDS', '2'))
+# Eventos pendentes por cliente; um cliente que não consome é desligado.
+SUBSCRIBER_QUEUE_SIZE = 256
+
+# Tipo de evento e perfis que recebem os itens de cada stream. As notas são
+# encaminhadas pelo seu próprio 'target_role'.
+STREAM_ROUTING = {
+    'orders_stream': ('order', ('financeiro',)),
+    'deliveries_stream': ('delivery', ('financeiro', 'entregador', 'cliente')),
+    'notes_stream': ('note', None),
+}
+
+# Sinal colocado na fila de um cliente que deve ser desligado.
+DISCONNECT = object()
+
+# --- 3. OBSERVADOR ---
+
+class EventWatcher:
+    """
+    Mantém um único ciclo de consulta à blockchain por processo, independente
+    do número de clientes ligados.
+    """
+    def __init__(self, routing=STREAM_ROUTING, poll_interval=POLL_INTERVAL_SECONDS):
+        self.routing = routing
+        self.poll_interval = poll_interval
+        self._subscribers = {}  # (perfil, contrato) -> set(queue.Queue)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, role, contract_id=DEFAULT_CONTRACT_ID):
+        """Regista um cliente e retorna a fila onde receberá os seus eventos."""
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault((role, contract_id), set()).add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='event-watcher', daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, role, contract_id, subscriber):
+        with self._lock:
+            self._subscribers.get((role, contract_id), set()).discard(subscriber)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+    def _start_tails(self):
+        # Começa no fim atual de cada stream: o histórico já é servido pelas
+        # rotas de listagem, o canal só transporta o que acontecer a seguir.
+        tails = {}
+        for stream_name in self.routing:
+            count = blockchain_utils.get_stream_item_count(stream_name)
+            if count is None:
+                return None
+            tails[stream_name] = StreamTail(stream_name, start=count)
+        return tails
+
+    def _run(self):
+        tails = None
+        while True:
+            try:
+                if tails is None:
+                    tails = self._start_tails()
+                if tails is not None:
+                    for stream_name, tail in tails.items():
+                        for position, keys, data, _ in tail.poll():
+                            if isinstance(data, dict):
+                                self._dispatch(stream_name, position, keys, data)
+            except Exception as e:
+                logger.exception("Erro no ciclo do observador de eventos: %s", e)
+            time.sleep(self.poll_interval)
+
+    def _dispatch(self, stream_name, position, keys, data):
+        event_type, roles = self.routing[stream_name]
+        if roles is None:
+            roles = (data.get('target_role'),)
+        # O contrato vem da chave de partição; itens sem ela são do contrato padrão.
+        partitions = [key for key in keys if blockchain_utils.is_partition_key(key)]
+        contract_id = partitions[0][len(blockchain_utils.PARTITION_KEY_PREFIX):] if partitions else DEFAULT_CONTRACT_ID
+        record_keys = blockchain_utils.record_keys(keys)
+        event = {
+            "type": event_type,
+            "stream": stream_name,
+            "seq": position,
+            "key": record_keys[0] if record_keys else None,
+            "data": data,
+        }
+        with self._lock:
+            targets = [(role, s) for role in roles for s in self._subscribers.get((role, contract_id), ())]
+        for role, subscriber in targets:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # Cliente lento: é desligado e voltará a ligar-se (o navegador
+                # reconecta automaticamente), recarregando as listagens.
+                logger.warning("Cliente SSE do perfil '%s' com fila cheia; a desligar.", role)
+                self.unsubscribe(role, contract_id, subscriber)
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait(DISCONNECT)
+
+def format_sse(event):
+    """Serializa um evento no formato de texto do Server-Sent Events."""
+    return (f"id: {event['stream']}:{event['seq']}\n"
+            f"event: {event['type']}\n"
+            f"data: {json.dumps(event, ensure_ascii=False)}\n\n")
+
+# Instância única por processo.
+watcher = EventWatcher()
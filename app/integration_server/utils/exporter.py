@@ -0,0 +1,204 @@
+# ==============================================================================
+# ARQUIVO: app/integration_server/utils/exporter.py
+# DESCRIÇÃO: Exportação do histórico das streams (pedidos, entregas e parcelas)
+#              em CSV, JSONL ou Parquet. Os itens são lidos página a página com
+#              'liststreamitems' (start/count) e escritos à medida que chegam,
+#              pelo que a memória usada não depende do tamanho do histórico.
+#              Com um contrato, só a partição desse contrato é lida.
+# VERSÃO: 1.3 (CSV: cabeçalho e primeiras linhas enviados de imediato)
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import io
+import csv
+import json
+import logging
+from . import blockchain_utils
+from .stream_index import BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# --- 2. CONSTANTES ---
+# Conjunto exportável -> (stream, colunas). Cada linha exportada é um registo
+# da stream (histórico completo, incluindo as atualizações parciais); campos
+# fora das colunas declaradas vão, em JSON, para a coluna 'extra'.
+DATASETS = {
+    'orders': ('orders_stream', [
+        'cliente', 'cnpj', 'representante', 'data_hora_utc', 'ip_origem', 'status',
+        'produtos_solicitados', 'resumo_pedido', 'detalhes_ipfs_hash', 'hash_pedido_ipfs', 'order_txid',
+        'reviewed_by', 'reviewed_at_utc', 'rejection_reason',
+    ]),
+    'deliveries': ('deliveries_stream', [
+        'status', 'confirmed_at_utc', 'ipfs_hash_encrypted', 'approved_by', 'approved_at_utc',
+    ]),
+    'installments': ('financial_stream', [
+        'id_nomus', 'due_date', 'value', 'paid',
+    ]),
+}
+# Colunas comuns a todos os conjuntos, à frente das colunas dos dados.
+BASE_COLUMNS = ['seq', 'key', 'txid', 'blocktime']
+# CSV: o cabeçalho é enviado de imediato e o primeiro bloco de linhas assim
+# que atinge CSV_FIRST_CHUNK_BYTES, para o download começar logo; depois, as
+# linhas são agrupadas em blocos de CSV_CHUNK_BYTES.
+CSV_FIRST_CHUNK_BYTES = 4 * 1024
+CSV_CHUNK_BYTES = 64 * 1024
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+class ExportError(ValueError):
+    """Conjunto ou formato de exportação inválido (ou indisponível)."""
+
+# --- 3. LEITURA PAGINADA ---
+
+def iter_records(dataset, contract_id=None, batch_size=BATCH_SIZE):
+    """
+    Percorre todos os registos de um conjunto (ou só os de um contrato), uma
+    página de cada vez.
+
+    Yields:
+        dict: Registo com as colunas base seguidas dos dados do item.
+    """
+    stream_name = DATASETS[dataset][0]
+    partition = blockchain_utils.partition_key(contract_id) if contract_id is not None else None
+    start = 0
+    while True:
+        if partition is None:
+            items = blockchain_utils.list_stream_items(stream_name, start, batch_size)
+        else:
+            items = blockchain_utils.list_stream_key_items(stream_name, partition, start, batch_size)
+        if items is None:
+            # Os bytes já enviados não podem ser retirados: a falha fica no log.
+            logger.error("Exportação de '%s' interrompida na posição %d.", dataset, start)
+            return
+        if not items:
+            return
+        for offset, item in enumerate(items):
+            data = blockchain_utils.decode_item_data(item)
+            if isinstance(data, dict):
+                keys = blockchain_utils.record_keys(blockchain_utils.get_item_keys(item))
+                yield {
+                    'seq': start + offset,
+                    'key': keys[0] if keys else None,
+                    'txid': item.get('txid'),
+                    'blocktime': item.get('blocktime'),
+                    **data,
+                }
+        if len(items) < batch_size:
+            return
+        start += len(items)
+
+def _flatten(record, columns):
+    """Projeta um registo nas colunas fixas; o resto vai para 'extra'."""
+    row = {}
+    for column in columns:
+        value = record.get(column)
+        row[column] = json.dumps(value, ensure_ascii=False) if isinstance(value, (list, dict)) else value
+    extra = {k: v for k, v in record.items() if k not in columns}
+    row['extra'] = json.dumps(extra, ensure_ascii=False) if extra else None
+    return row
+
+# --- 4. FORMATOS ---
+
+def _export_jsonl(records, columns):
+    for record in records:
+        yield (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+def _drain(buffer):
+    data = buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+def _export_csv(records, columns):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns + ['extra'])
+    writer.writeheader()
+    # O cabeçalho segue antes de a primeira página da stream ser lida.
+    yield _drain(buffer)
+    threshold = CSV_FIRST_CHUNK_BYTES
+    for record in records:
+        writer.writerow(_flatten(record, columns))
+        if buffer.tell() >= threshold:
+            yield _drain(buffer)
+            threshold = CSV_CHUNK_BYTES
+    if buffer.tell():
+        yield _drain(buffer)
+
+class _ChunkSink(io.RawIOBase):
+    """Destino de escrita que acumula bytes até serem recolhidos com drain()."""
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _export_parquet(records, columns, row_group_size=BATCH_SIZE):
+    # pyarrow é opcional: só é necessário para este formato.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    names = columns + ['extra']
+    schema = pa.schema([(name, pa.string()) for name in names])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        batch = []
+        for record in records:
+            row = _flatten(record, columns)
+            batch.append({k: None if v is None else str(v) for k, v in row.items()})
+            if len(batch) >= row_group_size:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                batch.clear()
+                yield sink.drain()
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+    finally:
+        writer.close()
+    yield sink.drain()
+
+EXPORTERS = {'csv': _export_csv, 'jsonl': _export_jsonl, 'parquet': _export_parquet}
+
+# --- 5. PONTO DE ENTRADA ---
+
+def validate(dataset, fmt):
+    """Valida o pedido de exportação antes de começar a enviar bytes."""
+    if dataset not in DATASETS:
+        raise ExportError(f"Conjunto desconhecido: '{dataset}'. Opções: {', '.join(DATASETS)}.")
+    if fmt not in FORMATS:
+        raise ExportError(f"Formato desconhecido: '{fmt}'. Opções: {', '.join(FORMATS)}.")
+    if fmt == 'parquet':
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise ExportError("O formato Parquet requer o pacote 'pyarrow'.")
+
+def export(dataset, fmt, contract_id=None):
+    """
+    Gera a exportação de um conjunto (de todos os contratos, ou só de
+    `contract_id`) como uma sequência de blocos de bytes.
+
+    Raises:
+        ExportError: Se o conjunto ou o formato forem inválidos.
+    """
+    validate(dataset, fmt)
+    columns = BASE_COLUMNS + DATASETS[dataset][1]
+    logger.info("A exportar '%s' em %s (contrato: %s).", dataset, fmt, contract_id or 'todos')
+    return EXPORTERS[fmt](iter_records(dataset, contract_id), columns)
@@ -0,0 +1,237 @@
+# ==============================================================================
+# ARQUIVO: app/integration_server/utils/financial_sync.py
+# DESCRIÇÃO: Inadimplência pré-calculada. Um índice em memória segue a
+#              financial_stream e mantém, por contrato, as parcelas em aberto
+#              ordenadas por vencimento: saber se um contrato está inadimplente
+#              é olhar para a primeira. Uma sincronização agendada consulta a
+#              Nomus, em lotes, apenas pelas parcelas em aberto e publica as
+#              transições (paga, vencimento alterado) como deltas na stream,
+#              em vez de a página de alertas consultar a Nomus a cada visita.
+# VERSÃO: 1.3 (Caminho do lock relativo à raiz do projeto)
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import os
+import time
+import bisect
+import logging
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from . import blockchain_utils, nomus_api
+from .contracts import contract_of, item_keys
+from .stream_index import LatestStateIndex
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# --- 2. CONSTANTES ---
+STREAM_NAME = 'financial_stream'
+# Intervalo entre sincronizações com a Nomus.
+SYNC_INTERVAL_SECONDS = float(os.getenv('FINANCIAL_SYNC_INTERVAL_SECONDS', '300'))
+# Parcelas consultadas por lote (as transições de cada lote seguem numa só
+# transação) e consultas simultâneas à Nomus dentro do lote.
+SYNC_BATCH_SIZE = int(os.getenv('FINANCIAL_SYNC_BATCH_SIZE', '20'))
+SYNC_WORKERS = int(os.getenv('FINANCIAL_SYNC_WORKERS', '4'))
+# 'embedded': a sincronização corre numa thread do integration_server;
+# 'external': corre num processo próprio (`python run.py financial-sync`).
+SYNC_MODE = os.getenv('FINANCIAL_SYNC_MODE', 'embedded').lower()
+# Lock de ficheiro partilhado pelos processos da máquina (workers do gunicorn
+# e `run.py financial-sync`): só quem o detém sincroniza; os restantes tentam
+# obtê-lo a cada intervalo, pelo que outro processo assume se o atual terminar.
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+# Um caminho relativo é resolvido a partir da raiz do projeto, e não do
+# diretório de trabalho de cada processo.
+SYNC_LOCK_PATH = os.path.join(PROJECT_ROOT, os.getenv('FINANCIAL_SYNC_LOCK_PATH', os.path.join('instance', 'financial_sync.lock')))
+NOMUS_DATE_FORMAT = "%d/%m/%Y"
+
+# --- 3. FUNÇÕES AUXILIARES ---
+
+def parse_due_date(value):
+    """Vencimento em ISO (stream) ou dd/mm/aaaa (Nomus); None se inválido."""
+    for date_format in ('%Y-%m-%d', NOMUS_DATE_FORMAT):
+        try:
+            return datetime.datetime.strptime(value, date_format).date()
+        except (TypeError, ValueError):
+            continue
+    return None
+
+# --- 4. ÍNDICE DE INADIMPLÊNCIA ---
+
+class DelinquencyIndex(LatestStateIndex):
+    """
+    Estado de cada parcela (fusão dos itens da chave) e, por contrato, a lista
+    ordenada (vencimento, chave) das parcelas em aberto. Um contrato está
+    inadimplente se a primeira parcela da lista já venceu.
+    """
+    def __init__(self, stream_name=STREAM_NAME, **kwargs):
+        super().__init__(stream_name, **kwargs)
+        self._unpaid = {}  # contrato -> [(vencimento, chave), ...] ordenada
+
+    @staticmethod
+    def _unpaid_entry(key, record):
+        if record.get('paid'):
+            return None
+        due_date = parse_due_date(record.get('due_date'))
+        if due_date is None:
+            return None
+        return contract_of(record), (due_date, key)
+
+    def _on_update(self, key, previous, record):
+        old = self._unpaid_entry(key, previous) if previous else None
+        new = self._unpaid_entry(key, record)
+        if old == new:
+            return
+        if old:
+            entries = self._unpaid.get(old[0], [])
+            position = bisect.bisect_left(entries, old[1])
+            if position < len(entries) and entries[position] == old[1]:
+                del entries[position]
+        if new:
+            bisect.insort(self._unpaid.setdefault(new[0], []), new[1])
+
+    def status(self, contract_id, today=None):
+        """Situação financeira de um contrato, sem consultar a Nomus."""
+        today = today or datetime.date.today()
+        self.refresh()
+        with self._lock:
+            entries = self._unpaid.get(contract_id, [])
+            overdue = bisect.bisect_left(entries, (today,))
+            return {
+                "is_delinquent": overdue > 0,
+                "overdue_installments": overdue,
+                "oldest_overdue_due_date": entries[0][0].isoformat() if overdue else None,
+                "open_installments": len(entries),
+            }
+
+    def overdue(self, contract_id=None, today=None):
+        """Parcelas vencidas e em aberto de um contrato (ou de todos), por vencimento."""
+        today = today or datetime.date.today()
+        self.refresh()
+        with self._lock:
+            if contract_id is None:
+                lists = self._unpaid.values()
+            else:
+                lists = [self._unpaid.get(contract_id, [])]
+            return [dict(self._state[key], due_date=due_date.isoformat())
+                    for entries in lists
+                    for due_date, key in entries[:bisect.bisect_left(entries, (today,))]]
+
+    def unpaid(self):
+        """Parcelas em aberto (as únicas que a sincronização consulta)."""
+        self.refresh()
+        with self._lock:
+            return [dict(record) for record in self._state.values() if not record.get('paid')]
+
+# --- 5. SINCRONIZAÇÃO COM A NOMUS ---
+
+class FinancialSync:
+    """
+    Consulta a Nomus pelas parcelas em aberto, em lotes, e publica as
+    transições na financial_stream. O índice aplica-as quando as lê da stream,
+    pelo que todos os processos ficam com o mesmo estado. Uma transição cuja
+    publicação falhe volta a ser detetada na sincronização seguinte.
+    """
+    def __init__(self, index, interval=SYNC_INTERVAL_SECONDS, batch_size=SYNC_BATCH_SIZE, workers=SYNC_WORKERS,
+                 lock_path=SYNC_LOCK_PATH):
+        self.index = index
+        self.interval = interval
+        self.batch_size = batch_size
+        self.workers = workers
+        self.lock_path = lock_path
+        self.last_result = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._lock_file = None
+
+    def _transition(self, record):
+        """Delta a publicar para uma parcela, {} se nada mudou, ou None se a Nomus falhar."""
+        try:
+            success, nomus_data = nomus_api.get_nomus_contas_receber(record.get('id_nomus'))
+        except Exception as e:
+            logger.warning("Erro ao consultar a parcela %s na Nomus: %s", record.get('id_nomus'), e)
+            return None
+        if not success or not nomus_data:
+            logger.warning("Falha ao consultar a API Nomus para a parcela %s.", record.get('id_nomus'))
+            return None
+        if nomus_data.get('status'):
+            return {"paid": True}
+        due_date = parse_due_date(nomus_data.get('dataVencimento'))
+        if due_date and due_date != parse_due_date(record.get('due_date')):
+            return {"due_date": due_date.isoformat()}
+        return {}
+
+    def run_once(self):
+        """Uma sincronização completa; devolve as contagens da execução."""
+        started = time.monotonic()
+        self.index.refresh(force=True)
+        pending = self.index.unpaid()
+        result = {"checked": len(pending), "paid": 0, "updated": 0, "failed": 0}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='financial-sync') as executor:
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                deltas = list(executor.map(self._transition, batch))
+                entries = [(item_keys(record['key'], contract_of(record)), delta)
+                           for record, delta in zip(batch, deltas) if delta]
+                result["failed"] += sum(1 for delta in deltas if delta is None)
+                if not entries:
+                    continue
+                if blockchain_utils.publish_many_to_blockchain(STREAM_NAME, entries) is None:
+                    logger.error("Falha ao publicar %d transições de parcelas.", len(entries))
+                    result["failed"] += len(entries)
+                    continue
+                for keys, delta in entries:
+                    result["paid" if delta.get('paid') else "updated"] += 1
+                    logger.info("Parcela %s atualizada na blockchain: %s.", keys[0], delta)
+        self.index.refresh(force=True)
+        result["seconds"] = round(time.monotonic() - started, 3)
+        self.last_result = result
+        logger.info("Sincronização financeira: %s", result)
+        return result
+
+    def _acquire_process_lock(self):
+        """True se este processo detém (ou acabou de obter) o lock de sincronização."""
+        if self._lock_file is not None or fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # O lock dura enquanto o ficheiro estiver aberto, i.e. a vida do processo.
+        self._lock_file = lock_file
+        logger.info("Sincronização financeira a cargo deste processo (pid %d).", os.getpid())
+        return True
+
+    def run_forever(self):
+        while True:
+            try:
+                if self._acquire_process_lock():
+                    self.run_once()
+                else:
+                    logger.debug("Sincronização financeira a cargo de outro processo.")
+            except Exception as e:
+                logger.exception("Erro na sincronização financeira: %s", e)
+            time.sleep(self.interval)
+
+    def ensure_started(self):
+        """
+        Arranca a thread de sincronização no modo 'embedded' (uma vez por
+        processo). Com vários workers, só o que obtiver o lock sincroniza.
+        """
+        if SYNC_MODE != 'embedded' or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run_forever, name='financial-sync', daemon=True)
+                self._thread.start()
+
+# Instâncias únicas por processo.
+delinquency_index = DelinquencyIndex()
+financial_sync = FinancialSync(delinquency_index)
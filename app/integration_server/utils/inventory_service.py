@@ -0,0 +1,178 @@
+# ==============================================================================
+# ARQUIVO: app/integration_server/utils/inventory_service.py
+# DESCRIÇÃO: Contadores de inventário mantidos em memória. O estado é semeado a
+#              partir da inventory_stream (snapshots iniciais + deltas) e cada
+#              reserva publica apenas um delta de consumo, em vez de ler e
+#              republicar o objeto inteiro (o que perdia atualizações quando
+#              dois pedidos concorriam pelo mesmo produto). Cada contrato tem
+#              o seu inventário: os registos são publicados também na partição
+#              do contrato e cada agregado segue apenas essa partição.
+# VERSÃO: 1.2 (Inventário por contrato)
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import uuid
+import logging
+import datetime
+import threading
+from collections import defaultdict
+from . import blockchain_utils
+from .contracts import item_keys
+from .stream_index import TailedIndex, PartitionedIndex
+
+logger = logging.getLogger(__name__)
+
+# --- 2. CONSTANTES ---
+STREAM_NAME = 'inventory_stream'
+# Tipo dos registos de delta; registos sem 'type' são snapshots completos.
+DELTA_TYPE = 'consumption_delta'
+# Itens mais recentes do produto em que se procura uma reserva cuja
+# publicação não teve resposta (ex: timeout) antes de a reverter.
+RESERVATION_LOOKUP_ITEMS = 50
+
+# --- 3. FUNÇÕES AUXILIARES ---
+
+def is_delta(data):
+    return data.get('type') == DELTA_TYPE
+
+def apply_record(state, data):
+    """
+    Aplica um registo da inventory_stream a um estado (dict product_code -> dict).
+    Snapshots substituem o estado do produto; deltas somam ao consumo.
+    """
+    product_code = data.get('product_code')
+    if not product_code:
+        return
+    if is_delta(data):
+        current = state.setdefault(product_code, {"product_code": product_code, "consumed_stock": 0})
+        current['consumed_stock'] = int(current.get('consumed_stock', 0)) + int(data.get('consumed_delta', 0))
+    else:
+        state[product_code] = {k: v for k, v in data.items() if k != 'key'}
+
+# --- 4. SERVIÇO DE INVENTÁRIO ---
+
+class InventoryService(TailedIndex):
+    """
+    Agregado em memória do inventário de um contrato (`partition`), por produto.
+
+    As reservas são aplicadas de forma otimista: o delta é somado localmente
+    sob o lock do produto, publicado, e revertido se a publicação falhar. Cada
+    delta leva um 'reservation_id', pelo que o próprio processo reconhece os
+    seus deltas quando os volta a ler da stream e não os conta duas vezes.
+    Deltas de outros processos são incorporados pela leitura incremental.
+
+    Uma publicação sem resposta pode ter sido aceite pelo nó: antes de reverter,
+    a reserva é procurada na stream pelo seu 'reservation_id'.
+    """
+    def __init__(self, stream_name=STREAM_NAME, partition=None, **kwargs):
+        if partition is None:
+            raise ValueError("O inventário é por contrato: indique a partição.")
+        super().__init__(stream_name, partition=partition, **kwargs)
+        self._state = {}
+        self._pending = set()
+        self._key_locks = defaultdict(threading.Lock)
+
+    def _apply(self, position, keys, data, item):
+        reservation_id = data.get('reservation_id')
+        if reservation_id and reservation_id in self._pending:
+            self._pending.discard(reservation_id)
+            return
+        apply_record(self._state, data)
+
+    def snapshot(self):
+        """Estado atual de todos os produtos do contrato (product_code -> dict)."""
+        self.refresh()
+        with self._lock:
+            return {code: dict(record) for code, record in self._state.items()}
+
+    def get(self, product_code):
+        self.refresh()
+        with self._lock:
+            record = self._state.get(product_code)
+            return dict(record) if record else None
+
+    def _find_published(self, product_code, reservation_id):
+        """
+        Procura um delta nos itens mais recentes do produto. Retorna o txid se
+        estiver na stream, False se não estiver, ou None se a leitura falhar.
+        """
+        items = blockchain_utils.list_stream_key_items(
+            self.stream_name, product_code, -RESERVATION_LOOKUP_ITEMS, RESERVATION_LOOKUP_ITEMS)
+        if items is None:
+            return None
+        for item in reversed(items):
+            data = blockchain_utils.decode_item_data(item)
+            if isinstance(data, dict) and data.get('reservation_id') == reservation_id:
+                return item.get('txid')
+        return False
+
+    def _publish_delta(self, product_code, consumed_delta, **extra):
+        """Aplica e publica um delta de consumo. Retorna o txid, ou None se falhar."""
+        self.refresh()
+        reservation_id = uuid.uuid4().hex
+        delta = {
+            "type": DELTA_TYPE,
+            "product_code": product_code,
+            "consumed_delta": consumed_delta,
+            "reservation_id": reservation_id,
+            "recorded_at_utc": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "contract_id": self.partition,
+            **extra,
+        }
+        with self._key_locks[product_code]:
+            with self._lock:
+                self._pending.add(reservation_id)
+                apply_record(self._state, delta)
+            try:
+                txid = blockchain_utils.publish_to_blockchain(
+                    self.stream_name, item_keys(product_code, self.partition), delta)
+            except Exception as e:
+                logger.error("Erro ao publicar o delta %s de '%s': %s", reservation_id, product_code, e)
+                txid = None
+            if not txid:
+                txid = self._find_published(product_code, reservation_id)
+                if txid:
+                    logger.warning("Delta %s de '%s' publicado apesar da falha na resposta (%s).",
+                                   reservation_id, product_code, txid)
+                    return txid
+                with self._lock:
+                    # Se a procura falhou e o delta estiver na stream, a leitura
+                    # incremental aplica-o ao encontrá-lo.
+                    self._pending.discard(reservation_id)
+                    apply_record(self._state, {**delta, "consumed_delta": -consumed_delta})
+            return txid or None
+
+    def reserve(self, product_code, quantity):
+        """
+        Regista o consumo de `quantity` unidades de um produto.
+
+        Returns:
+            str: O txid do delta publicado, ou None se a publicação falhar.
+        """
+        quantity = int(quantity)
+        if quantity <= 0:
+            return None
+        txid = self._publish_delta(product_code, quantity)
+        if not txid:
+            logger.error("Falha ao publicar a reserva de %d unidades de '%s'.", quantity, product_code)
+        return txid
+
+    def release(self, product_code, quantity, reason=None):
+        """
+        Devolve ao stock `quantity` unidades reservadas (delta negativo), ex:
+        quando o pedido que as reservou não chega a ser publicado.
+
+        Returns:
+            str: O txid do delta publicado, ou None se a publicação falhar.
+        """
+        quantity = int(quantity)
+        if quantity <= 0:
+            return None
+        txid = self._publish_delta(product_code, -quantity, **({"reason": reason} if reason else {}))
+        if not txid:
+            logger.error("Falha ao libertar a reserva de %d unidades de '%s'; é necessário um delta de compensação manual.",
+                         quantity, product_code)
+        return txid
+
+# Um agregado por contrato, criado no primeiro uso: inventory_for(contract_id).
+inventory_for = PartitionedIndex(InventoryService, STREAM_NAME)
@@ -2,13 +2,29 @@
 # ARQUIVO: app/integration_server/utils/ipfs_utils.py
 # DESCRIÇÃO: Funções de utilidade para interagir com o daemon do IPFS e para
 #              realizar operações de encriptação e desencriptação de dados.
-# VERSÃO: 3.0
+# VERSÃO: 3.7 (Ligações ao índice de uploads fechadas após cada operação)
 # ==============================================================================
 
 # --- 1. IMPORTAÇÕES ---
 import os
-import ipfshttpclient
-from cryptography.fernet import Fernet
+import sqlite3
+import hashlib
+import logging
+import datetime
+import threading
+from contextlib import closing
+from ...metrics import timed
+from ...resilience import guard, BackendUnavailable
+
+# ipfshttpclient e cryptography são importados na primeira utilização, para
+# que o arranque de um worker não espere por bibliotecas que só alguns pedidos
+# usam.
+
+logger = logging.getLogger(__name__)
+
+# Índice local hash do conteúdo original -> CID (ver secção 4).
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+DEFAULT_INDEX_PATH = os.path.join(PROJECT_ROOT, 'instance', 'ipfs_index.sqlite3')
 
 # --- 2. FUNÇÕES DE INTERAÇÃO COM O IPFS ---
 
@@ -23,14 +39,42 @@ def get_ipfs_client():
     IPFS_API_PORT = os.getenv('IPFS_API_PORT', '5001')
     
     try:
+        import ipfshttpclient
         # Tenta conectar-se ao daemon do IPFS.
         client = ipfshttpclient.connect(f"/dns/{IPFS_API_HOST}/tcp/{IPFS_API_PORT}/http") # nome do serviço no Compose
         #client = ipfshttpclient.connect(f'/ip4/{host}/tcp/{port}') trocado
         return client
     except Exception as e:
-        print(f"ERRO: Não foi possível conectar com o daemon do IPFS: {e}")
+        logger.error("Não foi possível conectar com o daemon do IPFS: %s", e)
         return None
 
+def _call_ipfs(operation, action, description):
+    """
+    Executa `action(client)` sob o circuit breaker e o bulkhead do IPFS.
+
+    Returns:
+        O resultado de `action`, ou None em caso de erro ou se a chamada for
+        recusada.
+    """
+    with timed('ipfs', operation) as span:
+        try:
+            from ipfshttpclient.exceptions import ErrorResponse
+            # Os erros devolvidos pelo daemon (ex: CID inválido) não contam
+            # como falhas do IPFS no circuit breaker.
+            with guard('ipfs').call(ignore=(ErrorResponse,)):
+                client = get_ipfs_client()
+                if not client:
+                    raise ConnectionError("Daemon do IPFS inacessível.")
+                return action(client)
+        except BackendUnavailable as e:
+            logger.debug("Pedido ao IPFS recusado (%s): %s", description, e)
+            span.reject()
+            return None
+        except Exception as e:
+            logger.error("Falha ao %s: %s", description, e)
+            span.fail()
+            return None
+
 def add_to_ipfs(data_bytes):
     """
     Adiciona um conjunto de dados (em bytes) ao IPFS.
@@ -41,18 +85,23 @@ def add_to_ipfs(data_bytes):
     Returns:
         str: O hash (CID) do conteúdo adicionado, ou None em caso de erro.
     """
-    client = get_ipfs_client()
-    if not client:
-        return None
-    
-    try:
-        # Usa o cliente para adicionar os bytes e retorna o hash resultante.
-        result = client.add_bytes(data_bytes)
-        print(f"Dados adicionados ao IPFS com hash: {result}")
-        return result
-    except Exception as e:
-        print(f"ERRO: Falha ao adicionar dados ao IPFS: {e}")
-        return None
+    result = _call_ipfs('add', lambda client: client.add_bytes(data_bytes), "adicionar dados ao IPFS")
+    if result:
+        logger.debug("Dados adicionados ao IPFS com hash: %s", result)
+    return result
+
+def add_file_to_ipfs(file_obj):
+    """
+    Adiciona ao IPFS o conteúdo de um ficheiro aberto. O cliente envia-o em
+    blocos, sem o carregar inteiro para a memória.
+
+    Returns:
+        str: O hash (CID) do conteúdo adicionado, ou None em caso de erro.
+    """
+    result = _call_ipfs('add', lambda client: client.add(file_obj)['Hash'], "adicionar ficheiro ao IPFS")
+    if result:
+        logger.debug("Ficheiro adicionado ao IPFS com hash: %s", result)
+    return result
 
 def get_from_ipfs(ipfs_hash):
     """
@@ -64,17 +113,8 @@ def get_from_ipfs(ipfs_hash):
     Returns:
         bytes: Os dados recuperados em formato de bytes, ou None em caso de erro.
     """
-    client = get_ipfs_client()
-    if not client:
-        return None
-    
-    try:
-        # Usa o cliente para obter o conteúdo associado ao hash.
-        data_bytes = client.cat(ipfs_hash)
-        return data_bytes
-    except Exception as e:
-        print(f"ERRO: Falha ao recuperar dados do IPFS (hash: {ipfs_hash}): {e}")
-        return None
+    # Usa o cliente para obter o conteúdo associado ao hash.
+    return _call_ipfs('cat', lambda client: client.cat(ipfs_hash), f"recuperar dados do IPFS (hash: {ipfs_hash})")
 
 # --- 3. FUNÇÕES DE CRIPTOGRAFIA ---
 
@@ -90,8 +130,10 @@ def encrypt_data(data_bytes, key_bytes):
         bytes: Os dados encriptados.
     """
     # A chave é passada como argumento e não gerada aqui.
-    f = Fernet(key_bytes)
-    encrypted_data = f.encrypt(data_bytes)
+    from cryptography.fernet import Fernet
+    with timed('fernet', 'encrypt'):
+        f = Fernet(key_bytes)
+        encrypted_data = f.encrypt(data_bytes)
     
     # Retorna apenas os dados encriptados, conforme esperado pelo resto do código.
     return encrypted_data
@@ -107,11 +149,94 @@ def decrypt_data(encrypted_data_bytes, key_bytes):
     Returns:
         bytes: Os dados originais desencriptados, ou None em caso de erro.
     """
+    from cryptography.fernet import Fernet
+    with timed('fernet', 'decrypt') as span:
+        try:
+            f = Fernet(key_bytes)
+            decrypted_data = f.decrypt(encrypted_data_bytes)
+            return decrypted_data
+        except Exception as e:
+            # Este erro ocorre tipicamente se a chave estiver incorreta ou os dados corrompidos.
+            logger.error("Falha ao descriptografar dados: %s", e)
+            span.fail()
+            return None
+
+# --- 4. UPLOAD COM DEDUPLICAÇÃO ---
+# A Fernet usa um IV aleatório: o mesmo ficheiro encriptado duas vezes gera
+# bytes diferentes e, por isso, um novo CID. O índice guarda o CID do primeiro
+# upload de cada conteúdo, identificado pelo SHA-256 do conteúdo original e
+# pelo identificador da chave usada, e os uploads seguintes reutilizam-no.
+
+_index_lock = threading.Lock()
+_index_initialized = set()
+
+def get_index_path():
+    return os.getenv('IPFS_INDEX_DB_PATH', DEFAULT_INDEX_PATH)
+
+def _connect_index():
+    path = get_index_path()
+    with _index_lock:
+        if path not in _index_initialized:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10)
     try:
-        f = Fernet(key_bytes)
-        decrypted_data = f.decrypt(encrypted_data_bytes)
-        return decrypted_data
-    except Exception as e:
-        # Este erro ocorre tipicamente se a chave estiver incorreta ou os dados corrompidos.
-        print(f"ERRO: Falha ao descriptografar dados: {e}")
+        with _index_lock:
+            if path not in _index_initialized:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute("""CREATE TABLE IF NOT EXISTS uploads (
+                                    plaintext_sha256 TEXT NOT NULL,
+                                    key_id TEXT NOT NULL,
+                                    cid TEXT NOT NULL,
+                                    size INTEGER,
+                                    created_at_utc TEXT,
+                                    PRIMARY KEY (plaintext_sha256, key_id))""")
+                _index_initialized.add(path)
+    except sqlite3.Error:
+        conn.close()
+        raise
+    return conn
+
+def key_id(key_bytes):
+    """Identificador curto de uma chave, que não permite reconstruí-la."""
+    return hashlib.sha256(key_bytes).hexdigest()[:16]
+
+def lookup_cid(plaintext_sha256, key_identifier):
+    """Retorna o CID já enviado para este conteúdo e chave, ou None."""
+    try:
+        # 'with conn' apenas termina a transação; closing() fecha a ligação.
+        with closing(_connect_index()) as conn:
+            row = conn.execute('SELECT cid FROM uploads WHERE plaintext_sha256 = ? AND key_id = ?',
+                               (plaintext_sha256, key_identifier)).fetchone()
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        logger.warning("Índice de uploads do IPFS indisponível: %s", e)
         return None
+
+def remember_cid(plaintext_sha256, key_identifier, cid, size=None):
+    """Regista o CID do upload de um conteúdo encriptado com uma chave."""
+    try:
+        with closing(_connect_index()) as conn, conn:
+            conn.execute('INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?, ?)',
+                         (plaintext_sha256, key_identifier, cid, size,
+                          datetime.datetime.now(datetime.timezone.utc).isoformat()))
+    except sqlite3.Error as e:
+        logger.warning("Falha ao registar o CID %s no índice de uploads: %s", cid, e)
+
+def encrypt_and_add(data_bytes, key_bytes):
+    """
+    Encripta os dados e envia-os para o IPFS, a menos que o mesmo conteúdo já
+    tenha sido enviado com a mesma chave, caso em que retorna o CID existente.
+
+    Returns:
+        str: O hash (CID) do conteúdo encriptado, ou None em caso de erro.
+    """
+    plaintext_sha256 = hashlib.sha256(data_bytes).hexdigest()
+    key_identifier = key_id(key_bytes)
+    cid = lookup_cid(plaintext_sha256, key_identifier)
+    if cid:
+        logger.debug("Conteúdo %s já presente no IPFS com o CID %s.", plaintext_sha256[:12], cid)
+        return cid
+    cid = add_to_ipfs(encrypt_data(data_bytes, key_bytes))
+    if cid:
+        remember_cid(plaintext_sha256, key_identifier, cid, len(data_bytes))
+    return cid
@@ -1,43 +1,100 @@
 # ==============================================================================
 # ARQUIVO: app/integration_server/utils/nomus_api.py
 # DESCRIÇÃO: Centraliza todas as chamadas para a API externa do ERP Nomus.
-# v3 (com Debug)
+# v7 (GET simultâneos ao mesmo endereço agrupados em single-flight)
 # ==============================================================================
 import os
+import time
+import logging
+import threading
 import requests
+from collections import OrderedDict
+from ...metrics import timed, normalize_endpoint
+from ...resilience import guard, BackendUnavailable
+from ... import singleflight
+
+logger = logging.getLogger(__name__)
+
+# Última resposta bem-sucedida de cada GET, servida quando a Nomus está em
+# baixo, lenta ou com o circuito aberto, durante no máximo este tempo.
+NOMUS_STALE_TTL_SECONDS = float(os.getenv('NOMUS_STALE_TTL_SECONDS', '3600'))
+NOMUS_STALE_MAX_ENTRIES = 2000
+
+_last_good = OrderedDict()  # url -> (resposta, instante)
+_last_good_lock = threading.Lock()
+
+def _remember_response(url, body):
+    with _last_good_lock:
+        _last_good[url] = (body, time.monotonic())
+        _last_good.move_to_end(url)
+        while len(_last_good) > NOMUS_STALE_MAX_ENTRIES:
+            _last_good.popitem(last=False)
+
+def _stale_response(url):
+    with _last_good_lock:
+        entry = _last_good.get(url)
+    if entry and time.monotonic() - entry[1] <= NOMUS_STALE_TTL_SECONDS:
+        return entry[0]
+    return None
 
 def _make_nomus_request(method, endpoint, data=None):
-    """Função base para fazer requisições à API Nomus."""
+    """
+    Função base para fazer requisições à API Nomus.
+
+    Se a Nomus não responder (erro de ligação, timeout, 5xx ou circuito
+    aberto), os GET devolvem a última resposta bem-sucedida ainda válida.
+    """
     base_url = os.getenv('NOMUS_API_URL')
     api_key = os.getenv('NOMUS_API_KEY')
 
     if not base_url or not api_key:
-        print("DEBUG [Nomus API]: ERRO: Variáveis de ambiente da API Nomus não encontradas.")
+        logger.error("Variáveis de ambiente da API Nomus não encontradas.")
         return False, {"error": "Configuração do servidor incompleta."}
     
     headers = {'Content-Type': 'application/json', 'Authorization': f'Basic {api_key}'}
     url = f"{base_url.strip('/')}/{endpoint.strip('/')}"
     
-    # --- TRECHO DE DEBUG ADICIONADO ---
-    print(f"\nDEBUG [Nomus API]: Enviando requisição...")
-    print(f"DEBUG [Nomus API]: URL: {url}")
-    print(f"DEBUG [Nomus API]: Método: {method}")
-    # ------------------------------------
+    if method == 'GET':
+        # Pedidos simultâneos ao mesmo endereço partilham uma só chamada à Nomus.
+        return singleflight.group.do(('nomus_get', url), _send_nomus_request, method, url, endpoint, headers, data)
+    return _send_nomus_request(method, url, endpoint, headers, data)
+
+def _send_nomus_request(method, url, endpoint, headers, data):
+    logger.debug("Enviando requisição %s %s", method, url)
     
-    try:
-        response = requests.request(method, url, headers=headers, json=data, timeout=15)
-        response.raise_for_status()
-        
-        # --- TRECHO DE DEBUG ADICIONADO ---
-        print(f"DEBUG [Nomus API]: Resposta recebida com sucesso (Status: {response.status_code}).")
-        # ------------------------------------
-        
-        return True, response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"DEBUG [Nomus API]: ERRO na requisição: {e}")
-        if e.response is not None:
-            print(f"DEBUG [Nomus API]: Resposta de erro do servidor: {e.response.text}")
-        return False, {"error": str(e)}
+    with timed('nomus_api', f"{method} {normalize_endpoint(endpoint)}") as span:
+        try:
+            # Erros de ligação e timeouts contam como falhas no circuit breaker.
+            with guard('nomus').call() as outcome:
+                response = requests.request(method, url, headers=headers, json=data, timeout=15)
+                if response.status_code >= 500:
+                    outcome.fail()
+            response.raise_for_status()
+            logger.debug("Resposta recebida com sucesso (Status: %s).", response.status_code)
+            body = response.json()
+            if method == 'GET':
+                _remember_response(url, body)
+            return True, body
+        except BackendUnavailable as e:
+            logger.debug("Requisição %s %s recusada: %s", method, url, e)
+            span.reject()
+            error = e
+        except requests.exceptions.RequestException as e:
+            logger.error("Erro na requisição %s %s: %s", method, url, e)
+            if e.response is not None:
+                logger.debug("Resposta de erro do servidor: %s", e.response.text)
+                if e.response.status_code < 500:
+                    # Erro do próprio pedido (4xx): a cache não se aplica.
+                    span.fail()
+                    return False, {"error": str(e)}
+            span.fail()
+            error = e
+
+    stale = _stale_response(url) if method == 'GET' else None
+    if stale is not None:
+        logger.warning("Nomus indisponível; a servir a última resposta de %s %s.", method, url)
+        return True, stale
+    return False, {"error": str(error)}
 
 def get_nomus_conta_receber(conta_id):
     """Busca o status de uma conta a receber específica."""
@@ -46,7 +103,7 @@ def get_nomus_conta_receber(conta_id):
 def get_nomus_pessoa(pessoa_id):
     """Busca dados de uma pessoa (cliente, representante, etc.) pelo ID."""
     if not pessoa_id or pessoa_id == 0:
-        print(f"DEBUG [Nomus API]: ID de pessoa inválido ou zero ({pessoa_id}), pulando requisição.")
+        logger.debug("ID de pessoa inválido ou zero (%s), pulando requisição.", pessoa_id)
         return False, {}
     return _make_nomus_request("GET", f"rest/pessoas/{pessoa_id}")
 
@@ -71,6 +128,6 @@ def get_nomus_deliveries(sales_order_id):
 def get_nomus_contas_receber(conta_id):
     """Busca o status de uma conta a receber específica na API Nomus."""
     if not conta_id:
-        print("DEBUG [Nomus API]: ID de conta a receber inválido, pulando requisição de update")
+        logger.debug("ID de conta a receber inválido, pulando requisição de update")
         return False, None
     return _make_nomus_request("GET", f"rest/contasReceber/{conta_id}")
\ No newline at end of file
@@ -0,0 +1,127 @@
+# ==============================================================================
+# ARQUIVO: app/integration_server/utils/order_details.py
+# DESCRIÇÃO: Detalhes dos pedidos guardados fora da blockchain. Nos pedidos
+#              com muitas linhas, a lista de produtos e os metadados do cliente
+#              vão, encriptados, para o IPFS; o registo da orders_stream guarda
+#              apenas um resumo (totais por código), o CID e o hash SHA-256 dos
+#              detalhes. As listagens usam o resumo; os detalhes são obtidos a
+#              pedido e ficam em cache (o conteúdo de um CID nunca muda).
+# VERSÃO: 1.0
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+from . import blockchain_utils, ipfs_utils
+
+logger = logging.getLogger(__name__)
+
+# --- 2. CONSTANTES ---
+# Pedidos com mais linhas do que isto guardam os detalhes fora da blockchain.
+# 0 guarda sempre fora; um valor negativo desativa.
+ORDER_INLINE_MAX_LINES = int(os.getenv('ORDER_INLINE_MAX_LINES', '20'))
+# Campos do registo que seguem para o documento de detalhes.
+DETAIL_FIELDS = ('produtos_solicitados', 'ip_origem')
+# Número de documentos de detalhes mantidos em cache.
+CACHE_SIZE = 256
+
+class OrderDetailsError(RuntimeError):
+    """Os detalhes de um pedido não puderam ser obtidos ou não conferem com o hash."""
+
+# --- 3. RESUMO ---
+
+def summarize(products):
+    """
+    Resumo de uma lista de produtos: número de linhas, quantidade total e
+    quantidade por código de variante.
+    """
+    by_code = {}
+    for product in products:
+        code = product.get('codigo')
+        by_code[code] = by_code.get(code, 0) + int(product.get('quantidade', 0))
+    return {
+        "linhas": len(products),
+        "quantidade_total": sum(by_code.values()),
+        "quantidades_por_codigo": by_code,
+    }
+
+def quantities_by_code(record):
+    """Quantidade por código de um registo de pedido, com ou sem os detalhes inline."""
+    products = record.get('produtos_solicitados')
+    if products:
+        return summarize(products)["quantidades_por_codigo"]
+    summary = record.get('resumo_pedido')
+    return dict(summary.get('quantidades_por_codigo', {})) if summary else None
+
+# --- 4. PUBLICAÇÃO ---
+
+def offload(order_record, key_bytes):
+    """
+    Se o pedido exceder ORDER_INLINE_MAX_LINES linhas, envia os detalhes para
+    o IPFS e devolve o registo compacto a publicar; caso contrário devolve o
+    registo original.
+
+    Raises:
+        OrderDetailsError: Se o envio para o IPFS falhar.
+    """
+    products = order_record.get('produtos_solicitados') or []
+    if ORDER_INLINE_MAX_LINES < 0 or len(products) <= ORDER_INLINE_MAX_LINES:
+        return order_record
+
+    details = {field: order_record[field] for field in DETAIL_FIELDS if field in order_record}
+    details_sha256 = blockchain_utils.content_sha256(details)
+    payload = json.dumps(details, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    cid = ipfs_utils.encrypt_and_add(payload, key_bytes)
+    if not cid:
+        raise OrderDetailsError("Falha ao enviar os detalhes do pedido para o IPFS.")
+
+    compact = {k: v for k, v in order_record.items() if k not in DETAIL_FIELDS}
+    compact.update({
+        "resumo_pedido": summarize(products),
+        "detalhes_ipfs_hash": cid,
+        "detalhes_sha256": details_sha256,
+    })
+    logger.debug("Detalhes do pedido (%d linhas) guardados no IPFS: %s", len(products), cid)
+    return compact
+
+# --- 5. LEITURA A PEDIDO ---
+
+_cache = OrderedDict()  # CID -> detalhes
+_cache_lock = threading.Lock()
+
+def fetch(cid, expected_sha256, key_bytes):
+    """
+    Obtém, desencripta e valida um documento de detalhes.
+
+    Raises:
+        OrderDetailsError: Se não for possível obtê-lo ou o hash não conferir.
+    """
+    with _cache_lock:
+        if cid in _cache:
+            _cache.move_to_end(cid)
+            return _cache[cid]
+    encrypted = ipfs_utils.get_from_ipfs(cid)
+    if encrypted is None:
+        raise OrderDetailsError(f"Detalhes do pedido indisponíveis no IPFS ({cid}).")
+    payload = ipfs_utils.decrypt_data(encrypted, key_bytes)
+    if payload is None:
+        raise OrderDetailsError(f"Falha ao desencriptar os detalhes do pedido ({cid}).")
+    details = json.loads(payload.decode('utf-8'))
+    if expected_sha256 and blockchain_utils.content_sha256(details) != expected_sha256:
+        raise OrderDetailsError(f"Os detalhes do pedido ({cid}) não conferem com o hash registado.")
+    with _cache_lock:
+        _cache[cid] = details
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return details
+
+def expand(order_record, key_bytes):
+    """Devolve o registo do pedido com os detalhes guardados fora da blockchain."""
+    cid = order_record.get('detalhes_ipfs_hash')
+    if not cid or 'produtos_solicitados' in order_record:
+        return order_record
+    details = fetch(cid, order_record.get('detalhes_sha256'), key_bytes)
+    return {**order_record, **details}
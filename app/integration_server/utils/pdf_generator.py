@@ -2,7 +2,7 @@
 # ARQUIVO: app/integration_server/utils/pdf_generator.py
 # DESCRIÇÃO: Módulo auxiliar responsável pela geração de ficheiros PDF para os
 #              pedidos de produtos, incluindo cabeçalho, rodapé e assinatura.
-# VERSÃO: 8.0
+# VERSÃO: 8.1 (Span de latência na geração do PDF)
 # ==============================================================================
 
 # --- 1. IMPORTAÇÕES ---
@@ -11,6 +11,7 @@ import tempfile
 import datetime
 from fpdf import FPDF
 from io import BytesIO
+from ...metrics import instrumented
 
 # --- 2. CONSTANTES E CONFIGURAÇÕES DE CAMINHO ---
 # Constrói o caminho absoluto para a pasta 'static'.
@@ -60,6 +61,7 @@ class PDF(FPDF):
         self.multi_cell(0, 4, 'Este documento é uma solicitação de pedido e não representa uma confirmação de faturamento. O pedido será confirmado pelo setor comercial após análise de estoque e condições comerciais.', 0, 'C')
 
 # --- 4. FUNÇÃO PRINCIPAL DE GERAÇÃO DE PDF ---
+@instrumented('pdf', 'generate_order_pdf')
 def generate_order_pdf(client_info, selected_items, signature_image_bytes):
     """
     Gera o PDF completo de um pedido e retorna o seu conteúdo em bytes.
@@ -0,0 +1,169 @@
+# ==============================================================================
+# ARQUIVO: app/integration_server/utils/previews.py
+# DESCRIÇÃO: Miniaturas (primeira página dos PDFs ou a própria fotografia) das
+#              provas de entrega e dos pedidos guardados no IPFS. Cada miniatura
+#              é gerada uma única vez, em segundo plano, e guardada em disco com
+#              o CID como nome: o conteúdo de um CID nunca muda.
+# VERSÃO: 1.0
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import io
+import os
+import re
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from . import ipfs_utils
+
+logger = logging.getLogger(__name__)
+
+# --- 2. CONSTANTES ---
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+DEFAULT_CACHE_DIR = os.path.join(PROJECT_ROOT, 'instance', 'previews')
+# Largura máxima (px) das miniaturas.
+PREVIEW_WIDTH = int(os.getenv('PREVIEW_WIDTH', '320'))
+PREVIEW_QUALITY = 70
+WORKERS = 2
+
+# Tipo de documento -> variável de ambiente com a chave usada na encriptação.
+DOCUMENT_KEYS = {
+    'delivery': 'DELIVERIES_DECRYPTION_KEY',
+    'order': 'CONTRACT_DECRYPTION_KEY',
+}
+
+# Os CIDs só têm caracteres alfanuméricos; impede caminhos fora da cache.
+CID_PATTERN = re.compile(r'^[A-Za-z0-9]{10,100}$')
+
+class RendererUnavailable(RuntimeError):
+    """Falta a biblioteca opcional necessária para este tipo de documento."""
+
+# --- 3. RENDERIZAÇÃO ---
+
+def render_preview(document_bytes, width=PREVIEW_WIDTH):
+    """
+    Gera a miniatura de um PDF (primeira página) ou de uma imagem.
+
+    Returns:
+        tuple: (bytes da miniatura, mimetype), ou None se não for possível.
+
+    Raises:
+        RendererUnavailable: Se for um PDF e o PyMuPDF não estiver instalado.
+    """
+    from PIL import Image, features
+
+    if document_bytes.startswith(b'%PDF'):
+        try:
+            # PyMuPDF é opcional: sem ele, os PDFs ficam sem miniatura.
+            import fitz
+        except ImportError:
+            raise RendererUnavailable("PyMuPDF não instalado; não é possível gerar miniaturas de PDFs.")
+        with fitz.open(stream=document_bytes, filetype='pdf') as pdf:
+            if pdf.page_count == 0:
+                return None
+            page = pdf[0]
+            zoom = width / page.rect.width
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            image = Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+    else:
+        image = Image.open(io.BytesIO(document_bytes))
+        image.draft('RGB', (width, width * 4))
+        image = image.convert('RGB')
+        image.thumbnail((width, width * 4))
+
+    output = io.BytesIO()
+    if features.check('webp'):
+        image.save(output, format='WEBP', quality=PREVIEW_QUALITY)
+        return output.getvalue(), 'image/webp'
+    image.save(output, format='JPEG', quality=PREVIEW_QUALITY, optimize=True)
+    return output.getvalue(), 'image/jpeg'
+
+# --- 4. CACHE EM DISCO ---
+
+class PreviewCache:
+    """
+    Cache de miniaturas em disco. Os pedidos de miniaturas ainda não geradas
+    agendam a geração num pool de workers e não esperam por ela.
+    """
+    EXTENSIONS = {'image/webp': 'webp', 'image/jpeg': 'jpg'}
+
+    def __init__(self, cache_dir=None, workers=WORKERS):
+        self.cache_dir = cache_dir or os.getenv('PREVIEW_CACHE_DIR', DEFAULT_CACHE_DIR)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preview')
+        self._in_flight = set()
+        # CIDs sem renderizador neste processo; não ficam marcados em disco
+        # para que sejam gerados quando a dependência for instalada.
+        self._unavailable = set()
+        self._lock = threading.Lock()
+
+    def _path(self, cid, extension):
+        return os.path.join(self.cache_dir, f"{cid}.{extension}")
+
+    def lookup(self, cid):
+        """
+        Returns:
+            tuple: (caminho, mimetype) da miniatura em cache, ('failed', None)
+            se não for possível gerá-la, ou None se ainda não existir.
+        """
+        for mimetype, extension in self.EXTENSIONS.items():
+            path = self._path(cid, extension)
+            if os.path.exists(path):
+                return path, mimetype
+        if cid in self._unavailable or os.path.exists(self._path(cid, 'failed')):
+            return 'failed', None
+        return None
+
+    def warm(self, cid, document_type):
+        """Agenda a geração da miniatura, se ainda não existir nem estiver em curso."""
+        if not CID_PATTERN.match(cid or '') or self.lookup(cid) is not None:
+            return
+        with self._lock:
+            if cid in self._in_flight:
+                return
+            self._in_flight.add(cid)
+        self._executor.submit(self._generate, cid, document_type)
+
+    def _generate(self, cid, document_type):
+        try:
+            result = None
+            key = os.getenv(DOCUMENT_KEYS[document_type])
+            encrypted = ipfs_utils.get_from_ipfs(cid)
+            if encrypted is None:
+                # Falha transitória do IPFS: não fica marcada, tenta-se de novo depois.
+                return
+            if not key:
+                logger.warning("Chave %s não configurada; sem miniatura para %s.", DOCUMENT_KEYS[document_type], cid)
+                self._unavailable.add(cid)
+                return
+            document = ipfs_utils.decrypt_data(encrypted, key.encode('utf-8'))
+            if document:
+                try:
+                    result = render_preview(document)
+                except RendererUnavailable as e:
+                    logger.warning("%s", e)
+                    self._unavailable.add(cid)
+                    return
+            if result is None:
+                self._write(self._path(cid, 'failed'), b'')
+            else:
+                preview, mimetype = result
+                self._write(self._path(cid, self.EXTENSIONS[mimetype]), preview)
+                logger.debug("Miniatura de %s gerada (%d bytes).", cid, len(preview))
+        except Exception as e:
+            logger.exception("Falha ao gerar a miniatura de %s: %s", cid, e)
+            self._write(self._path(cid, 'failed'), b'')
+        finally:
+            with self._lock:
+                self._in_flight.discard(cid)
+
+    def _write(self, path, data):
+        # Escrita atómica: um leitor nunca vê uma miniatura incompleta.
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+# Instância única por processo.
+preview_cache = PreviewCache()
@@ -0,0 +1,382 @@
+# ==============================================================================
+# ARQUIVO: app/integration_server/utils/projections.py
+# DESCRIÇÃO: Projeções locais (SQLite) das streams da MultiChain. Um consumidor
+#              dedicado (`python run.py consume`) segue as seis streams da
+#              aplicação pela ordem dos itens, aplica cada item às tabelas de
+#              leitura e guarda o cursor de cada stream na mesma transação, para
+#              retomar exatamente de onde parou após um reinício.
+#              As rotas leem destas tabelas quando READ_MODEL=projections.
+# VERSÃO: 1.4 (Inventário por contrato)
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import os
+import json
+import time
+import logging
+import sqlite3
+from contextlib import closing
+from . import blockchain_utils
+from .contracts import DEFAULT_CONTRACT_ID, contract_of
+from .stream_index import StreamTail, encode_cursor, decode_cursor
+from .inventory_service import apply_record as apply_inventory_record
+
+logger = logging.getLogger(__name__)
+
+# --- 2. CONSTANTES ---
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+DEFAULT_DB_PATH = os.path.join(PROJECT_ROOT, 'instance', 'projections.sqlite3')
+
+# As mesmas seis streams de STREAMS_TO_CREATE (utils/first_initialization.py).
+PROJECTED_STREAMS = [
+    'config_stream', 'inventory_stream', 'financial_stream',
+    'orders_stream', 'deliveries_stream', 'notes_stream'
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cursors (
+    stream TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS config (
+    key TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS orders (
+    key TEXT PRIMARY KEY,
+    data_hora_utc TEXT NOT NULL DEFAULT '',
+    status TEXT,
+    cnpj TEXT,
+    order_txid TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_by_time ON orders (data_hora_utc, key);
+CREATE INDEX IF NOT EXISTS orders_by_txid ON orders (order_txid);
+CREATE TABLE IF NOT EXISTS inventory (
+    contract_id TEXT NOT NULL,
+    product_code TEXT NOT NULL,
+    key TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (contract_id, product_code)
+);
+CREATE TABLE IF NOT EXISTS installments (
+    key TEXT PRIMARY KEY,
+    id_nomus TEXT,
+    paid INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    key TEXT PRIMARY KEY,
+    delivery_id TEXT,
+    status TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS notes (
+    seq INTEGER PRIMARY KEY,
+    key TEXT,
+    target_role TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notes_by_role ON notes (target_role, seq);
+"""
+
+# --- 3. LIGAÇÃO À BASE DE DADOS ---
+
+def get_db_path():
+    return os.getenv('PROJECTIONS_DB_PATH', DEFAULT_DB_PATH)
+
+def projections_enabled():
+    """As rotas leem das projeções apenas quando READ_MODEL=projections."""
+    return os.getenv('READ_MODEL', 'chain').lower() == 'projections'
+
+_initialized_paths = set()
+
+def connect(db_path=None):
+    """Abre uma ligação à base de projeções, criando o esquema na primeira vez."""
+    db_path = db_path or get_db_path()
+    if db_path not in _initialized_paths:
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    if db_path not in _initialized_paths:
+        # WAL permite que as rotas leiam enquanto o consumidor escreve.
+        conn.execute('PRAGMA journal_mode=WAL')
+        _migrate(conn)
+        conn.executescript(SCHEMA)
+        _initialized_paths.add(db_path)
+    return conn
+
+def _migrate(conn):
+    """
+    Adapta uma base criada por uma versão anterior do esquema. A tabela de
+    inventário sem 'contract_id' (um inventário global) é recriada e a
+    inventory_stream volta a ser lida desde o início.
+    """
+    columns = [row['name'] for row in conn.execute('PRAGMA table_info(inventory)')]
+    if columns and 'contract_id' not in columns:
+        with conn:
+            conn.execute('DROP TABLE inventory')
+            conn.execute("DELETE FROM cursors WHERE stream = 'inventory_stream'")
+        logger.info("Projeção do inventário recriada por contrato.")
+
+# --- 4. APLICAÇÃO DOS ITENS ÀS PROJEÇÕES ---
+
+def _dump(data):
+    return json.dumps(data, ensure_ascii=False)
+
+def _merged(conn, table, key, data):
+    """Funde o item com o registo atual da chave (as atualizações são deltas)."""
+    row = conn.execute(f'SELECT data FROM {table} WHERE key = ?', (key,)).fetchone()
+    previous = json.loads(row['data']) if row else None
+    return {**blockchain_utils.merge_record(previous, data), 'key': key}
+
+def _apply_config(conn, position, key, data):
+    record = _merged(conn, 'config', key, data)
+    record.pop('key')
+    conn.execute('INSERT OR REPLACE INTO config (key, data) VALUES (?, ?)', (key, _dump(record)))
+
+def _apply_inventory(conn, position, key, data):
+    # O inventário é indexado por contrato e product_code; snapshots
+    # substituem o registo e deltas de consumo são somados, como no
+    # inventory_service. Os registos sem contrato são do contrato padrão.
+    product_code = data.get('product_code')
+    if not product_code:
+        return
+    contract_id = contract_of(data)
+    row = conn.execute('SELECT data FROM inventory WHERE contract_id = ? AND product_code = ?',
+                       (contract_id, product_code)).fetchone()
+    state = {product_code: json.loads(row['data'])} if row else {}
+    apply_inventory_record(state, data)
+    conn.execute('INSERT OR REPLACE INTO inventory (contract_id, product_code, key, data) VALUES (?, ?, ?, ?)',
+                 (contract_id, product_code, key, _dump({**state[product_code], 'contract_id': contract_id})))
+
+def _apply_financial(conn, position, key, data):
+    record = _merged(conn, 'installments', key, data)
+    conn.execute('INSERT OR REPLACE INTO installments (key, id_nomus, paid, data) VALUES (?, ?, ?, ?)',
+                 (key, str(record.get('id_nomus', '')), int(bool(record.get('paid'))), _dump(record)))
+
+def _apply_order(conn, position, key, data):
+    record = _merged(conn, 'orders', key, data)
+    conn.execute('INSERT OR REPLACE INTO orders (key, data_hora_utc, status, cnpj, order_txid, data) '
+                 'VALUES (?, ?, ?, ?, ?, ?)',
+                 (key, record.get('data_hora_utc') or '', record.get('status'), record.get('cnpj'),
+                  record.get('order_txid'), _dump(record)))
+
+def _apply_delivery(conn, position, key, data):
+    record = _merged(conn, 'deliveries', key, data)
+    conn.execute('INSERT OR REPLACE INTO deliveries (key, delivery_id, status, data) VALUES (?, ?, ?, ?)',
+                 (key, str(record.get('delivery_id', '')), record.get('status'), _dump(record)))
+
+def _apply_note(conn, position, key, data):
+    inner = data.get('data')
+    note = inner if isinstance(inner, dict) else data
+    # A chave identifica a nota: uma nota republicada (ex: na partição do
+    # contrato, por utils/partition_contracts.py) substitui a anterior, como
+    # no NotesIndex de stream_index.
+    conn.execute('DELETE FROM notes WHERE key = ? AND seq <> ?', (key, position))
+    conn.execute('INSERT OR REPLACE INTO notes (seq, key, target_role, data) VALUES (?, ?, ?, ?)',
+                 (position, key, note.get('target_role'), _dump({**note, 'key': key, 'seq': position})))
+
+APPLIERS = {
+    'config_stream': _apply_config,
+    'inventory_stream': _apply_inventory,
+    'financial_stream': _apply_financial,
+    'orders_stream': _apply_order,
+    'deliveries_stream': _apply_delivery,
+    'notes_stream': _apply_note,
+}
+
+# --- 5. CONSUMIDOR ---
+
+class ProjectionConsumer:
+    """
+    Segue as streams e mantém as projeções. Cada lote lido de uma stream é
+    aplicado numa única transação, juntamente com o novo cursor.
+    """
+    def __init__(self, db_path=None, streams=PROJECTED_STREAMS):
+        self.conn = connect(db_path)
+        self.tails = {}
+        for stream_name in streams:
+            row = self.conn.execute('SELECT position FROM cursors WHERE stream = ?', (stream_name,)).fetchone()
+            self.tails[stream_name] = StreamTail(stream_name, start=row['position'] if row else 0)
+
+    def run_once(self):
+        """Aplica todos os itens pendentes de todas as streams. Retorna quantos foram aplicados."""
+        applied = 0
+        for stream_name, tail in self.tails.items():
+            start = tail.cursor
+            items = tail.poll()
+            if not items:
+                continue
+            apply = APPLIERS[stream_name]
+            try:
+                with self.conn:
+                    for position, keys, data, _ in items:
+                        if not isinstance(data, dict):
+                            continue
+                        for key in blockchain_utils.record_keys(keys):
+                            apply(self.conn, position, key, data)
+                    self.conn.execute('INSERT OR REPLACE INTO cursors (stream, position) VALUES (?, ?)',
+                                      (stream_name, tail.cursor))
+            except sqlite3.Error:
+                # A transação foi revertida: volta a ler o mesmo lote na próxima volta.
+                tail.cursor = start
+                raise
+            applied += len(items)
+            logger.info("Projeção '%s' atualizada: %d itens (cursor %d).", stream_name, len(items), tail.cursor)
+        return applied
+
+    def run_forever(self, poll_interval=2.0):
+        logger.info("Consumidor de projeções iniciado (%s).", get_db_path())
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.exception("Erro ao atualizar as projeções: %s", e)
+            time.sleep(poll_interval)
+
+# --- 6. LEITURA DAS PROJEÇÕES ---
+
+# Filtro por contrato; os registos sem 'contract_id' são do contrato padrão.
+CONTRACT_CLAUSE = "COALESCE(json_extract(data, '$.contract_id'), ?) = ?"
+
+def _contract_filter(contract_id):
+    """(cláusulas, parâmetros) que restringem uma consulta a um contrato."""
+    if contract_id is None:
+        return [], []
+    return [CONTRACT_CLAUSE], [DEFAULT_CONTRACT_ID, contract_id]
+
+class ProjectionReader:
+    """
+    Leitura das projeções com a mesma interface das funções de leitura de
+    blockchain_utils, para que as rotas possam usar uma ou outra fonte.
+    """
+    TABLES = {
+        'config_stream': 'config',
+        'inventory_stream': 'inventory',
+        'financial_stream': 'installments',
+        'orders_stream': 'orders',
+        'deliveries_stream': 'deliveries',
+        'notes_stream': 'notes',
+    }
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path
+
+    def _query(self, sql, params=()):
+        with closing(connect(self.db_path)) as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def get_all_items_from_stream(self, stream_name):
+        rows = self._query(f'SELECT data FROM {self.TABLES[stream_name]}')
+        return [json.loads(row['data']) for row in rows]
+
+    def get_partition_items(self, stream_name, contract_id):
+        clauses, params = _contract_filter(contract_id)
+        rows = self._query(f"SELECT data FROM {self.TABLES[stream_name]} WHERE {clauses[0]}", params)
+        return [json.loads(row['data']) for row in rows]
+
+    def get_latest_stream_state(self, stream_name, key_field="product_code"):
+        return {item[key_field]: item for item in self.get_all_items_from_stream(stream_name) if key_field in item}
+
+    def get_key_state(self, stream_name, key, item_count=None):
+        # As projeções já guardam o estado fundido de cada chave.
+        return self.get_last_item_from_stream_key(stream_name, key)
+
+    def get_last_item_from_stream_key(self, stream_name, key):
+        table = self.TABLES[stream_name]
+        rows = self._query(f'SELECT data FROM {table} WHERE key = ? ORDER BY rowid DESC LIMIT 1', (key,))
+        if not rows:
+            return None
+        data = json.loads(rows[0]['data'])
+        # Tal como na leitura da blockchain, o item é retornado sem a chave.
+        data.pop('key', None)
+        return data
+
+class OrdersProjection:
+    """
+    Equivalente ao OrdersIndex de stream_index, servido pela tabela 'orders'.
+    Com `contract_id`, apenas os pedidos desse contrato.
+    """
+    def __init__(self, contract_id=None, db_path=None):
+        self.contract_id = contract_id
+        self.reader = ProjectionReader(db_path)
+
+    def _select(self, columns, clauses=(), params=(), suffix=''):
+        contract_clauses, contract_params = _contract_filter(self.contract_id)
+        clauses = [*clauses, *contract_clauses]
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        return self.reader._query(f'SELECT {columns} FROM orders {where} {suffix}', (*params, *contract_params))
+
+    def key_for_txid(self, order_txid):
+        rows = self._select('key', ['order_txid = ?'], [order_txid], 'LIMIT 1')
+        return rows[0]['key'] if rows else None
+
+    def get(self, key):
+        rows = self._select('data', ['key = ?'], [key])
+        return json.loads(rows[0]['data']) if rows else None
+
+    def all_sorted(self):
+        rows = self._select('data', suffix='ORDER BY data_hora_utc DESC, key DESC')
+        return [json.loads(row['data']) for row in rows]
+
+    def page(self, limit, cursor=None, status=None, cnpj=None, date_from=None, date_to=None):
+        clauses, params = [], []
+        if cursor:
+            clauses.append('(data_hora_utc, key) < (?, ?)')
+            params.extend(decode_cursor(cursor))
+        if status:
+            clauses.append('status = ?')
+            params.append(status)
+        if cnpj:
+            clauses.append('cnpj = ?')
+            params.append(cnpj)
+        if date_from:
+            clauses.append('data_hora_utc >= ?')
+            params.append(date_from)
+        if date_to:
+            clauses.append('data_hora_utc <= ?')
+            params.append(date_to + '\uffff')
+        rows = self._select('data_hora_utc, key, data', clauses, params,
+                            f'ORDER BY data_hora_utc DESC, key DESC LIMIT {int(limit) + 1}')
+        items = [json.loads(row['data']) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor([last['data_hora_utc'], last['key']])
+        return items, next_cursor
+
+class NotesProjection:
+    """
+    Equivalente ao NotesIndex de stream_index, servido pela tabela 'notes'.
+    Com `contract_id`, apenas as notas desse contrato.
+    """
+    def __init__(self, contract_id=None, db_path=None):
+        self.contract_id = contract_id
+        self.reader = ProjectionReader(db_path)
+
+    def feed(self, role=None, since=None, limit=None):
+        clauses, params = _contract_filter(self.contract_id)
+        if role is not None:
+            clauses.append('target_role = ?')
+            params.append(role)
+        if since is not None:
+            clauses.append('seq > ?')
+            params.append(since)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        # Sem 'since', as mais recentes; o resultado é sempre da mais antiga para a mais recente.
+        order = 'ASC' if since is not None else 'DESC'
+        limit_sql = ' LIMIT ?' if limit else ''
+        if limit:
+            params.append(limit)
+        rows = self.reader._query(f'SELECT seq, data FROM notes {where} ORDER BY seq {order}{limit_sql}', params)
+        if order == 'DESC':
+            rows = list(reversed(rows))
+        notes = [json.loads(row['data']) for row in rows]
+        if notes:
+            cursor = notes[-1]['seq']
+        elif since is not None:
+            cursor = since
+        else:
+            cursor = -1
+        return notes, cursor
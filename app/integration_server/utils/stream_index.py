@@ -0,0 +1,344 @@
+# ==============================================================================
+# ARQUIVO: app/integration_server/utils/stream_index.py
+# DESCRIÇÃO: Índices em memória mantidos incrementalmente a partir das streams
+#              da MultiChain. Em vez de listar todas as chaves e buscar o último
+#              item de cada uma a cada requisição, os índices seguem a stream a
+#              partir de um cursor e aplicam apenas os itens novos.
+# VERSÃO: 1.4 (Feed de notas por contrato com posições globais da stream)
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import os
+import json
+import time
+import base64
+import bisect
+import logging
+import threading
+from . import blockchain_utils
+from .contracts import contract_of
+
+logger = logging.getLogger(__name__)
+
+# --- 2. CONSTANTES ---
+# Intervalo mínimo entre consultas à blockchain feitas pelo mesmo índice.
+REFRESH_INTERVAL_SECONDS = float(os.getenv('STREAM_INDEX_REFRESH_SECONDS', '2'))
+# Número de itens lidos por chamada a 'liststreamitems'.
+BATCH_SIZE = 500
+
+# --- 3. LEITURA INCREMENTAL ---
+
+class StreamTail:
+    """
+    Segue uma stream a partir de um cursor (a posição do próximo item a ler).
+    Com `key`, segue apenas os itens dessa chave (ex: a partição de um contrato).
+    """
+    def __init__(self, stream_name, start=0, batch_size=BATCH_SIZE, key=None):
+        self.stream_name = stream_name
+        self.cursor = start
+        self.batch_size = batch_size
+        self.key = key
+
+    def _list(self):
+        if self.key is None:
+            return blockchain_utils.list_stream_items(self.stream_name, self.cursor, self.batch_size)
+        return blockchain_utils.list_stream_key_items(self.stream_name, self.key, self.cursor, self.batch_size)
+
+    def poll(self):
+        """
+        Lê todos os itens publicados desde a última chamada e avança o cursor.
+
+        Returns:
+            list: Tuplos (posição, chaves, dados descodificados, item bruto).
+        """
+        new_items = []
+        while True:
+            items = self._list()
+            if not items:
+                break
+            for item in items:
+                new_items.append((self.cursor, blockchain_utils.get_item_keys(item),
+                                  blockchain_utils.decode_item_data(item), item))
+                self.cursor += 1
+            if len(items) < self.batch_size:
+                break
+        return new_items
+
+# --- 4. ÍNDICES BASE ---
+
+class TailedIndex:
+    """
+    Base dos índices que seguem uma stream: cada item novo é entregue uma única
+    vez a `_apply`, e a blockchain é consultada no máximo uma vez por intervalo.
+    Com `partition` (o ID de um contrato), o índice lê apenas a partição desse
+    contrato.
+    """
+    def __init__(self, stream_name, refresh_interval=REFRESH_INTERVAL_SECONDS, partition=None):
+        self.stream_name = stream_name
+        self.refresh_interval = refresh_interval
+        self.partition = partition
+        key = blockchain_utils.partition_key(partition) if partition is not None else None
+        self._tail = StreamTail(stream_name, key=key)
+        self._last_refresh = 0.0
+        self._lock = threading.RLock()
+
+    def refresh(self, force=False):
+        """Aplica os itens novos da stream, no máximo uma vez por intervalo."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_refresh < self.refresh_interval:
+                return
+            for position, keys, data, item in self._tail.poll():
+                if isinstance(data, dict):
+                    self._apply(position, keys, data, item)
+            self._last_refresh = now
+
+    def _apply(self, position, keys, data, item):
+        raise NotImplementedError
+
+class LatestStateIndex(TailedIndex):
+    """
+    Mantém o estado atual de cada chave de uma stream (a fusão de todos os
+    itens publicados com essa chave, ver `blockchain_utils.merge_record`), tal
+    como `get_all_items_from_stream`, mas atualizado de forma incremental.
+    """
+    def __init__(self, stream_name, **kwargs):
+        super().__init__(stream_name, **kwargs)
+        self._state = {}
+
+    def _apply(self, position, keys, data, item):
+        for key in blockchain_utils.record_keys(keys):
+            previous = self._state.get(key)
+            record = {**blockchain_utils.merge_record(previous, data), 'key': key}
+            self._state[key] = record
+            self._on_update(key, previous, record)
+
+    def _on_update(self, key, previous, record):
+        """Gancho para subclasses manterem índices secundários."""
+
+    def get(self, key):
+        self.refresh()
+        with self._lock:
+            return self._state.get(key)
+
+    def values(self):
+        self.refresh()
+        with self._lock:
+            return list(self._state.values())
+
+class PartitionedIndex:
+    """
+    Um índice por contrato, criado no primeiro acesso. Cada índice segue só a
+    partição do seu contrato: o custo de uma consulta depende dos dados desse
+    contrato e não do histórico de todos.
+
+    Uso:
+        orders_for = PartitionedIndex(OrdersIndex, 'orders_stream')
+        orders_for('contract_v1').page(50)
+    """
+    def __init__(self, index_class, stream_name, **kwargs):
+        self.index_class = index_class
+        self.stream_name = stream_name
+        self.kwargs = kwargs
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, contract_id):
+        with self._lock:
+            index = self._indexes.get(contract_id)
+            if index is None:
+                index = self._indexes[contract_id] = self.index_class(
+                    self.stream_name, partition=contract_id, **self.kwargs)
+            return index
+
+# --- 5. ÍNDICE DE PEDIDOS ORDENADO POR DATA ---
+
+class InvalidCursor(ValueError):
+    """O cursor de paginação recebido não é válido."""
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        if not (isinstance(position, list) and len(position) == 2 and all(isinstance(p, str) for p in position)):
+            raise ValueError(position)
+        return tuple(position)
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor(f"Cursor de paginação inválido: {cursor}") from e
+
+class OrdersIndex(LatestStateIndex):
+    """
+    Índice dos pedidos ordenado por (data_hora_utc, chave), com um mapa
+    secundário order_txid -> chave. A ordenação é mantida a cada atualização
+    (bisect), pelo que as listagens não precisam de reordenar o histórico.
+    """
+    def __init__(self, stream_name='orders_stream', **kwargs):
+        super().__init__(stream_name, **kwargs)
+        self._positions = []  # [(data_hora_utc, chave)] em ordem crescente
+        self._by_txid = {}
+
+    @staticmethod
+    def _position(record):
+        return (record.get('data_hora_utc') or '', record['key'])
+
+    def _on_update(self, key, previous, record):
+        if previous is not None:
+            old = self._position(previous)
+            i = bisect.bisect_left(self._positions, old)
+            if i < len(self._positions) and self._positions[i] == old:
+                del self._positions[i]
+            if previous.get('order_txid'):
+                self._by_txid.pop(previous['order_txid'], None)
+        bisect.insort(self._positions, self._position(record))
+        if record.get('order_txid'):
+            self._by_txid[record['order_txid']] = key
+
+    def key_for_txid(self, order_txid):
+        """Retorna a chave da stream do pedido com o txid indicado, ou None."""
+        self.refresh()
+        with self._lock:
+            return self._by_txid.get(order_txid)
+
+    def all_sorted(self):
+        """Todos os pedidos, do mais recente para o mais antigo."""
+        self.refresh()
+        with self._lock:
+            return [self._state[key] for _, key in reversed(self._positions)]
+
+    def page(self, limit, cursor=None, status=None, cnpj=None, date_from=None, date_to=None):
+        """
+        Retorna uma página de pedidos, do mais recente para o mais antigo.
+
+        Args:
+            limit (int): O número máximo de pedidos na página.
+            cursor (str): O cursor opaco devolvido pela página anterior.
+            status (str): Filtra pelo status exato do pedido.
+            cnpj (str): Filtra pelo CNPJ do cliente.
+            date_from (str): Data/hora ISO mínima (inclusiva) de data_hora_utc.
+            date_to (str): Data/hora ISO máxima (inclusiva) de data_hora_utc.
+
+        Returns:
+            tuple: (lista de pedidos, cursor da próxima página ou None).
+        """
+        self.refresh()
+        with self._lock:
+            upper = len(self._positions)
+            if cursor:
+                upper = bisect.bisect_left(self._positions, decode_cursor(cursor))
+            if date_to:
+                # '\uffff' garante que datas com o mesmo prefixo (ex: só o dia) são incluídas.
+                upper = min(upper, bisect.bisect_right(self._positions, (date_to + '\uffff',)))
+
+            items, last_position, next_cursor = [], None, None
+            for i in range(upper - 1, -1, -1):
+                position = self._positions[i]
+                if date_from and position[0] < date_from:
+                    break
+                record = self._state[position[1]]
+                if status and record.get('status') != status:
+                    continue
+                if cnpj and record.get('cnpj') != cnpj:
+                    continue
+                if len(items) == limit:
+                    next_cursor = encode_cursor(list(last_position))
+                    break
+                items.append(record)
+                last_position = position
+            return items, next_cursor
+
+# --- 6. ÍNDICE DE NOTIFICAÇÕES POR PERFIL ---
+
+class NotesIndex(TailedIndex):
+    """
+    Feed de notificações da notes_stream, particionado por contrato e por
+    'target_role'. Cada item publicado é uma notificação; o cursor do feed é a
+    posição do item na stream inteira (a mesma das projeções e do 'seq' dos
+    eventos SSE), pelo que um cliente pode pedir apenas o que é novo com
+    qualquer uma das fontes. Por isso o índice segue a stream inteira, e não
+    a partição de cada contrato, cujas posições são relativas à partição.
+    A chave identifica a nota: uma nota republicada com a mesma chave
+    substitui a anterior, tal como na projeção 'notes'.
+    """
+    def __init__(self, stream_name='notes_stream', **kwargs):
+        super().__init__(stream_name, **kwargs)
+        # (contrato, perfil) -> ([posições], [notas]), em ordem crescente; None
+        # em qualquer dos dois é o feed de todos.
+        self._feeds = {}
+        self._by_key = {}   # chave -> nota atual
+
+    @staticmethod
+    def _note_payload(data):
+        # Registos antigos guardavam a nota dentro de um campo 'data'.
+        inner = data.get('data')
+        return inner if isinstance(inner, dict) else data
+
+    @staticmethod
+    def _feed_keys(note):
+        contract_id, role = contract_of(note), note.get('target_role')
+        return {(contract_id, role), (contract_id, None), (None, role), (None, None)}
+
+    def _apply(self, position, keys, data, item):
+        keys = blockchain_utils.record_keys(keys)
+        note = {**self._note_payload(data), 'key': keys[0] if keys else None, 'seq': position}
+        if note['key'] is not None:
+            previous = self._by_key.get(note['key'])
+            if previous is not None:
+                self._remove(previous)
+            self._by_key[note['key']] = note
+        for feed_key in self._feed_keys(note):
+            positions, notes = self._feeds.setdefault(feed_key, ([], []))
+            positions.append(position)
+            notes.append(note)
+
+    def _remove(self, note):
+        for feed_key in self._feed_keys(note):
+            positions, notes = self._feeds.get(feed_key, ([], []))
+            index = bisect.bisect_left(positions, note['seq'])
+            if index < len(positions) and positions[index] == note['seq']:
+                del positions[index]
+                del notes[index]
+
+    def feed(self, role=None, since=None, limit=None, contract_id=None):
+        """
+        Retorna as notificações de um perfil (ou de todos, se role for None).
+
+        Args:
+            role (str): O 'target_role' das notificações.
+            since (int): Retorna apenas as notas com posição maior que este cursor,
+                da mais antiga para a mais recente.
+            limit (int): O número máximo de notas. Sem 'since', retorna as mais recentes.
+            contract_id (str): Apenas as notas deste contrato (None: todas).
+
+        Returns:
+            tuple: (lista de notas, cursor para o próximo pedido incremental).
+        """
+        self.refresh()
+        with self._lock:
+            positions, notes = self._feeds.get((contract_id, role), ([], []))
+            if since is not None:
+                start = bisect.bisect_right(positions, since)
+                selected = notes[start:start + limit] if limit else notes[start:]
+            else:
+                selected = notes[-limit:] if limit else list(notes)
+            # Como em NotesProjection.feed: a última nota devolvida, o próprio
+            # 'since' se não houver novas, ou -1.
+            if selected:
+                cursor = selected[-1]['seq']
+            else:
+                cursor = since if since is not None else -1
+            return selected, cursor
+
+    def for_contract(self, contract_id):
+        """Vista do feed restrita a um contrato, com a interface de NotesProjection."""
+        return ContractNotes(self, contract_id)
+
+class ContractNotes:
+    """As notas de um contrato num NotesIndex partilhado por todos os contratos."""
+    def __init__(self, index, contract_id):
+        self.index = index
+        self.contract_id = contract_id
+
+    def feed(self, role=None, since=None, limit=None):
+        return self.index.feed(role, since, limit, contract_id=self.contract_id)
@@ -0,0 +1,108 @@
+# ==============================================================================
+# ARQUIVO: app/logging_config.py
+# DESCRIÇÃO: Configuração centralizada do logging da aplicação. Os registos são
+#              colocados numa fila (QueueHandler) e escritos por uma thread
+#              dedicada (QueueListener), fora da thread que atende a requisição.
+# VERSÃO: 1.1 (Listener recriado nos processos filhos de um fork)
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import os
+import sys
+import queue
+import atexit
+import logging
+import logging.handlers
+
+# --- 2. CONSTANTES ---
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(name)s] %(message)s'
+
+# Nomes curtos aceites em LOG_LEVELS para cada subsistema da aplicação.
+SUBSYSTEM_LOGGERS = {
+    'auth': 'app.auth_server',
+    'request': 'app.request_server',
+    'integration': 'app.integration_server',
+    'blockchain': 'app.integration_server.utils.blockchain_utils',
+    'nomus': 'app.integration_server.utils.nomus_api',
+    'ipfs': 'app.integration_server.utils.ipfs_utils',
+    'database': 'app.integration_server.utils.database_utils',
+    'resilience': 'app.resilience',
+    'init': 'utils.first_initialization',
+}
+
+_listener = None
+
+# --- 3. HANDLER DA FILA ---
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que não formata a mensagem na thread de origem. O
+    QueueHandler padrão aplica `msg % args` antes de enfileirar; como a fila é
+    interna ao processo, o registo pode seguir intacto e ser formatado apenas
+    pela thread do QueueListener.
+    """
+    def prepare(self, record):
+        return record
+
+# --- 4. FUNÇÕES DE CONFIGURAÇÃO ---
+
+def parse_subsystem_levels(spec):
+    """
+    Interpreta a variável LOG_LEVELS (ex: "blockchain=DEBUG,nomus=WARNING").
+
+    Returns:
+        dict: Nome completo do logger -> nível (str).
+    """
+    levels = {}
+    for entry in (spec or '').split(','):
+        if '=' not in entry:
+            continue
+        name, level = (part.strip() for part in entry.split('=', 1))
+        if name and level:
+            levels[SUBSYSTEM_LOGGERS.get(name, name)] = level.upper()
+    return levels
+
+def setup_logging(fmt=LOG_FORMAT):
+    """
+    Configura o logger raiz com um QueueHandler e inicia o QueueListener que
+    escreve no stderr. É idempotente: chamadas repetidas não duplicam handlers.
+
+    Variáveis de ambiente:
+        LOG_LEVEL: Nível global (padrão: INFO).
+        LOG_LEVELS: Níveis por subsistema (ex: "blockchain=DEBUG,nomus=WARNING").
+    """
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(fmt))
+    _start_listener(stream_handler)
+
+    root = logging.getLogger()
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+    for logger_name, level in parse_subsystem_levels(os.getenv('LOG_LEVELS')).items():
+        logging.getLogger(logger_name).setLevel(level)
+
+def _start_listener(handler):
+    """Cria a fila, inicia a thread que a esvazia e liga o logger raiz à fila."""
+    global _listener
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    logging.getLogger().handlers[:] = [DeferredQueueHandler(log_queue)]
+
+def _restart_after_fork():
+    """
+    Num processo criado por fork (ex: worker do gunicorn com --preload) só
+    existe a thread que chamou o fork: a do listener ficou no processo pai.
+    Recria a fila e o listener, com o mesmo handler.
+    """
+    if _listener is None:
+        return
+    atexit.unregister(_listener.stop)
+    _start_listener(_listener.handlers[0])
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
@@ -0,0 +1,323 @@
+# ==============================================================================
+# ARQUIVO: app/metrics.py
+# DESCRIÇÃO: Instrumentação de latência por etapa (spans) do caminho crítico.
+#              Os tempos são agregados em histogramas em memória e expostos no
+#              formato de texto do Prometheus pela rota /metrics.
+#
+#              Com vários processos (workers do gunicorn), cada um escreve
+#              periodicamente o seu estado num ficheiro de METRICS_MULTIPROC_DIR
+#              e a rota /metrics, servida por qualquer worker, soma os ficheiros
+#              de todos: as séries não saltam nem recomeçam de scrape para scrape.
+# VERSÃO: 2.0 (Agregação entre processos; contadores e gauges registados aqui)
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import os
+import re
+import json
+import time
+import atexit
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+# --- 2. CONSTANTES ---
+# Limites (em segundos) dos buckets dos histogramas. Cobrem desde operações
+# locais (criptografia, PDF) até chamadas lentas à Nomus e à MultiChain.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_METRIC = 'contract_api_stage_duration_seconds'
+STAGE_HELP = 'Duração das etapas do caminho crítico (RPC, Nomus, IPFS, criptografia, PDF).'
+HTTP_METRIC = 'contract_api_http_request_duration_seconds'
+HTTP_HELP = 'Duração das requisições HTTP por rota.'
+
+# Diretório partilhado pelos processos (vazio: métricas apenas do processo).
+# Deve ser limpo ao arrancar o servidor (`run.py production` fá-lo).
+MULTIPROC_DIR_ENV = 'METRICS_MULTIPROC_DIR'
+# Intervalo mínimo entre escritas do estado de um processo no diretório.
+FLUSH_INTERVAL_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '1'))
+
+# Métricas registadas, pela ordem de criação.
+_registry = []
+
+# --- 3. MÉTRICAS ---
+
+class Histogram:
+    """
+    Histograma cumulativo no estilo Prometheus, com uma série por conjunto de labels.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, seconds, *label_values):
+        """Regista uma observação (em segundos) na série dos labels indicados."""
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, upper in enumerate(self.buckets):
+                if seconds <= upper:
+                    series["counts"][i] += 1
+            series["sum"] += seconds
+            series["count"] += 1
+        flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: {"counts": list(s["counts"]), "sum": s["sum"], "count": s["count"]}
+                    for labels, s in self._series.items()}
+
+    @staticmethod
+    def merge(total, series):
+        if total is None:
+            return {"counts": list(series["counts"]), "sum": series["sum"], "count": series["count"]}
+        total["counts"] = [a + b for a, b in zip(total["counts"], series["counts"])]
+        total["sum"] += series["sum"]
+        total["count"] += series["count"]
+        return total
+
+    def render(self, snapshot):
+        """Gera as linhas de texto do Prometheus para este histograma."""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(snapshot.items()):
+            base_labels = _labels(self.label_names, label_values)
+            sep = "," if base_labels else ""
+            for upper, count in zip(self.buckets, series["counts"]):
+                lines.append(f'{self.name}_bucket{{{base_labels}{sep}le="{upper}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{base_labels}{sep}le="+Inf"}} {series["count"]}')
+            lines.append(f'{self.name}_sum{{{base_labels}}} {series["sum"]:.6f}')
+            lines.append(f'{self.name}_count{{{base_labels}}} {series["count"]}')
+        return lines
+
+class Counter:
+    """Contador monótono com uma série por conjunto de labels."""
+    kind = 'counter'
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+        flush()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(total, value):
+        return value if total is None else total + value
+
+    def render(self, snapshot):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(snapshot.items()):
+            lines.append(f'{self.name}{{{_labels(self.label_names, label_values)}}} {value}')
+        return lines
+
+class Gauge:
+    """
+    Valor instantâneo, lido por `collect()` (labels -> valor) no momento do
+    scrape. Entre processos não há soma: cada processo vivo é uma série,
+    distinguida pelo label 'pid'.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, label_names, collect):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.collect = collect
+        _registry.append(self)
+
+    def snapshot(self):
+        return {tuple(labels): value for labels, value in self.collect().items()}
+
+    def render(self, snapshot):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        label_names = self.label_names + ('pid',) if _multiproc_dir() else self.label_names
+        for label_values, value in sorted(snapshot.items()):
+            lines.append(f'{self.name}{{{_labels(label_names, label_values)}}} {value}')
+        return lines
+
+def _labels(names, values):
+    return ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+def _escape(value):
+    """Escapa um valor de label conforme o formato de texto do Prometheus."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+STAGE_HISTOGRAM = Histogram(STAGE_METRIC, STAGE_HELP, ('stage', 'operation', 'outcome'))
+HTTP_HISTOGRAM = Histogram(HTTP_METRIC, HTTP_HELP, ('endpoint', 'method', 'status'))
+
+# --- 4. SPANS DE TEMPO ---
+
+class Span:
+    """Resultado mutável de um span; permite marcar a etapa como falhada."""
+    def __init__(self):
+        self.outcome = 'ok'
+
+    def fail(self):
+        self.outcome = 'error'
+
+    def reject(self):
+        # Chamada recusada sem contactar o backend (ver app/resilience.py).
+        self.outcome = 'rejected'
+
+@contextmanager
+def timed(stage, operation):
+    """
+    Mede a duração de um bloco e regista-a no histograma de etapas.
+
+    Args:
+        stage (str): A etapa instrumentada (ex: 'multichain_rpc', 'ipfs').
+        operation (str): A operação dentro da etapa (ex: o método RPC, 'add').
+
+    Uso:
+        with timed('multichain_rpc', method) as span:
+            ...
+            if erro: span.fail()
+    """
+    span = Span()
+    start = time.perf_counter()
+    try:
+        yield span
+    except Exception:
+        span.fail()
+        raise
+    finally:
+        STAGE_HISTOGRAM.observe(time.perf_counter() - start, stage, operation, span.outcome)
+
+def instrumented(stage, operation):
+    """Decorator equivalente a `timed` para funções inteiras."""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            with timed(stage, operation):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def normalize_endpoint(endpoint):
+    """
+    Substitui identificadores numéricos por '{id}' para que o número de séries
+    não cresça com cada pessoa, conta ou pedido consultado.
+    """
+    return re.sub(r'/\d+(?=/|$)', '/{id}', '/' + endpoint.strip('/'))
+
+def observe_http_request(endpoint, method, status, seconds):
+    """Regista a duração de uma requisição HTTP concluída."""
+    HTTP_HISTOGRAM.observe(seconds, endpoint, method, str(status))
+
+# --- 5. AGREGAÇÃO ENTRE PROCESSOS ---
+
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+
+def _multiproc_dir():
+    return os.getenv(MULTIPROC_DIR_ENV) or None
+
+def flush(force=False):
+    """
+    Escreve o estado deste processo em METRICS_MULTIPROC_DIR/<pid>.json, no
+    máximo a cada FLUSH_INTERVAL_SECONDS (sempre, com `force`).
+    """
+    global _last_flush
+    directory = _multiproc_dir()
+    if not directory:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < FLUSH_INTERVAL_SECONDS:
+        return
+    if not _flush_lock.acquire(blocking=force):
+        return
+    try:
+        _last_flush = now
+        state = {metric.name: [[list(labels), value] for labels, value in metric.snapshot().items()]
+                 for metric in _registry}
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        # Escrita atómica: quem lê nunca vê um ficheiro a meio.
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        pass
+    finally:
+        _flush_lock.release()
+
+atexit.register(flush, True)
+
+def clear_multiproc_dir():
+    """Apaga os estados de execuções anteriores (chamar antes de criar os workers)."""
+    directory = _multiproc_dir()
+    if not directory or not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith(('.json', '.tmp')):
+            os.remove(os.path.join(directory, name))
+
+def _aggregated():
+    """Estado de todas as métricas: somado entre os processos, se houver diretório partilhado."""
+    directory = _multiproc_dir()
+    if not directory:
+        return {metric.name: metric.snapshot() for metric in _registry}
+    flush(force=True)
+    totals = {metric.name: {} for metric in _registry}
+    by_name = {metric.name: metric for metric in _registry}
+    # Os contadores e histogramas dos processos que já terminaram continuam na
+    # soma, tal como no modo multiprocesso do prometheus_client; os gauges
+    # são os dos processos vivos, um por 'pid'.
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        pid = name[:-len('.json')]
+        alive = _is_alive(pid)
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric_name, series in state.items():
+            metric = by_name.get(metric_name)
+            if metric is None:
+                continue
+            total = totals[metric_name]
+            for labels, value in series:
+                if metric.kind == 'gauge':
+                    if alive:
+                        total[tuple(labels) + (pid,)] = value
+                    continue
+                labels = tuple(labels)
+                total[labels] = metric.merge(total.get(labels), value)
+    return totals
+
+def _is_alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def render_prometheus():
+    """Retorna todas as métricas no formato de texto do Prometheus (0.0.4)."""
+    state = _aggregated()
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render(state[metric.name]))
+    return "\n".join(lines) + "\n"
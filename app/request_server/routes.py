@@ -2,19 +2,40 @@
 # ARQUIVO: app/request_server/routes.py
 # DESCRICAO: Rotas para servir as paginas HTML (frontend) e atuar como um
 #              proxy seguro para a API do integration_server (backend).
-# VERSAO: 13.0 (Adicionadas rotas do entregador)
+# VERSAO: 25.0 (Proxy SSE removido: o canal é servido pelo servidor de eventos)
 # ==============================================================================
 
 # --- 1. IMPORTAÇÕES ---
 import hashlib
+import logging
 import requests
 from functools import wraps
 from flask import (
     Blueprint, render_template, session, redirect, url_for, flash, abort, Response,
-    request, jsonify
+    request, jsonify, stream_with_context, current_app
 )
 from . import bp
 
+logger = logging.getLogger(__name__)
+
+# Número de notificações carregadas na renderização inicial do dashboard.
+DASHBOARD_NOTES_LIMIT = 20
+
+def integration_url(path):
+    """URL de uma rota do integration_server (INTEGRATION_API_URL)."""
+    return current_app.config['INTEGRATION_API_URL'].rstrip('/') + path
+
+def contract_headers(headers=None):
+    """
+    Cabeçalhos de um pedido ao integration_server com o contrato do
+    utilizador (X-Contract-Id), que restringe as leituras e escritas a esse
+    contrato. Sem contrato na sessão, vale o contrato padrão.
+    """
+    headers = dict(headers or {})
+    if session.get('contract_id'):
+        headers['X-Contract-Id'] = session['contract_id']
+    return headers
+
 # --- 2. DECORATORS DE CONTROLO DE ACESSO ---
 
 def login_required(f):
@@ -58,26 +79,23 @@ def home():
 @login_required
 @role_required(['cliente'])
 def dashboard_cliente():
-    notifications = []
+    # O filtro por perfil e o limite são aplicados no servidor de integração;
+    # o cursor devolvido permite à página pedir apenas notas novas depois.
+    notifications, notes_cursor = [], None
     try:
-        api_url = "http://127.0.0.1:5000/api/notifications/list"
-        response = requests.get(api_url, timeout=10)
+        api_url = integration_url("/api/notifications/list")
+        params = {'role': 'cliente', 'limit': DASHBOARD_NOTES_LIMIT}
+        response = requests.get(api_url, params=params, headers=contract_headers(), timeout=10)
         if response.ok:
-            all_notes_raw = response.json()
-            # --- CORREÇÃO APLICADA AQUI ---
-            # A stream pode conter listas vazias. O código agora verifica se o item
-            # é um dicionário antes de tentar aceder aos seus valores.
-            notifications = [
-                note for note in all_notes_raw 
-                if isinstance(note, dict) and note.get('target_role') == 'cliente'
-            ]
+            feed = response.json()
+            notifications, notes_cursor = feed.get('items', []), feed.get('cursor')
         else:
             flash("Não foi possível carregar as notificações do sistema.", "warning")
     except requests.exceptions.RequestException as e:
-        print(f"Erro ao buscar notificações para o dashboard: {e}")
+        logger.error("Erro ao buscar notificações para o dashboard: %s", e)
         flash("Serviço de notificações indisponível no momento.", "danger")
     
-    return render_template('dashboard_cliente.html', notifications=notifications)
+    return render_template('dashboard_cliente.html', notifications=notifications, notes_cursor=notes_cursor)
 
 
 @bp.route('/dashboard/entregador')
@@ -141,14 +159,26 @@ def client_warnings_page():
 @bp.route('/api-proxy/contract/status')
 @login_required
 def proxy_contract_status():
-    api_url = "http://127.0.0.1:5000/api/contract/status"
+    api_url = integration_url("/api/contract/status")
     try:
-        response = requests.get(api_url, timeout=15)
+        response = requests.get(api_url, headers=contract_headers(), timeout=15)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
         return jsonify({"error": "Não foi possível obter os dados do contrato."}), 502
 
+@bp.route('/api-proxy/contract/analytics')
+@login_required
+@role_required(['cliente', 'financeiro'])
+def proxy_contract_analytics():
+    api_url = integration_url("/api/contract/analytics")
+    try:
+        response = requests.get(api_url, headers=contract_headers(), timeout=30)
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        return jsonify({"error": "Não foi possível obter os indicadores do contrato."}), 502
+
 @bp.route('/api-proxy/secure/contract/view', methods=['POST'])
 @login_required
 @role_required(['cliente'])
@@ -167,9 +197,9 @@ def proxy_secure_view_contract():
     if provided_hash != correct_hash:
         return jsonify({"success": False, "message": "Senha incorreta."}), 401
 
-    api_url = "http://127.0.0.1:5000/api/contract/view"
+    api_url = integration_url("/api/contract/view")
     try:
-        response = requests.get(api_url, stream=True, timeout=20)
+        response = requests.get(api_url, stream=True, headers=contract_headers(), timeout=20)
         response.raise_for_status()
         return Response(response.iter_content(chunk_size=1024), content_type=response.headers['Content-Type'])
     except requests.exceptions.RequestException as e:
@@ -179,32 +209,12 @@ def proxy_secure_view_contract():
 @login_required
 @role_required(['cliente'])
 def proxy_submit_order():
-    api_url = "http://127.0.0.1:5000/api/order/submit"
-
+    api_url = integration_url("/api/order/submit")
+    logger.debug("Proxy de submissão de pedido: %d bytes, Content-Type %s",
+                 request.content_length or 0, request.content_type)
 
-    #DEBUG PRINTS
-    print("=== PROXY DEBUG - INÍCIO ===")
-    print("HEADERS RECEBIDOS NO PROXY:")
-    for k, v in request.headers.items():
-        print(f"  {k}: {v}")
-    print("RAW DATA RECEBIDA (request.data):")
-    print(request.data[:500])  # limitar a 500 bytes para não poluir o log
     try:
-        # Aqui já força o Flask a tentar parsear JSON
-        data = request.get_json(force=True, silent=False)
-        print("JSON PARSEADO COM SUCESSO NO PROXY:")
-        print(data)
-    except Exception as e:
-        print(" ERRO AO PARSEAR JSON NO PROXY:", e)
-        data = None
-
-    print("=== PROXY DEBUG - FIM ===")
-    #FIM DEBUG PRINTS
-
-    try:
-       #TESTE DE DEBUG LINHA ORIGINAL ABAIXO
-       # response = requests.post(api_url, json=request.get_json(), timeout=30, stream=True)
-        response = requests.post(api_url, json=request.get_json(), timeout=30, stream=True,  headers={"Content-Type": "application/json"})
+        response = requests.post(api_url, json=request.get_json(), timeout=30, stream=True, headers=contract_headers({"Content-Type": "application/json"}))
         response.raise_for_status()
         final_headers = {k: v for k, v in response.headers.items() if k.lower() in ['content-type', 'content-disposition']}
         final_headers['Access-Control-Expose-Headers'] = 'Content-Disposition'
@@ -220,9 +230,9 @@ def proxy_submit_order():
 @login_required
 @role_required(['cliente', 'financeiro'])
 def proxy_list_deliveries():
-    api_url = "http://127.0.0.1:5000/api/deliveries/list"
+    api_url = integration_url("/api/deliveries/list")
     try:
-        response = requests.get(api_url, timeout=20)
+        response = requests.get(api_url, headers=contract_headers(), timeout=20)
         response.raise_for_status()
         return response.json(), response.status_code
     except requests.exceptions.RequestException as e:
@@ -232,82 +242,149 @@ def proxy_list_deliveries():
 @login_required
 @role_required(['cliente', 'financeiro'])
 def proxy_view_delivery_pdf(ipfs_hash):
-    api_url = f"http://127.0.0.1:5000/api/deliveries/view/{ipfs_hash}"
+    api_url = integration_url(f"/api/deliveries/view/{ipfs_hash}")
     try:
-        response = requests.get(api_url, stream=True, timeout=20)
+        response = requests.get(api_url, stream=True, headers=contract_headers(), timeout=20)
         response.raise_for_status()
         return Response(response.iter_content(chunk_size=1024), content_type=response.headers['Content-Type'])
     except requests.exceptions.RequestException as e:
         abort(502)
 
+def _proxy_preview(api_url):
+    # Repassa a miniatura (ou o estado 202 enquanto é gerada) com os cabeçalhos
+    # de cache. O contrato da sessão segue em X-Contract-Id: o integration_server
+    # responde 404 aos CIDs que não são documentos desse contrato.
+    try:
+        response = requests.get(api_url, headers=contract_headers(), timeout=10)
+    except requests.exceptions.RequestException as e:
+        abort(502)
+    headers = {k: v for k, v in response.headers.items() if k.lower() in ('cache-control', 'retry-after', 'etag', 'last-modified')}
+    return Response(response.content, status=response.status_code, content_type=response.headers.get('Content-Type'), headers=headers)
+
+@bp.route('/api-proxy/deliveries/preview/<cid>')
+@login_required
+@role_required(['cliente', 'financeiro'])
+def proxy_preview_delivery(cid):
+    return _proxy_preview(integration_url(f"/api/deliveries/preview/{cid}"))
+
+@bp.route('/api-proxy/orders/preview/<cid>')
+@login_required
+@role_required(['financeiro'])
+def proxy_preview_order(cid):
+    return _proxy_preview(integration_url(f"/api/orders/preview/{cid}"))
+
 @bp.route('/api-proxy/orders/view/<ipfs_hash>')
 @login_required
 @role_required(['financeiro'])
 def proxy_view_order_pdf(ipfs_hash):
-    api_url = f"http://127.0.0.1:5000/api/orders/view/{ipfs_hash}"
+    api_url = integration_url(f"/api/orders/view/{ipfs_hash}")
     try:
-        response = requests.get(api_url, stream=True, timeout=20)
+        response = requests.get(api_url, stream=True, headers=contract_headers(), timeout=20)
         response.raise_for_status()
         return Response(response.iter_content(chunk_size=1024), content_type=response.headers.get('Content-Type'))
     except requests.exceptions.RequestException as e:
         abort(502)
 
+@bp.route('/api-proxy/export/<dataset>')
+@login_required
+@role_required(['financeiro'])
+def proxy_export_dataset(dataset):
+    # Repassa a exportação bloco a bloco, sem a carregar em memória.
+    api_url = integration_url(f"/api/export/{dataset}")
+    try:
+        response = requests.get(api_url, params=request.args, stream=True, headers=contract_headers(), timeout=(5, 60))
+    except requests.exceptions.RequestException as e:
+        abort(502)
+    if response.status_code != 200:
+        return Response(response.content, status=response.status_code, content_type=response.headers.get('Content-Type'))
+    headers = {"Content-Disposition": response.headers.get('Content-Disposition', '')}
+    return Response(stream_with_context(response.iter_content(chunk_size=64 * 1024)),
+                    content_type=response.headers.get('Content-Type'), headers=headers)
+
 # --- ROTAS DE PROXY PARA GESTÃO DE PEDIDOS PELO FINANCEIRO ---
 
 @bp.route('/api-proxy/orders/list')
 @login_required
 @role_required(['financeiro'])
 def proxy_list_orders():
-    api_url = "http://127.0.0.1:5000/api/orders/list"
+    api_url = integration_url("/api/orders/list")
     try:
-        response = requests.get(api_url, timeout=20)
+        # Repassa a paginação e os filtros (limit, cursor, status, cnpj, date_from, date_to).
+        response = requests.get(api_url, params=request.args, headers=contract_headers(), timeout=20)
         response.raise_for_status()
         return response.json(), response.status_code
     except requests.exceptions.RequestException as e:
         return jsonify({"success": False, "message": "Não foi possível obter a lista de pedidos."}), 502
 
+@bp.route('/api-proxy/orders/details/<order_txid>')
+@login_required
+@role_required(['financeiro'])
+def proxy_order_details(order_txid):
+    api_url = integration_url(f"/api/orders/details/{order_txid}")
+    try:
+        response = requests.get(api_url, headers=contract_headers(), timeout=20)
+        return response.json(), response.status_code
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return jsonify({"success": False, "message": "Não foi possível obter os detalhes do pedido."}), 502
+
 # ==============================================================================
-# --- ROTA DE PROXY COM DEBUG PRINTS ---
+# --- ROTA DE PROXY PARA AVALIAÇÃO DE PEDIDOS ---
 # ==============================================================================
 @bp.route('/api-proxy/order/review', methods=['POST'])
 @login_required
 @role_required(['financeiro'])
 def proxy_review_order():
-    print("\n--- DEBUG [PROXY]: Rota /api-proxy/order/review ACIONADA ---")
-    
-    api_url = "http://127.0.0.1:5000/api/order/review"
+    api_url = integration_url("/api/order/review")
     payload = request.get_json()
     
     # Adiciona o nome do revisor da sessão ao payload
     reviewer = session.get('representative_name')
-    print(f"DEBUG [PROXY]: Nome do representante na sessão: '{reviewer}'")
     
     # Lógica de segurança: Garante que há um nome de revisor.
     if not reviewer or reviewer == 'N/A':
-        print("DEBUG [PROXY]: ERRO - Nome do representante não encontrado ou inválido na sessão.")
+        logger.warning("Nome do representante não encontrado ou inválido na sessão.")
         # Define um nome padrão para evitar que a validação `all()` falhe,
         # mas idealmente o login deveria garantir este dado.
         payload['reviewer_name'] = 'Financeiro (Sessão Inválida)'
     else:
         payload['reviewer_name'] = reviewer
-    
-    print(f"DEBUG [PROXY]: A enviar para o Integration Server o seguinte payload: {payload}")
-    
+    logger.debug("A enviar avaliação para o Integration Server: %s", payload)
+
     try:
-        response = requests.post(api_url, json=payload, timeout=20)
-        print(f"DEBUG [PROXY]: Resposta recebida do Integration Server com status: {response.status_code}")
+        response = requests.post(api_url, json=payload, headers=contract_headers(), timeout=20)
         response.raise_for_status()
         return response.json(), response.status_code
     except requests.exceptions.RequestException as e:
-        print(f"DEBUG [PROXY]: ERRO na comunicação com o Integration Server: {e}")
+        logger.error("Erro na comunicação com o Integration Server (review): %s", e)
         error_message = f"Erro de comunicação com o servidor de integração."
         try:
             error_json = e.response.json()
             error_message = error_json.get("message", error_message)
-            print(f"DEBUG [PROXY]: Mensagem de erro do backend: {error_message}")
         except (ValueError, AttributeError, Exception):
              pass
         return jsonify({"success": False, "message": error_message}), 502
+@bp.route('/api-proxy/notifications/list')
+@login_required
+def proxy_list_notifications():
+    """
+    Proxy do feed de notificações, sempre restrito ao perfil da sessão.
+    A página usa ?since=<cursor> para buscar apenas as notas novas.
+    """
+    api_url = integration_url("/api/notifications/list")
+    params = {'role': session.get('user_role'), 'limit': request.args.get('limit', DASHBOARD_NOTES_LIMIT)}
+    if 'since' in request.args:
+        params['since'] = request.args['since']
+    try:
+        response = requests.get(api_url, params=params, headers=contract_headers(), timeout=10)
+        response.raise_for_status()
+        return response.json(), response.status_code
+    except requests.exceptions.RequestException as e:
+        logger.error("Erro na comunicação com o Integration Server (notifications/list): %s", e)
+        return jsonify({"success": False, "message": "Não foi possível obter as notificações."}), 502
+
+# O canal SSE (/api-proxy/events) é servido diretamente pelo servidor de
+# eventos (app/events_server), sem proxy: ver o papel 'events' no README.
+
 # ==============================================================================
 # --- ROTA DE PROXY PARA ALERTAS CONSOLIDADOS ---
 # ==============================================================================
@@ -315,9 +392,9 @@ def proxy_review_order():
 @login_required
 @role_required(['financeiro'])
 def proxy_get_consolidated_notifications():
-    api_url = "http://127.0.0.1:5000/api/notifications/consolidated"
+    api_url = integration_url("/api/notifications/consolidated")
     try:
-        response = requests.get(api_url, timeout=15)
+        response = requests.get(api_url, headers=contract_headers(), timeout=15)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -331,15 +408,13 @@ def proxy_get_consolidated_notifications():
 @role_required(['financeiro'])
 def proxy_list_pending_deliveries():
     """Proxy para buscar entregas que aguardam aprovação do financeiro."""
-    api_url = "http://127.0.0.1:5000/api/deliveries/pending-approval"
-    print(f"\n--- DEBUG [PROXY]: Rota /api-proxy/deliveries/pending-approval acionada ---")
+    api_url = integration_url("/api/deliveries/pending-approval")
     try:
-        response = requests.get(api_url, timeout=20)
+        response = requests.get(api_url, headers=contract_headers(), timeout=20)
         response.raise_for_status()
-        print(f"--- DEBUG [PROXY]: Resposta do Integration Server: {response.status_code} ---")
         return response.json(), response.status_code
     except requests.exceptions.RequestException as e:
-        print(f"--- DEBUG [PROXY]: ERRO na comunicação: {e} ---")
+        logger.error("Erro na comunicação com o Integration Server (pending-approval): %s", e)
         return jsonify({"success": False, "message": "Não foi possível obter a lista de entregas pendentes."}), 502
 
 @bp.route('/api-proxy/delivery/approve', methods=['POST'])
@@ -347,21 +422,19 @@ def proxy_list_pending_deliveries():
 @role_required(['financeiro'])
 def proxy_approve_delivery():
     """Proxy para o financeiro aprovar uma entrega."""
-    api_url = "http://127.0.0.1:5000/api/delivery/approve"
+    api_url = integration_url("/api/delivery/approve")
     payload = request.get_json()
     
     # Adiciona o nome do revisor da sessão por segurança
     payload['reviewer_name'] = session.get('representative_name', 'Financeiro Desconhecido')
-    
-    print(f"\n--- DEBUG [PROXY]: Rota /api-proxy/delivery/approve acionada com payload: {payload} ---")
-    
+    logger.debug("A enviar aprovação de entrega para o Integration Server: %s", payload)
+
     try:
-        response = requests.post(api_url, json=payload, timeout=20)
-        print(f"--- DEBUG [PROXY]: Resposta do Integration Server: {response.status_code} ---")
+        response = requests.post(api_url, json=payload, headers=contract_headers(), timeout=20)
         response.raise_for_status()
         return response.json(), response.status_code
     except requests.exceptions.RequestException as e:
-        print(f"--- DEBUG [PROXY]: ERRO na comunicação: {e} ---")
+        logger.error("Erro na comunicação com o Integration Server (delivery/approve): %s", e)
         error_message = "Erro de comunicação com o servidor de integração."
         try:
             error_message = e.response.json().get("message", error_message)
@@ -377,52 +450,51 @@ def proxy_approve_delivery():
 @login_required
 @role_required(['entregador'])
 def proxy_deliveries_entregador():
-    api_url = "http://127.0.0.1:5000/api/deliveries/entregador"
-    print(f"\n--- DEBUG [PROXY]: Rota /api-proxy/deliveries/entregador acionada ---")
+    api_url = integration_url("/api/deliveries/entregador")
     try:
-        response = requests.get(api_url, timeout=20)
+        response = requests.get(api_url, headers=contract_headers(), timeout=20)
         response.raise_for_status()
-        print(f"--- DEBUG [PROXY]: Resposta do Integration Server: {response.status_code} ---")
         return response.json(), response.status_code
     except requests.exceptions.RequestException as e:
-        print(f"--- DEBUG [PROXY]: ERRO na comunicacao: {e} ---")
+        logger.error("Erro na comunicacao com o Integration Server (deliveries/entregador): %s", e)
         return jsonify({"success": False, "message": "Nao foi possivel obter a lista de entregas para o entregador."}), 502
 
 @bp.route('/api-proxy/delivery/submit', methods=['POST'])
 @login_required
 @role_required(['entregador'])
 def proxy_submit_delivery_proof():
-    api_url = "http://127.0.0.1:5000/api/delivery/submit"
-    print(f"\n--- DEBUG [PROXY]: Rota /api-proxy/delivery/submit acionada ---")
-    
+    api_url = integration_url("/api/delivery/submit")
+
     try:
-        # A requisição de proxy precisa ser feita com o corpo completo da requisição original
-        # A biblioteca 'requests' lida com 'multipart/form-data' de forma transparente
-        files = request.files.to_dict()
-        data = request.form.to_dict()
+        # O corpo multipart é repassado tal como chega, em blocos, sem ser
+        # interpretado nem carregado em memória neste servidor.
+        headers = {"Content-Type": request.content_type}
+        if request.content_length:
+            headers["Content-Length"] = str(request.content_length)
+        response = requests.post(api_url, data=request.stream, headers=contract_headers(headers), timeout=(5, 120))
+        return response.json(), response.status_code
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error("Erro na comunicacao com o Integration Server (delivery/submit): %s", e)
+        return jsonify({"success": False, "message": "Erro de comunicacao com o servidor de integracao."}), 502
 
-        response = requests.post(api_url, files=files, data=data, timeout=30)
-        response.raise_for_status()
-        print(f"--- DEBUG [PROXY]: Resposta do Integration Server: {response.status_code} ---")
+@bp.route('/api-proxy/delivery/status/<delivery_key>')
+@login_required
+@role_required(['entregador'])
+def proxy_delivery_proof_status(delivery_key):
+    api_url = integration_url(f"/api/delivery/status/{delivery_key}")
+    try:
+        response = requests.get(api_url, headers=contract_headers(), timeout=10)
         return response.json(), response.status_code
-    except requests.exceptions.RequestException as e:
-        print(f"--- DEBUG [PROXY]: ERRO na comunicacao: {e} ---")
-        error_message = "Erro de comunicacao com o servidor de integracao."
-        try:
-            error_json = e.response.json()
-            error_message = error_json.get("message", error_message)
-            print(f"DEBUG [PROXY]: Mensagem de erro do backend: {error_message}")
-        except (ValueError, AttributeError):
-             pass
-        return jsonify({"success": False, "message": error_message}), 502
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return jsonify({"status": "unknown", "message": "Erro de comunicacao com o servidor de integracao."}), 502
 
 @bp.route('/api-proxy/order/submit-postgres', methods=['POST'])
 @login_required
 @role_required(['cliente'])
 def proxy_submit_order_postgres():
-    api_url = "http://127.0.0.1:5000/api/order/submit-postgres"
+    api_url = integration_url("/api/order/submit-postgres")
     try:
-        response = requests.post(api_url, json=request.get_json(), timeout=30, stream=True)
+        response = requests.post(api_url, json=request.get_json(), headers=contract_headers(), timeout=30, stream=True)
         response.raise_for_status()
         final_headers = {k: v for k, v in response.headers.items() if k.lower() in ['content-type', 'content-disposition']}
         final_headers['Access-Control-Expose-Headers'] = 'Content-Disposition'
@@ -0,0 +1,179 @@
+# ==============================================================================
+# ARQUIVO: app/resilience.py
+# DESCRIÇÃO: Circuit breakers e bulkheads para as dependências externas
+#              (MultiChain, IPFS e Nomus). Quando um backend falha ou fica lento,
+#              as chamadas seguintes falham de imediato em vez de ocuparem uma
+#              thread durante todo o timeout.
+#
+#              Circuit breaker: numa janela deslizante, se a taxa de falhas
+#              ultrapassar o limite (com um número mínimo de chamadas), o
+#              circuito abre e recusa chamadas durante BREAKER_OPEN_SECONDS;
+#              depois deixa passar uma chamada de teste (meio-aberto), que volta
+#              a fechá-lo ou a abri-lo.
+#
+#              Bulkhead: limita as chamadas simultâneas a cada backend; uma
+#              chamada que não obtenha vaga em BULKHEAD_MAX_WAIT_SECONDS é
+#              recusada.
+# VERSÃO: 1.1 (Estado dos circuitos como gauge de app/metrics.py)
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import os
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- 2. CONFIGURAÇÃO ---
+# Janela (segundos) em que a taxa de falhas é calculada.
+BREAKER_WINDOW_SECONDS = float(os.getenv('BREAKER_WINDOW_SECONDS', '30'))
+# Chamadas mínimas na janela antes de o circuito poder abrir.
+BREAKER_MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', '5'))
+# Taxa de falhas (0-1) que abre o circuito.
+BREAKER_FAILURE_RATE = float(os.getenv('BREAKER_FAILURE_RATE', '0.5'))
+# Tempo (segundos) que o circuito fica aberto antes da chamada de teste.
+BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', '15'))
+# Tempo máximo de espera por uma vaga no bulkhead.
+BULKHEAD_MAX_WAIT_SECONDS = float(os.getenv('BULKHEAD_MAX_WAIT_SECONDS', '0.5'))
+
+# Chamadas simultâneas permitidas por backend.
+MAX_CONCURRENT = {
+    'multichain': int(os.getenv('MULTICHAIN_MAX_CONCURRENT', '16')),
+    'ipfs': int(os.getenv('IPFS_MAX_CONCURRENT', '8')),
+    'nomus': int(os.getenv('NOMUS_MAX_CONCURRENT', '4')),
+}
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+class BackendUnavailable(ConnectionError):
+    """Chamada recusada sem contactar o backend (circuito aberto ou bulkhead cheio)."""
+
+# --- 3. CIRCUIT BREAKER ---
+
+class CircuitBreaker:
+    def __init__(self, name, window=BREAKER_WINDOW_SECONDS, min_calls=BREAKER_MIN_CALLS,
+                 failure_rate=BREAKER_FAILURE_RATE, open_seconds=BREAKER_OPEN_SECONDS):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._outcomes = deque()  # (instante, sucesso)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Indica se a chamada pode seguir; em meio-aberto, só uma de cada vez."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self.state = HALF_OPEN
+                logger.info("Circuito '%s' meio-aberto: a testar o backend.", self.name)
+            if self.state == HALF_OPEN:
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record(self, success):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+                if success:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                    logger.info("Circuito '%s' fechado: o backend respondeu.", self.name)
+                else:
+                    self._open(now)
+                return
+            self._outcomes.append((now, success))
+            while self._outcomes and now - self._outcomes[0][0] > self.window:
+                self._outcomes.popleft()
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if (self.state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_rate):
+                self._open(now)
+
+    def cancel(self):
+        """Liberta a chamada de teste autorizada por `allow` que não chegou a ser feita."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _open(self, now):
+        self.state = OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        logger.warning("Circuito '%s' aberto: chamadas recusadas durante %.0f s.", self.name, self.open_seconds)
+
+# --- 4. BULKHEAD E GUARDA POR BACKEND ---
+
+class Outcome:
+    """Resultado de uma chamada protegida; o backend pode marcá-la como falhada."""
+    def __init__(self):
+        self.failed = False
+
+    def fail(self):
+        self.failed = True
+
+class BackendGuard:
+    """Circuit breaker + bulkhead de um backend."""
+    def __init__(self, name, max_concurrent, max_wait=BULKHEAD_MAX_WAIT_SECONDS):
+        self.name = name
+        self.breaker = CircuitBreaker(name)
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    @contextmanager
+    def call(self, ignore=()):
+        """
+        Protege uma chamada ao backend. Uma exceção no bloco (exceto as dos
+        tipos em `ignore`, erros do próprio pedido), ou `fail()` no objeto
+        devolvido, conta como falha do backend.
+
+        Raises:
+            BackendUnavailable: Se o circuito estiver aberto ou não houver vaga.
+
+        Uso:
+            with guard('nomus').call() as outcome:
+                ...
+                if erro_do_backend: outcome.fail()
+        """
+        if not self.breaker.allow():
+            raise BackendUnavailable(f"Circuito '{self.name}' aberto.")
+        if not self._slots.acquire(timeout=self.max_wait):
+            self.breaker.cancel()
+            raise BackendUnavailable(f"Limite de {self.max_concurrent} chamadas simultâneas a '{self.name}' atingido.")
+        outcome = Outcome()
+        try:
+            yield outcome
+        except Exception as e:
+            if not isinstance(e, ignore):
+                outcome.fail()
+            raise
+        finally:
+            self._slots.release()
+            self.breaker.record(not outcome.failed)
+
+_guards = {name: BackendGuard(name, limit) for name, limit in MAX_CONCURRENT.items()}
+
+def guard(backend):
+    """Guarda do backend indicado ('multichain', 'ipfs' ou 'nomus')."""
+    return _guards[backend]
+
+def _circuit_states():
+    values = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+    return {(name,): values[backend_guard.breaker.state] for name, backend_guard in _guards.items()}
+
+# Exportado em /metrics (0 fechado, 1 meio-aberto, 2 aberto).
+CIRCUIT_STATE = metrics.Gauge('contract_api_circuit_state',
+                              'Estado do circuit breaker por backend (0 fechado, 1 meio-aberto, 2 aberto).',
+                              ('backend',), _circuit_states)
@@ -0,0 +1,234 @@
+# ==============================================================================
+# ARQUIVO: app/session_store.py
+# DESCRIÇÃO: Sessões guardadas no servidor. O cookie leva apenas um
+#              identificador opaco e aleatório; os dados da sessão ficam num
+#              backend configurável (SESSION_BACKEND):
+#                sqlite  -> ficheiro SQLite local (padrão, um nó)
+#                memory  -> LRU em memória do processo
+#                redis   -> servidor compatível com Redis (SESSION_REDIS_URL)
+#                cookie  -> sessão assinada no cookie (comportamento do Flask)
+# VERSÃO: 1.1 (Ligações SQLite fechadas; falhas ao gravar não quebram a resposta)
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import os
+import time
+import sqlite3
+import secrets
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+logger = logging.getLogger(__name__)
+
+# --- 2. BACKENDS ---
+
+class MemoryBackend:
+    """LRU em memória; adequado a um único processo."""
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # sid -> (user_id, dados, expira_em)
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            if entry[2] <= time.time():
+                del self._entries[sid]
+                return None
+            self._entries.move_to_end(sid)
+            return entry[1]
+
+    def set(self, sid, data, ttl, user_id=None):
+        with self._lock:
+            self._entries[sid] = (user_id, data, time.time() + ttl)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for sid in [sid for sid, entry in self._entries.items() if entry[0] == user_id]:
+                del self._entries[sid]
+
+class SQLiteBackend:
+    """Ficheiro SQLite local, partilhado pelos processos do mesmo nó."""
+    SCHEMA = """CREATE TABLE IF NOT EXISTS sessions (
+                    sid TEXT PRIMARY KEY,
+                    user_id TEXT,
+                    data TEXT NOT NULL,
+                    expires_at REAL NOT NULL)"""
+    # Remove as sessões expiradas a cada N escritas.
+    PRUNE_EVERY = 500
+
+    def __init__(self, path):
+        self.path = path
+        self._writes = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(self.SCHEMA)
+            conn.execute('CREATE INDEX IF NOT EXISTS sessions_by_user ON sessions (user_id)')
+
+    def _connect(self):
+        # `with closing(...) as conn, conn:` fecha a ligação; o `with conn`
+        # apenas faz commit ou rollback da transação.
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, sid):
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute('SELECT data FROM sessions WHERE sid = ? AND expires_at > ?',
+                               (sid, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, sid, data, ttl, user_id=None):
+        with closing(self._connect()) as conn, conn:
+            conn.execute('INSERT OR REPLACE INTO sessions (sid, user_id, data, expires_at) VALUES (?, ?, ?, ?)',
+                         (sid, user_id, data, time.time() + ttl))
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),))
+
+    def delete(self, sid):
+        with closing(self._connect()) as conn, conn:
+            conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def invalidate_user(self, user_id):
+        with closing(self._connect()) as conn, conn:
+            conn.execute('DELETE FROM sessions WHERE user_id = ?', (user_id,))
+
+class RedisBackend:
+    """Servidor compatível com o protocolo Redis, partilhado por vários nós."""
+    def __init__(self, url, prefix='session:'):
+        # O pacote 'redis' só é necessário com este backend.
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, sid):
+        data = self._redis.get(self.prefix + sid)
+        return data.decode('utf-8') if data is not None else None
+
+    def set(self, sid, data, ttl, user_id=None):
+        pipe = self._redis.pipeline()
+        pipe.setex(self.prefix + sid, int(ttl), data)
+        if user_id is not None:
+            user_key = f"{self.prefix}user:{user_id}"
+            pipe.sadd(user_key, sid)
+            pipe.expire(user_key, int(ttl))
+        pipe.execute()
+
+    def delete(self, sid):
+        self._redis.delete(self.prefix + sid)
+
+    def invalidate_user(self, user_id):
+        user_key = f"{self.prefix}user:{user_id}"
+        sids = [sid.decode('utf-8') for sid in self._redis.smembers(user_key)]
+        self._redis.delete(user_key, *[self.prefix + sid for sid in sids])
+
+# --- 3. INTERFACE DE SESSÃO DO FLASK ---
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        # clear() (usado no login e no logout) troca também o identificador,
+        # para que um identificador anterior ao login não continue válido.
+        self.rotate = False
+
+    def clear(self):
+        super().clear()
+        self.rotate = True
+
+class ServerSideSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            try:
+                data = self.backend.get(sid)
+            except Exception as e:
+                logger.error("Falha ao ler a sessão do backend: %s", e)
+                data = None
+            if data is not None:
+                try:
+                    return ServerSideSession(self.serializer.loads(data), sid=sid)
+                except ValueError:
+                    pass
+        return ServerSideSession(sid=None, new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.rotate and session.sid:
+            try:
+                self.backend.delete(session.sid)
+            except Exception:
+                logger.exception("Falha ao remover a sessão anterior do backend.")
+            session.sid = None
+
+        if not session:
+            if session.modified or session.rotate:
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+            return
+        if not session.modified and session.sid:
+            return
+
+        sid = session.sid or secrets.token_urlsafe(32)
+        ttl = app.permanent_session_lifetime.total_seconds()
+        try:
+            self.backend.set(sid, self.serializer.dumps(dict(session)), ttl, user_id=session.get('user_id'))
+        except Exception:
+            # Um backend indisponível (ex: base SQLite bloqueada) não deve
+            # transformar a resposta num erro 500: a alteração da sessão perde-se
+            # e o cookie fica como estava.
+            logger.exception("Falha ao gravar a sessão no backend.")
+            return
+        response.set_cookie(name, sid, expires=self.get_expiration_time(app, session),
+                            httponly=httponly, domain=domain, path=path,
+                            secure=secure, samesite=samesite)
+        response.vary.add('Cookie')
+
+def create_backend(kind, instance_path):
+    """Cria o backend indicado em SESSION_BACKEND (None = sessão no cookie)."""
+    kind = (kind or 'sqlite').lower()
+    if kind == 'cookie':
+        return None
+    if kind == 'memory':
+        return MemoryBackend()
+    if kind == 'redis':
+        return RedisBackend(os.getenv('SESSION_REDIS_URL', 'redis://localhost:6379/0'))
+    if kind == 'sqlite':
+        return SQLiteBackend(os.getenv('SESSION_DB_PATH', os.path.join(instance_path, 'sessions.sqlite3')))
+    raise ValueError(f"SESSION_BACKEND desconhecido: '{kind}'.")
+
+def init_app(app):
+    """Instala a interface de sessão no servidor, conforme SESSION_BACKEND."""
+    backend = create_backend(os.getenv('SESSION_BACKEND'), app.instance_path)
+    if backend is not None:
+        app.session_interface = ServerSideSessionInterface(backend)
+    return backend
@@ -0,0 +1,110 @@
+# ==============================================================================
+# ARQUIVO: app/singleflight.py
+# DESCRIÇÃO: Agrupamento (single-flight) de leituras idênticas e simultâneas
+#              aos backends. Enquanto uma leitura com uma dada chave está em
+#              curso, os restantes pedidos com a mesma chave esperam por ela e
+#              recebem o mesmo resultado, em vez de repetirem a chamada: uma
+#              avalanche de pedidos iguais custa uma chamada por chave.
+# VERSÃO: 1.2 (Qualquer saída de quem lidera é propagada a quem espera)
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import copy
+import logging
+import threading
+from functools import wraps
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Chamadas evitadas por operação, exportadas em /metrics.
+SHARED_CALLS = metrics.Counter('contract_api_singleflight_shared_total',
+                               'Leituras servidas por uma chamada idêntica já em curso.', ('operation',))
+
+# --- 2. SINGLE-FLIGHT ---
+
+class SingleFlightError(RuntimeError):
+    """A leitura partilhada terminou sem resultado nem exceção para quem espera."""
+
+class _Call:
+    """Uma leitura em curso e o resultado partilhado com quem espera por ela."""
+    __slots__ = ('done', 'result', 'error', 'completed', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.completed = False
+        self.waiters = 0
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Executa `fn(*args, **kwargs)`, ou espera pela execução em curso com a
+        mesma chave e devolve o seu resultado (ou relança a sua exceção).
+
+        Cada pedido recebe a sua própria cópia do resultado, para que possa
+        alterá-lo sem afetar os outros. Se quem lidera sair sem resultado nem
+        exceção para partilhar (ex: a cópia do resultado falhou), quem espera
+        recebe SingleFlightError.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            SHARED_CALLS.inc(key[0])
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            if not call.completed:
+                raise SingleFlightError(f"A leitura partilhada '{key[0]}' terminou sem resultado.")
+            return copy.deepcopy(call.result)
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            # Inclui as saídas que não são Exception (ex: GreenletExit,
+            # KeyboardInterrupt): quem espera recebe a mesma.
+            call.error = e
+            raise
+        else:
+            with self._lock:
+                # A partir daqui nenhum pedido se junta a esta chamada.
+                del self._calls[key]
+                waiters = call.waiters
+            if waiters:
+                # Cópia intacta para quem espera: quem lidera pode alterar o seu resultado.
+                call.result = copy.deepcopy(result)
+                call.completed = True
+                logger.debug("Leitura %s partilhada com %d pedidos.", key, waiters)
+            return result
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+# Instância única por processo.
+group = SingleFlight()
+
+def coalesce(operation):
+    """
+    Decorator: as chamadas simultâneas à função com os mesmos argumentos
+    partilham uma única execução.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            key = (operation, args, tuple(sorted(kwargs.items())))
+            return group.do(key, f, *args, **kwargs)
+        return wrapper
+    return decorator
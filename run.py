@@ -1,23 +1,189 @@
 # ==============================================================================
 # ARQUIVO: run.py
 # DESCRIÇÃO: Ponto de entrada principal da aplicação Flask.
-# v1
+#            Subcomandos:
+#              python run.py           -> servidor de desenvolvimento
+#              python run.py production -> servidor de produção (gunicorn)
+#              python run.py consume   -> consumidor das projeções SQLite
+#              python run.py financial-sync -> sincronização financeira com a Nomus
+#              python run.py export    -> exportação do histórico das streams
+# v10 (Sincronização financeira arrancada ao iniciar cada worker)
 # ==============================================================================
-from app import create_app
+import os
+import argparse
 from dotenv import load_dotenv
 
 # Carrega as variáveis de ambiente do arquivo .env
 # É crucial que isso seja feito antes da criação do app
 load_dotenv()
 
-# Cria a aplicação Flask usando a factory
-app = create_app()
+# `from run import app` e `gunicorn run:app` continuam a funcionar: ao importar
+# o módulo, `app` é o mesmo objeto de wsgi.py (papel definido por APP_ROLE).
+# Executado como script, a aplicação é criada pelo subcomando escolhido.
+if __name__ != '__main__':
+    from wsgi import app
 
-if __name__ == '__main__':
+def run_dev_server(args):
     # Inicia o servidor de desenvolvimento do Flask
     # O debug=True é útil para desenvolvimento, mas deve ser False em produção
+    from app import create_app
+    app = create_app(getattr(args, 'role', None))
 
     app.config['DEBUG'] = True
     app.config['PROPAGATE_EXCEPTIONS'] = True
 
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    app.run(debug=True, port=5000)
+
+def run_production_server(args):
+    # Serve um papel da aplicação com gunicorn: vários processos (workers),
+    # cada um com várias threads (worker 'gthread').
+    from gunicorn.app.base import BaseApplication
+    from app import create_app, metrics
+
+    # Cada worker escreve as suas métricas neste diretório e /metrics soma-as;
+    # os estados de uma execução anterior são apagados antes do arranque.
+    os.environ.setdefault(metrics.MULTIPROC_DIR_ENV,
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics'))
+    metrics.clear_multiproc_dir()
+
+    class ProductionApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return create_app(args.role)
+
+    def start_worker_services(worker):
+        # Já no worker, depois do fork: a sincronização financeira arranca sem
+        # esperar pelo primeiro pedido.
+        if args.role in ('all', 'integration'):
+            from app.integration_server.utils.financial_sync import financial_sync
+            financial_sync.ensure_started()
+
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        # Com preload, a aplicação é importada uma vez no processo principal e
+        # partilhada pelos workers (copy-on-write).
+        # Só a thread que faz o fork passa para os workers. Por isso, criar a
+        # aplicação não inicia threads de fundo: a sincronização financeira
+        # arranca ao iniciar cada worker (post_worker_init), os executores e o
+        # event watcher no primeiro pedido, e a thread do logging é recriada
+        # após o fork (ver logging_config).
+        'preload_app': args.preload,
+        'post_worker_init': start_worker_services,
+        # Tempo máximo de silêncio de um worker; as ligações SSE enviam
+        # heartbeats, pelo que não são afetadas.
+        'timeout': args.timeout,
+        'graceful_timeout': 30,
+        'keepalive': 5,
+        'accesslog': '-' if args.access_log else None,
+    }
+    if args.role == 'events':
+        # Cada dashboard mantém uma ligação SSE aberta, quase sempre inativa.
+        # Com gevent, cada ligação é uma greenlet em vez de uma thread do
+        # pool, e um worker aguenta worker_connections ligações.
+        try:
+            import gevent  # noqa: F401
+        except ImportError:
+            raise SystemExit("O papel 'events' precisa do gevent (pip install gevent).")
+        options.update(worker_class='gevent', worker_connections=args.worker_connections)
+        options.pop('threads')
+    ProductionApplication(options).run()
+
+def run_projection_consumer(args):
+    # Segue as streams e mantém as projeções SQLite lidas pelas rotas
+    # quando READ_MODEL=projections.
+    from app.integration_server.utils.projections import ProjectionConsumer
+    consumer = ProjectionConsumer(db_path=args.db)
+    if args.once:
+        consumer.run_once()
+    else:
+        consumer.run_forever(poll_interval=args.interval)
+
+def run_financial_sync(args):
+    # Sincronização das parcelas com a Nomus num processo próprio
+    # (FINANCIAL_SYNC_MODE=external), em vez de uma thread por worker.
+    from app.integration_server.utils.financial_sync import financial_sync
+    if args.interval is not None:
+        financial_sync.interval = args.interval
+    if args.once:
+        financial_sync.run_once()
+    else:
+        financial_sync.run_forever()
+
+def run_export(args):
+    # Escreve a exportação bloco a bloco no ficheiro (ou na saída padrão).
+    import sys
+    from app.integration_server.utils import exporter
+    try:
+        chunks = exporter.export(args.dataset, args.format, args.contract)
+    except exporter.ExportError as e:
+        sys.exit(str(e))
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Aplicação de gestão de contratos.")
+    subcommands = parser.add_subparsers(dest='command')
+
+    serve = subcommands.add_parser('serve', help="Servidor de desenvolvimento do Flask (padrão).")
+    serve.add_argument('--role', choices=['all', 'web', 'integration', 'events'], help="Papel da aplicação (padrão: APP_ROLE ou 'all').")
+
+    cpus = os.cpu_count() or 1
+    production = subcommands.add_parser('production', help="Servidor de produção (gunicorn).")
+    production.add_argument('--role', choices=['all', 'web', 'integration', 'events'], default=os.getenv('APP_ROLE', 'all'),
+                       help="Blueprints servidos por este processo (padrão: APP_ROLE ou 'all').")
+    production.add_argument('--bind', default=os.getenv('BIND', '0.0.0.0:5000'), help="Endereço de escuta.")
+    production.add_argument('--workers', type=int, default=int(os.getenv('WEB_CONCURRENCY', str(2 * cpus + 1))),
+                       help="Número de processos (padrão: WEB_CONCURRENCY ou 2 x CPUs + 1).")
+    production.add_argument('--threads', type=int, default=int(os.getenv('WEB_THREADS', '8')),
+                       help="Threads por processo (padrão: WEB_THREADS ou 8).")
+    production.add_argument('--worker-connections', type=int, default=int(os.getenv('EVENTS_WORKER_CONNECTIONS', '1000')),
+                       help="Ligações simultâneas por worker do papel events (padrão: EVENTS_WORKER_CONNECTIONS ou 1000).")
+    production.add_argument('--timeout', type=int, default=int(os.getenv('WEB_TIMEOUT', '60')),
+                       help="Segundos até um worker bloqueado ser reiniciado.")
+    production.add_argument('--preload', action='store_true', default=os.getenv('WEB_PRELOAD', '0') == '1',
+                       help="Carrega a aplicação antes de criar os workers.")
+    production.add_argument('--access-log', action='store_true', help="Escreve o access log na saída padrão.")
+
+    consume = subcommands.add_parser('consume', help="Consumidor das projeções SQLite.")
+    consume.add_argument('--db', help="Caminho da base SQLite (padrão: PROJECTIONS_DB_PATH).")
+    consume.add_argument('--interval', type=float, default=2.0, help="Segundos entre leituras das streams.")
+    consume.add_argument('--once', action='store_true', help="Aplica os itens pendentes e termina.")
+
+    sync = subcommands.add_parser('financial-sync', help="Sincronização das parcelas com a Nomus.")
+    sync.add_argument('--interval', type=float, help="Segundos entre sincronizações (padrão: FINANCIAL_SYNC_INTERVAL_SECONDS).")
+    sync.add_argument('--once', action='store_true', help="Faz uma sincronização e termina.")
+
+    export = subcommands.add_parser('export', help="Exporta o histórico de uma stream.")
+    export.add_argument('dataset', choices=['orders', 'deliveries', 'installments'])
+    export.add_argument('--format', choices=['csv', 'jsonl', 'parquet'], default='csv')
+    export.add_argument('--output', '-o', help="Ficheiro de destino (padrão: saída padrão).")
+    export.add_argument('--contract', help="Exporta apenas os registos deste contrato (padrão: todos).")
+    return parser
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    if args.command == 'production':
+        run_production_server(args)
+    elif args.command == 'consume':
+        run_projection_consumer(args)
+    elif args.command == 'financial-sync':
+        run_financial_sync(args)
+    elif args.command == 'export':
+        run_export(args)
+    else:
+        run_dev_server(args)
@@ -0,0 +1,61 @@
+# ==============================================================================
+# ARQUIVO: tests/conftest.py
+# DESCRIÇÃO: Fixtures partilhadas pelos testes. A blockchain é substituída por
+#              uma stream em memória (FakeChain) com a mesma interface das
+#              funções RPC de blockchain_utils; nenhum teste contacta a
+#              MultiChain, o IPFS ou a Nomus.
+#
+#              python -m pytest -q
+# ==============================================================================
+import os
+import sys
+import itertools
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.integration_server.utils import blockchain_utils
+
+
+class FakeChain:
+    """Streams em memória, pela ordem de publicação (como 'local-ordering')."""
+    def __init__(self):
+        self.streams = {}
+        self._txids = itertools.count()
+        self.fail_publish = False
+
+    def publish(self, stream_name, key, data_dict):
+        if self.fail_publish:
+            return None
+        keys = key if isinstance(key, list) else [key]
+        txid = f"tx{next(self._txids)}"
+        self.streams.setdefault(stream_name, []).append(
+            {'keys': keys, 'data': blockchain_utils.encode_item_data(data_dict), 'txid': txid})
+        return txid
+
+    def publish_many(self, stream_name, entries, batch_size=None):
+        return [self.publish(stream_name, key, data) for key, data in entries]
+
+    @staticmethod
+    def _slice(items, start, count):
+        if start < 0:
+            start = max(len(items) + start, 0)
+        return items[start:start + count]
+
+    def list_items(self, stream_name, start, count):
+        return self._slice(self.streams.get(stream_name, []), start, count)
+
+    def list_key_items(self, stream_name, key, start, count):
+        items = [item for item in self.streams.get(stream_name, []) if key in item['keys']]
+        return self._slice(items, start, count)
+
+
+@pytest.fixture
+def chain(monkeypatch):
+    """Uma FakeChain no lugar das chamadas RPC de blockchain_utils."""
+    fake = FakeChain()
+    monkeypatch.setattr(blockchain_utils, 'publish_to_blockchain', fake.publish)
+    monkeypatch.setattr(blockchain_utils, 'publish_many_to_blockchain', fake.publish_many)
+    monkeypatch.setattr(blockchain_utils, 'list_stream_items', fake.list_items)
+    monkeypatch.setattr(blockchain_utils, 'list_stream_key_items', fake.list_key_items)
+    return fake
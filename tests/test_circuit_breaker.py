@@ -0,0 +1,107 @@
+# ==============================================================================
+# ARQUIVO: tests/test_circuit_breaker.py
+# DESCRIÇÃO: Estados do circuit breaker e guarda por backend (app/resilience.py).
+# ==============================================================================
+import types
+import pytest
+from app import resilience
+from app.resilience import CircuitBreaker, BackendGuard, BackendUnavailable, CLOSED, OPEN, HALF_OPEN
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience, 'time', types.SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker('test', window=30, min_calls=4, failure_rate=0.5, open_seconds=10)
+
+
+def test_opens_at_the_failure_rate_after_min_calls(breaker):
+    for success in (True, False, False):
+        breaker.record(success)
+    assert breaker.state == CLOSED
+    breaker.record(True)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_old_outcomes_leave_the_window(breaker, clock):
+    breaker.record(False)
+    breaker.record(False)
+    clock.now += 31
+    breaker.record(True)
+    breaker.record(True)
+    breaker.record(False)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_allows_a_single_probe(breaker, clock):
+    for _ in range(4):
+        breaker.record(False)
+    clock.now += 10
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+
+def test_probe_success_closes_and_failure_reopens(breaker, clock):
+    for _ in range(4):
+        breaker.record(False)
+    clock.now += 10
+    breaker.allow()
+    breaker.record(False)
+    assert breaker.state == OPEN
+    clock.now += 10
+    breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_cancelled_probe_frees_the_slot(breaker, clock):
+    for _ in range(4):
+        breaker.record(False)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.cancel()
+    assert breaker.allow()
+
+
+def test_guard_counts_exceptions_except_ignored_ones(clock):
+    guard = BackendGuard('test', max_concurrent=2)
+    guard.breaker = CircuitBreaker('test', min_calls=2, failure_rate=0.5)
+    with pytest.raises(ValueError):
+        with guard.call(ignore=(ValueError,)):
+            raise ValueError("erro do pedido")
+    assert guard.breaker._outcomes[-1][1] is True
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            with guard.call():
+                raise ConnectionError("backend em baixo")
+    assert guard.breaker.state == OPEN
+    with pytest.raises(BackendUnavailable):
+        with guard.call():
+            pass
+
+
+def test_guard_rejects_calls_beyond_the_bulkhead(clock):
+    guard = BackendGuard('test', max_concurrent=1, max_wait=0)
+    with guard.call():
+        with pytest.raises(BackendUnavailable):
+            with guard.call():
+                pass
+    with guard.call() as outcome:
+        outcome.fail()
+    assert guard.breaker._outcomes[-1][1] is False
@@ -0,0 +1,86 @@
+# ==============================================================================
+# ARQUIVO: tests/test_inventory_service.py
+# DESCRIÇÃO: Reservas e libertações do inventário por contrato
+#              (inventory_service.InventoryService).
+# ==============================================================================
+import pytest
+from app.integration_server.utils import contracts
+from app.integration_server.utils.inventory_service import InventoryService
+
+
+def publish_snapshot(chain, product_code, available, contract_id):
+    chain.publish('inventory_stream', contracts.item_keys(product_code, contract_id),
+                  {'product_code': product_code, 'available_stock': available, 'consumed_stock': 0,
+                   'contract_id': contract_id})
+
+
+@pytest.fixture
+def inventory(chain):
+    publish_snapshot(chain, 'P1', 100, 'contract_a')
+    publish_snapshot(chain, 'P1', 40, 'contract_b')
+    return InventoryService(partition='contract_a', refresh_interval=0)
+
+
+def test_requires_a_contract():
+    with pytest.raises(ValueError):
+        InventoryService()
+
+
+def test_snapshot_only_holds_the_contract_partition(inventory):
+    assert inventory.snapshot() == {'P1': {'product_code': 'P1', 'available_stock': 100, 'consumed_stock': 0,
+                                           'contract_id': 'contract_a'}}
+
+
+def test_reserve_publishes_a_delta_in_the_partition(chain, inventory):
+    txid = inventory.reserve('P1', 7)
+    assert txid
+    item = chain.streams['inventory_stream'][-1]
+    assert item['keys'] == ['P1', 'contract:contract_a']
+    assert inventory.get('P1')['consumed_stock'] == 7
+    # Outro contrato com o mesmo produto não é afetado.
+    assert InventoryService(partition='contract_b', refresh_interval=0).get('P1')['consumed_stock'] == 0
+
+
+def test_own_delta_is_not_counted_twice(inventory):
+    inventory.reserve('P1', 5)
+    inventory.refresh(force=True)
+    assert inventory.get('P1')['consumed_stock'] == 5
+
+
+def test_deltas_from_other_processes_are_applied(inventory):
+    other = InventoryService(partition='contract_a', refresh_interval=0)
+    other.reserve('P1', 3)
+    inventory.reserve('P1', 2)
+    assert inventory.get('P1')['consumed_stock'] == 5
+    assert other.get('P1')['consumed_stock'] == 5
+
+
+def test_release_returns_the_stock(inventory):
+    inventory.reserve('P1', 10)
+    assert inventory.release('P1', 4, reason='pedido não publicado')
+    assert inventory.get('P1')['consumed_stock'] == 6
+    assert InventoryService(partition='contract_a', refresh_interval=0).get('P1')['consumed_stock'] == 6
+
+
+def test_non_positive_quantities_are_ignored(chain, inventory):
+    published = len(chain.streams['inventory_stream'])
+    assert inventory.reserve('P1', 0) is None
+    assert inventory.release('P1', -2) is None
+    assert len(chain.streams['inventory_stream']) == published
+
+
+def test_failed_publication_is_rolled_back(chain, inventory):
+    chain.fail_publish = True
+    assert inventory.reserve('P1', 9) is None
+    assert inventory.get('P1')['consumed_stock'] == 0
+
+
+def test_unanswered_publication_found_on_chain_is_kept(chain, inventory, monkeypatch):
+    # O nó aceita o delta mas a resposta perde-se (ex: timeout).
+    def publish_without_answer(stream_name, key, data):
+        chain.publish(stream_name, key, data)
+        return None
+    monkeypatch.setattr('app.integration_server.utils.blockchain_utils.publish_to_blockchain', publish_without_answer)
+    assert inventory.reserve('P1', 4) == chain.streams['inventory_stream'][-1]['txid']
+    inventory.refresh(force=True)
+    assert inventory.get('P1')['consumed_stock'] == 4
@@ -0,0 +1,79 @@
+# ==============================================================================
+# ARQUIVO: tests/test_merge_record.py
+# DESCRIÇÃO: Fusão dos itens de uma chave (merge_record) e as leituras que a
+#              usam: get_key_state e get_partition_items, com a cache
+#              incremental das fusões.
+# ==============================================================================
+from collections import OrderedDict
+import pytest
+from app.integration_server.utils import blockchain_utils, contracts
+from app.integration_server.utils.blockchain_utils import merge_record
+
+
+def test_delta_fields_win():
+    assert merge_record({'status': 'Aguardando', 'cnpj': '1'}, {'status': 'Aprovado'}) == \
+        {'status': 'Aprovado', 'cnpj': '1'}
+
+
+def test_first_item_starts_the_state():
+    delta = {'status': 'Aguardando'}
+    state = merge_record(None, delta)
+    assert state == delta
+    state['status'] = 'outro'
+    assert delta == {'status': 'Aguardando'}
+
+
+def test_invalid_items_are_ignored():
+    state = {'status': 'Aguardando'}
+    assert merge_record(state, None) is state
+    assert merge_record(state, ['not', 'a', 'dict']) is state
+
+
+@pytest.fixture
+def rpc_chain(chain, monkeypatch):
+    """FakeChain também atrás de 'liststreamkeyitems', com caches vazias."""
+    monkeypatch.setattr(blockchain_utils, '_key_states', OrderedDict())
+    monkeypatch.setattr(blockchain_utils, '_partition_states', OrderedDict())
+    calls = []
+
+    def rpc(method, params):
+        assert method == 'liststreamkeyitems'
+        stream_name, key, _, count, start, _ = params
+        calls.append(start)
+        return chain.list_key_items(stream_name, key, start, count)
+
+    monkeypatch.setattr(blockchain_utils, '_make_rpc_request', rpc)
+    chain.rpc_starts = calls
+    return chain
+
+
+def test_key_state_merges_every_item_and_reads_only_new_ones(rpc_chain):
+    rpc_chain.publish('orders_stream', 'order_1', {'status': 'Aguardando', 'cnpj': '1'})
+    rpc_chain.publish('orders_stream', 'order_1', {'order_txid': 'abc'})
+    assert blockchain_utils.get_key_state('orders_stream', 'order_1') == \
+        {'status': 'Aguardando', 'cnpj': '1', 'order_txid': 'abc'}
+
+    rpc_chain.publish('orders_stream', 'order_1', {'status': 'Aprovado'})
+    rpc_chain.rpc_starts.clear()
+    assert blockchain_utils.get_key_state('orders_stream', 'order_1')['status'] == 'Aprovado'
+    assert rpc_chain.rpc_starts == [2]
+    # Com o número de itens conhecido e igual ao da cache, não há RPC.
+    rpc_chain.rpc_starts.clear()
+    blockchain_utils.get_key_state('orders_stream', 'order_1', item_count=3)
+    assert rpc_chain.rpc_starts == []
+
+
+def test_missing_key_has_no_state(rpc_chain):
+    assert blockchain_utils.get_key_state('orders_stream', 'nothing') is None
+
+
+def test_partition_items_merge_per_record_key(rpc_chain):
+    rpc_chain.publish('deliveries_stream', contracts.item_keys('d1', 'contract_a'), {'status': 'Entregue'})
+    rpc_chain.publish('deliveries_stream', contracts.item_keys('d2', 'contract_b'), {'status': 'Entregue'})
+    rpc_chain.publish('deliveries_stream', contracts.item_keys('d1', 'contract_a'), {'approved_by': 'fin'})
+    records = blockchain_utils.get_partition_items('deliveries_stream', 'contract_a')
+    assert records == [{'status': 'Entregue', 'approved_by': 'fin', 'key': 'd1'}]
+
+    rpc_chain.publish('deliveries_stream', contracts.item_keys('d3', 'contract_a'), {'status': 'Entregue'})
+    records = blockchain_utils.get_partition_items('deliveries_stream', 'contract_a')
+    assert sorted(record['key'] for record in records) == ['d1', 'd3']
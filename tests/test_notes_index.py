@@ -0,0 +1,75 @@
+# ==============================================================================
+# ARQUIVO: tests/test_notes_index.py
+# DESCRIÇÃO: Feed de notificações por contrato e perfil (stream_index.NotesIndex).
+# ==============================================================================
+import pytest
+from app.integration_server.utils import contracts
+from app.integration_server.utils.stream_index import NotesIndex
+
+
+def publish_note(chain, key, role, contract_id, text=''):
+    chain.publish('notes_stream', contracts.item_keys(key, contract_id),
+                  {'Texto': text or key, 'target_role': role, 'contract_id': contract_id})
+
+
+@pytest.fixture
+def index(chain):
+    publish_note(chain, 'n0', 'cliente', 'contract_a')      # posição 0
+    publish_note(chain, 'n1', 'financeiro', 'contract_a')   # posição 1
+    publish_note(chain, 'n2', 'cliente', 'contract_b')      # posição 2
+    publish_note(chain, 'n3', 'cliente', 'contract_a')      # posição 3
+    return NotesIndex(refresh_interval=0)
+
+
+def keys(notes):
+    return [note['key'] for note in notes]
+
+
+def test_feed_is_scoped_by_contract_and_role(index):
+    notes, cursor = index.feed('cliente', contract_id='contract_a')
+    assert keys(notes) == ['n0', 'n3']
+    assert cursor == 3
+    notes, _ = index.feed(None, contract_id='contract_a')
+    assert keys(notes) == ['n0', 'n1', 'n3']
+    notes, _ = index.feed('cliente')
+    assert keys(notes) == ['n0', 'n2', 'n3']
+
+
+def test_cursors_are_global_stream_positions(chain, index):
+    notes, cursor = index.feed('cliente', contract_id='contract_b')
+    assert [note['seq'] for note in notes] == [2]
+    publish_note(chain, 'n4', 'cliente', 'contract_b')
+    notes, cursor = index.feed('cliente', since=cursor, contract_id='contract_b')
+    assert keys(notes) == ['n4']
+    assert cursor == 4
+
+
+def test_since_without_new_notes_keeps_the_cursor(index):
+    notes, cursor = index.feed('financeiro', since=1, contract_id='contract_a')
+    assert notes == []
+    assert cursor == 1
+    notes, cursor = index.feed('entregador', contract_id='contract_a')
+    assert notes == []
+    assert cursor == -1
+
+
+def test_limit_returns_the_newest_or_the_next_notes(index):
+    notes, _ = index.feed(None, limit=2, contract_id='contract_a')
+    assert keys(notes) == ['n1', 'n3']
+    notes, cursor = index.feed(None, since=-1, limit=2, contract_id='contract_a')
+    assert keys(notes) == ['n0', 'n1']
+    assert cursor == 1
+
+
+def test_republished_note_replaces_the_previous_one(chain, index):
+    index.feed()
+    publish_note(chain, 'n0', 'cliente', 'contract_a', text='nova')
+    notes, _ = index.feed('cliente', contract_id='contract_a')
+    assert keys(notes) == ['n3', 'n0']
+    assert notes[-1]['Texto'] == 'nova'
+
+
+def test_contract_view_matches_the_projection_interface(index):
+    notes, cursor = index.for_contract('contract_a').feed('cliente', since=0)
+    assert keys(notes) == ['n3']
+    assert cursor == 3
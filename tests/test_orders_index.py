@@ -0,0 +1,72 @@
+# ==============================================================================
+# ARQUIVO: tests/test_orders_index.py
+# DESCRIÇÃO: Paginação e filtros do índice de pedidos (stream_index.OrdersIndex).
+# ==============================================================================
+import pytest
+from app.integration_server.utils import contracts
+from app.integration_server.utils.stream_index import OrdersIndex, InvalidCursor
+
+CONTRACT = 'contract_a'
+
+
+def publish_order(chain, key, when, status='Aguardando avaliação', cnpj='111', contract_id=CONTRACT):
+    chain.publish('orders_stream', contracts.item_keys(key, contract_id),
+                  {'data_hora_utc': when, 'status': status, 'cnpj': cnpj, 'contract_id': contract_id})
+
+
+@pytest.fixture
+def index(chain):
+    for day in range(1, 8):
+        publish_order(chain, f"order_{day}", f"2024-09-0{day}T10:00:00",
+                      status='Aprovado' if day % 2 else 'Recusado', cnpj='111' if day <= 4 else '222')
+    publish_order(chain, 'order_other', '2024-09-09T10:00:00', contract_id='contract_b')
+    return OrdersIndex(partition=CONTRACT, refresh_interval=0)
+
+
+def keys(items):
+    return [item['key'] for item in items]
+
+
+def test_pages_run_from_newest_to_oldest(index):
+    first, cursor = index.page(3)
+    assert keys(first) == ['order_7', 'order_6', 'order_5']
+    second, cursor = index.page(3, cursor)
+    assert keys(second) == ['order_4', 'order_3', 'order_2']
+    last, cursor = index.page(3, cursor)
+    assert keys(last) == ['order_1']
+    assert cursor is None
+
+
+def test_page_only_reads_its_partition(index):
+    items, _ = index.page(50)
+    assert 'order_other' not in keys(items)
+    assert len(items) == 7
+
+
+def test_filters_apply_before_the_limit(index):
+    items, cursor = index.page(2, status='Aprovado')
+    assert keys(items) == ['order_7', 'order_5']
+    items, cursor = index.page(2, cursor, status='Aprovado')
+    assert keys(items) == ['order_3', 'order_1']
+    assert cursor is None
+    items, _ = index.page(50, cnpj='111', status='Recusado')
+    assert keys(items) == ['order_4', 'order_2']
+
+
+def test_date_range_is_inclusive_and_accepts_a_day_prefix(index):
+    items, _ = index.page(50, date_from='2024-09-03', date_to='2024-09-05')
+    assert keys(items) == ['order_5', 'order_4', 'order_3']
+
+
+def test_status_update_moves_nothing_and_is_merged(chain, index):
+    index.page(1)
+    chain.publish('orders_stream', contracts.item_keys('order_7', CONTRACT), {'status': 'Aprovado', 'order_txid': 'abc'})
+    items, _ = index.page(1)
+    assert items[0]['key'] == 'order_7'
+    assert items[0]['cnpj'] == '222'
+    assert index.key_for_txid('abc') == 'order_7'
+
+
+def test_invalid_cursor_is_rejected(index):
+    with pytest.raises(InvalidCursor):
+        index.page(10, cursor='not-a-cursor')
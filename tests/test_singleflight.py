@@ -0,0 +1,112 @@
+# ==============================================================================
+# ARQUIVO: tests/test_singleflight.py
+# DESCRIÇÃO: Agrupamento de leituras simultâneas (app/singleflight.py).
+# ==============================================================================
+import time
+import threading
+from app.singleflight import SingleFlight, SingleFlightError, coalesce
+
+WAITERS = 3
+
+
+def run_concurrently(group, fn, key=('op',)):
+    """
+    Chama group.do(key, fn) numa thread líder e em WAITERS threads que se
+    juntam à chamada em curso. `fn` recebe o evento que a liberta.
+    Retorna os resultados (ou exceções) pela ordem líder, seguidores.
+    """
+    release = threading.Event()
+    joined = threading.Semaphore(0)
+    results = [None] * (WAITERS + 1)
+
+    def call(slot):
+        try:
+            results[slot] = group.do(key, fn, release)
+        except BaseException as e:
+            results[slot] = e
+
+    leader = threading.Thread(target=call, args=(0,))
+    leader.start()
+    while key not in group._calls:
+        time.sleep(0.001)
+    waiters = [threading.Thread(target=call, args=(slot,)) for slot in range(1, WAITERS + 1)]
+    for thread in waiters:
+        thread.start()
+    while group._calls[key].waiters < WAITERS:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + waiters:
+        thread.join(timeout=5)
+    return results
+
+
+def test_concurrent_calls_share_one_execution():
+    group, calls = SingleFlight(), []
+
+    def fn(release):
+        calls.append(1)
+        release.wait()
+        return {'items': [1, 2]}
+
+    results = run_concurrently(group, fn)
+    assert len(calls) == 1
+    assert all(result == {'items': [1, 2]} for result in results)
+    # Cada pedido recebe a sua cópia.
+    results[1]['items'].append(3)
+    assert results[2] == {'items': [1, 2]}
+    assert not group._calls
+
+
+def test_exception_reaches_every_waiter():
+    def fn(release):
+        release.wait()
+        raise ConnectionError("backend em baixo")
+
+    results = run_concurrently(SingleFlight(), fn)
+    assert all(isinstance(result, ConnectionError) for result in results)
+
+
+def test_base_exception_reaches_every_waiter():
+    class Interrupted(BaseException):
+        pass
+
+    def fn(release):
+        release.wait()
+        raise Interrupted()
+
+    results = run_concurrently(SingleFlight(), fn)
+    assert all(isinstance(result, Interrupted) for result in results)
+
+
+def test_waiters_get_an_explicit_error_when_no_result_can_be_shared():
+    class Uncopyable:
+        def __deepcopy__(self, memo):
+            raise TypeError("não copiável")
+
+    def fn(release):
+        release.wait()
+        return Uncopyable()
+
+    results = run_concurrently(SingleFlight(), fn)
+    assert isinstance(results[0], TypeError)
+    assert all(isinstance(result, SingleFlightError) for result in results[1:])
+
+
+def test_sequential_calls_run_again():
+    group, calls = SingleFlight(), []
+    for _ in range(2):
+        group.do(('op',), lambda: calls.append(1))
+    assert len(calls) == 2
+
+
+def test_coalesce_keys_by_arguments():
+    calls = []
+
+    @coalesce('test')
+    def read(stream, start=0):
+        calls.append((stream, start))
+        return stream
+
+    assert read('a', start=1) == 'a'
+    assert read('b') == 'b'
+    assert calls == [('a', 1), ('b', 0)]
@@ -0,0 +1,69 @@
+# ==============================================================================
+# ARQUIVO: tests/test_stream_data.py
+# DESCRIÇÃO: Formatos dos dados dos itens das streams (encode_item_data /
+#              decode_item_data em blockchain_utils).
+# ==============================================================================
+import json
+import pytest
+from app.integration_server.utils import blockchain_utils
+from app.integration_server.utils.blockchain_utils import encode_item_data, decode_item_data, COMPACT_MAGIC
+
+RECORD = {'status': 'Aprovado', 'produtos_solicitados': [{'codigo': 'A1', 'quantidade': 2}]}
+
+
+def test_decodes_native_json():
+    assert decode_item_data({'data': {'json': RECORD}}) == RECORD
+
+
+def test_decodes_text_json():
+    assert decode_item_data({'data': {'text': json.dumps(RECORD)}}) == RECORD
+
+
+def test_decodes_hex_json():
+    assert decode_item_data({'data': json.dumps(RECORD).encode('utf-8').hex()}) == RECORD
+
+
+def test_decodes_the_compact_format():
+    msgpack = pytest.importorskip('msgpack')
+    import zlib
+    raw = COMPACT_MAGIC + zlib.compress(msgpack.packb(RECORD, use_bin_type=True))
+    assert decode_item_data({'data': raw.hex()}) == RECORD
+
+
+def test_fetches_data_not_shown_in_the_listing(monkeypatch):
+    calls = []
+
+    def rpc(method, params):
+        calls.append((method, params))
+        return json.dumps(RECORD).encode('utf-8').hex()
+
+    monkeypatch.setattr(blockchain_utils, '_make_rpc_request', rpc)
+    assert decode_item_data({'data': {'txid': 'abc', 'vout': 0}}) == RECORD
+    assert calls == [('gettxoutdata', ['abc', 0])]
+
+
+@pytest.mark.parametrize('data', [None, '', 'zz-not-hex', b'\xff'.hex(), {'other': 1}])
+def test_invalid_data_decodes_to_none(data):
+    assert decode_item_data({'data': data, 'txid': 't'}) is None
+
+
+def test_hex_is_the_default_format(monkeypatch):
+    monkeypatch.setattr(blockchain_utils, 'STREAM_DATA_FORMAT', 'hex')
+    encoded = encode_item_data(RECORD)
+    assert isinstance(encoded, str)
+    assert decode_item_data({'data': encoded}) == RECORD
+
+
+def test_native_json_is_opt_in(monkeypatch):
+    monkeypatch.setattr(blockchain_utils, 'STREAM_DATA_FORMAT', 'json')
+    assert encode_item_data(RECORD) == {'json': RECORD}
+
+
+def test_large_records_use_the_compact_format(monkeypatch):
+    pytest.importorskip('msgpack')
+    monkeypatch.setattr(blockchain_utils, 'STREAM_COMPACT_MIN_BYTES', 64)
+    record = {'notes': 'x' * 500}
+    encoded = encode_item_data(record)
+    assert bytes.fromhex(encoded).startswith(COMPACT_MAGIC)
+    assert len(encoded) < len(json.dumps(record)) * 2
+    assert decode_item_data({'data': encoded}) == record
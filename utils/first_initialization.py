@@ -3,7 +3,7 @@
 # DESCRIÇÃO:  Script para a configuração inicial da aplicação em ambiente Docker.
 #             Prepara as chaves de segurança, cria as streams na blockchain,
 #             concede permissões aos nós da rede e popula com dados iniciais.
-# VERSÃO:     6.0 (Adaptado para Multi-Nó com Docker)
+# VERSÃO:     7.4 (Inventário na partição do contrato)
 # ==============================================================================
 
 # --- 1. IMPORTAÇÕES E CONFIGURAÇÃO DO AMBIENTE ---
@@ -12,18 +12,26 @@ import sys
 import json
 import glob
 import time
+import hashlib
+import logging
 import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from cryptography.fernet import Fernet
 
+# Logger com nome fixo (e não __name__, que vale '__main__' quando o script é
+# executado diretamente) para que LOG_LEVELS="init=DEBUG" funcione.
+logger = logging.getLogger('utils.first_initialization')
+
 # Adiciona o diretório da aplicação ao path do Python para permitir importações.
 # No ambiente Docker, o código da aplicação reside em /app.
 sys.path.insert(0, '/app/nomus_blockchain')
 
 try:
-    from app.integration_server.utils import blockchain_utils, ipfs_utils
+    from app.integration_server.utils import blockchain_utils, ipfs_utils, contracts
+    from utils.init_manifest import InitManifest
 except ImportError as e:
-    print(f"ERRO CRÍTICO: Não foi possível importar os módulos da aplicação. Verifique a estrutura de pastas.")
-    print(f"Detalhes: {e}")
+    logger.error("ERRO CRÍTICO: Não foi possível importar os módulos da aplicação. Verifique a estrutura de pastas.")
+    logger.error("Detalhes: %s", e)
     sys.exit(1)
 
 # --- 2. CONSTANTES DE CONFIGURAÇÃO ---
@@ -35,12 +43,17 @@ CONTRACT_PDF_PATH = os.path.join(APP_ROOT, 'app/integration_server/config/CONTRA
 ENCRYPTED_CONTRACT_PATH = os.path.join(APP_ROOT, 'app/integration_server/config/CONTRATO_MODELO.pdf.enc')
 DELIVERIES_PDF_DIR = os.path.join(APP_ROOT, 'app/integration_server/config/deliveries')
 ENV_FILE_PATH = os.path.join(APP_ROOT, '.env')
+INIT_MANIFEST_PATH = os.getenv('INIT_MANIFEST_PATH', os.path.join(APP_ROOT, 'instance', 'init_manifest.json'))
 
 STREAMS_TO_CREATE = [
     'config_stream', 'inventory_stream', 'financial_stream',
     'orders_stream', 'deliveries_stream', 'notes_stream'
 ]
 
+# Processos para encriptar os PDFs e uploads simultâneos para o IPFS.
+INIT_ENCRYPT_WORKERS = int(os.getenv('INIT_ENCRYPT_WORKERS', str(os.cpu_count() or 2)))
+INIT_UPLOAD_CONCURRENCY = int(os.getenv('INIT_UPLOAD_CONCURRENCY', '4'))
+
 # --- 3. FUNÇÕES DE INICIALIZAÇÃO ---
 
 def initialize_security_keys():
@@ -48,39 +61,39 @@ def initialize_security_keys():
     Gera e guarda as chaves de encriptação para o contrato e para as entregas
     no ficheiro .env, se ainda não existirem. Também encripta o contrato modelo.
     """
-    print("\n--- PASSO 1: A INICIAR SETUP DE SEGURANÇA ---")
+    logger.info("\n--- PASSO 1: A INICIAR SETUP DE SEGURANÇA ---")
     
     # Garante que o ficheiro .env existe.
     if not os.path.exists(ENV_FILE_PATH):
         open(ENV_FILE_PATH, 'a').close()
-        print(f"Ficheiro '{ENV_FILE_PATH}' criado.")
+        logger.info("Ficheiro '%s' criado.", ENV_FILE_PATH)
 
     with open(ENV_FILE_PATH, 'r+') as f_env:
         env_content = f_env.read()
         
         # Processa a chave do contrato.
         if "CONTRACT_DECRYPTION_KEY" not in env_content:
-            print("  - A gerar chave para o CONTRATO...")
+            logger.info("  - A gerar chave para o CONTRATO...")
             key_contract = Fernet.generate_key()
             f_env.write('\n# Chave de encriptação para o contrato principal\n')
             f_env.write(f'CONTRACT_DECRYPTION_KEY="{key_contract.decode("utf-8")}"\n')
-            print("    -> Chave do contrato adicionada ao .env com sucesso!")
+            logger.info("    -> Chave do contrato adicionada ao .env com sucesso!")
         else:
-            print("  - AVISO: Chave do contrato já existe no .env. A pular.")
+            logger.warning("  - AVISO: Chave do contrato já existe no .env. A pular.")
 
         # Processa a chave das entregas.
         if "DELIVERIES_DECRYPTION_KEY" not in env_content:
-            print("  - A gerar chave para as ENTREGAS...")
+            logger.info("  - A gerar chave para as ENTREGAS...")
             key_deliveries = Fernet.generate_key()
             f_env.write('\n# Chave de encriptação para os PDFs de entregas\n')
             f_env.write(f'DELIVERIES_DECRYPTION_KEY="{key_deliveries.decode("utf-8")}"\n')
-            print("    -> Chave das entregas adicionada ao .env com sucesso!")
+            logger.info("    -> Chave das entregas adicionada ao .env com sucesso!")
         else:
-            print("  - AVISO: Chave das entregas já existe no .env. A pular.")
+            logger.warning("  - AVISO: Chave das entregas já existe no .env. A pular.")
 
     # Encripta o ficheiro de contrato modelo, se ainda não tiver sido feito.
     if not os.path.exists(ENCRYPTED_CONTRACT_PATH) and os.path.exists(CONTRACT_PDF_PATH):
-        print("\n  - A encriptar o ficheiro de contrato modelo...")
+        logger.info("\n  - A encriptar o ficheiro de contrato modelo...")
         try:
             # Recarrega as variáveis de ambiente para garantir que as novas chaves estão disponíveis.
             from dotenv import load_dotenv
@@ -97,74 +110,179 @@ def initialize_security_keys():
             
             with open(ENCRYPTED_CONTRACT_PATH, 'wb') as f_out:
                 f_out.write(encrypted_data)
-            print(f"    -> Ficheiro de contrato encriptado com sucesso em '{ENCRYPTED_CONTRACT_PATH}'.")
+            logger.info("    -> Ficheiro de contrato encriptado com sucesso em '%s'.", ENCRYPTED_CONTRACT_PATH)
         except Exception as e:
-            print(f"    -> ERRO ao encriptar o contrato modelo: {e}")
+            logger.error("    -> ERRO ao encriptar o contrato modelo: %s", e)
     else:
-        print("\n  - AVISO: Ficheiro de contrato já encriptado ou ficheiro original não encontrado. A pular.")
+        logger.warning("\n  - AVISO: Ficheiro de contrato já encriptado ou ficheiro original não encontrado. A pular.")
     
-    print("--- SETUP DE SEGURANÇA FINALIZADO ---")
+    logger.info("--- SETUP DE SEGURANÇA FINALIZADO ---")
 
 
-def initialize_blockchain_structure():
+def initialize_blockchain_structure(manifest):
     """
     Garante que todas as streams necessárias para a aplicação existem na blockchain.
     """
-    print("\n--- PASSO 2: A VERIFICAR E CRIAR STREAMS NA BLOCKCHAIN ---")
+    logger.info("\n--- PASSO 2: A VERIFICAR E CRIAR STREAMS NA BLOCKCHAIN ---")
+    streams_hash = blockchain_utils.content_sha256(STREAMS_TO_CREATE)
+    if manifest.is_done('streams', streams_hash):
+        logger.info("  - Streams já verificadas numa execução anterior. A pular.")
+        return
     all_streams_ok = True
     for stream in STREAMS_TO_CREATE:
-        print(f"  - A verificar stream: '{stream}'...")
+        logger.info("  - A verificar stream: '%s'...", stream)
         if not blockchain_utils.create_and_subscribe_stream_if_not_exists(stream):
-            print(f"    -> ERRO CRÍTICO: Falha ao criar ou subscrever a stream '{stream}'.")
+            logger.error("    -> ERRO CRÍTICO: Falha ao criar ou subscrever a stream '%s'.", stream)
             all_streams_ok = False
     
     if all_streams_ok:
-        print("--- VERIFICAÇÃO DE STREAMS CONCLUÍDA COM SUCESSO ---")
+        manifest.mark_done('streams', streams_hash)
+        logger.info("--- VERIFICAÇÃO DE STREAMS CONCLUÍDA COM SUCESSO ---")
     else:
-        print("--- VERIFICAÇÃO DE STREAMS FALHOU. VERIFIQUE OS LOGS. ---")
+        logger.error("--- VERIFICAÇÃO DE STREAMS FALHOU. VERIFIQUE OS LOGS. ---")
         sys.exit(1)
 
 #PERMISSÕES MOVIDAS PARA START-NODE.SH NO DOCKER-COMPOSE
 
-def initialize_blockchain_data():
+def file_sha256(path):
+    """Hash SHA-256 do conteúdo de um ficheiro, lido em blocos."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def registered_hashes(stream_name):
+    """
+    Retorna os pares (chave, hash) já registados numa stream. O hash é o campo
+    'content_sha256' do registo, quando existe (ficheiros enviados para o
+    IPFS), ou o hash canónico do próprio registo.
+    """
+    from app.integration_server.utils.stream_index import StreamTail
+    registered = set()
+    for _, keys, data, _ in StreamTail(stream_name).poll():
+        if not isinstance(data, dict):
+            continue
+        content_hash = data.get('content_sha256') or blockchain_utils.content_sha256(data)
+        registered.update((key, content_hash) for key in keys)
+    return registered
+
+def publish_new_records(stream_name, entries, contract_id=None):
+    """
+    Publica em lote os registos (chave, dados) que ainda não existem na stream
+    com o mesmo conteúdo; com `contract_id`, também na partição do contrato.
+    Retorna o número de registos publicados, ou None em caso de falha.
+    """
+    registered = registered_hashes(stream_name)
+    pending = [(key, data) for key, data in entries
+               if (key, blockchain_utils.content_sha256(data)) not in registered]
+    if len(pending) < len(entries):
+        logger.info("    -> %d de %d registos já existem na '%s'. A pular.", len(entries) - len(pending), len(entries), stream_name)
+    if contract_id is not None:
+        pending = [(contracts.item_keys(key, contract_id), data) for key, data in pending]
+    if blockchain_utils.publish_many_to_blockchain(stream_name, pending) is None:
+        return None
+    return len(pending)
+
+def _encrypt_file(pdf_path, key_bytes):
+    # Executada num processo separado: lê e encripta um PDF.
+    with open(pdf_path, 'rb') as f:
+        return ipfs_utils.encrypt_data(f.read(), key_bytes)
+
+def encrypt_and_upload(paths, key_bytes, on_uploaded=None):
+    """
+    Encripta os ficheiros num pool de processos e envia cada resultado para o
+    IPFS assim que fica pronto, com vários uploads em simultâneo.
+    `on_uploaded(caminho, hash)` é chamada após cada upload bem-sucedido.
+
+    Returns:
+        dict: Caminho -> hash IPFS (None para os ficheiros que falharam).
+    """
+    results = {}
+    if not paths:
+        return results
+    with ProcessPoolExecutor(max_workers=min(INIT_ENCRYPT_WORKERS, len(paths))) as encryptors, \
+         ThreadPoolExecutor(max_workers=INIT_UPLOAD_CONCURRENCY) as uploaders:
+        encryptions = {path: encryptors.submit(_encrypt_file, path, key_bytes) for path in paths}
+        uploads = {}
+        for path, future in encryptions.items():
+            encrypted = future.result()
+            if encrypted is None:
+                logger.error("      -> ERRO: Falha ao encriptar %s.", os.path.basename(path))
+                results[path] = None
+                continue
+            uploads[path] = uploaders.submit(ipfs_utils.add_to_ipfs, encrypted)
+        for path, future in uploads.items():
+            results[path] = future.result()
+            if results[path] and on_uploaded:
+                on_uploaded(path, results[path])
+    return results
+
+def initialize_blockchain_data(manifest):
     """
     Popula a blockchain com os dados iniciais necessários para a aplicação, como
     o contrato, o inventário, dados financeiros e entregas pré-existentes.
+    Os passos concluídos ficam no manifesto e são saltados sem consultar a
+    blockchain; dentro de um passo interrompido, ficheiros já enviados para o
+    IPFS e registos já presentes na stream (mesma chave e hash) são ignorados.
     """
-    print("\n--- PASSO 4: A INICIAR POPULAÇÃO DE DADOS NA BLOCKCHAIN ---")
+    logger.info("\n--- PASSO 4: A INICIAR POPULAÇÃO DE DADOS NA BLOCKCHAIN ---")
 
     # 4.1: Enviar o contrato para o IPFS e registar o hash na blockchain.
-    print("\n  [4.1] A processar contrato principal...")
+    logger.info("\n  [4.1] A processar contrato principal...")
     try:
-        with open(ENCRYPTED_CONTRACT_PATH, 'rb') as f:
-            encrypted_contract_bytes = f.read()
-        
-        ipfs_hash = ipfs_utils.add_to_ipfs(encrypted_contract_bytes)
-        if not ipfs_hash:
-            raise Exception("Falha ao enviar o contrato para o IPFS.")
-        
-        print(f"    -> Contrato enviado para o IPFS. Hash: {ipfs_hash}")
-
-        contract_metadata = {
-            "document_type": "master_contract",
-            "ipfs_hash_encrypted": ipfs_hash,
-            "valid_from": "2024-08-01",
-            "valid_until": "2025-02-28"
-        }
-        txid = blockchain_utils.publish_to_blockchain('config_stream', "contract_v1", contract_metadata)
-        if not txid:
-            raise Exception("Falha ao registar metadados do contrato na blockchain.")
-        print(f"    -> Metadados do contrato registados na stream 'config_stream'.")
+        contract_hash = file_sha256(ENCRYPTED_CONTRACT_PATH)
+        if manifest.is_done('contract', contract_hash):
+            logger.info("    -> Contrato já processado numa execução anterior. A pular.")
+        elif (contracts.DEFAULT_CONTRACT_ID, contract_hash) in registered_hashes('config_stream'):
+            logger.info("    -> Contrato já registado na 'config_stream'. A pular.")
+            manifest.mark_done('contract', contract_hash)
+        else:
+            uploaded = manifest.get_file('contract', contracts.DEFAULT_CONTRACT_ID, contract_hash)
+            if uploaded:
+                ipfs_hash = uploaded["ipfs_hash"]
+                logger.info("    -> Contrato já enviado para o IPFS. Hash: %s", ipfs_hash)
+            else:
+                with open(ENCRYPTED_CONTRACT_PATH, 'rb') as f:
+                    encrypted_contract_bytes = f.read()
+
+                ipfs_hash = ipfs_utils.add_to_ipfs(encrypted_contract_bytes)
+                if not ipfs_hash:
+                    raise Exception("Falha ao enviar o contrato para o IPFS.")
+                manifest.record_file('contract', contracts.DEFAULT_CONTRACT_ID, contract_hash, ipfs_hash=ipfs_hash)
+
+                logger.info("    -> Contrato enviado para o IPFS. Hash: %s", ipfs_hash)
+
+            contract_metadata = {
+                "document_type": "master_contract",
+                "ipfs_hash_encrypted": ipfs_hash,
+                "content_sha256": contract_hash,
+                "valid_from": "2024-08-01",
+                "valid_until": "2025-02-28",
+                # Cliente e pedido de venda da Nomus a que as entregas pertencem.
+                "nomus_client_id": 3543,
+                "sales_order_id": contracts.DEFAULT_SALES_ORDER_ID
+            }
+            txid = blockchain_utils.publish_to_blockchain('config_stream', contracts.DEFAULT_CONTRACT_ID, contract_metadata)
+            if not txid:
+                raise Exception("Falha ao registar metadados do contrato na blockchain.")
+            manifest.mark_done('contract', contract_hash)
+            logger.info("    -> Metadados do contrato registados na stream 'config_stream'.")
     except Exception as e:
-        print(f"    -> ERRO na etapa do contrato: {e}")
+        logger.error("    -> ERRO na etapa do contrato: %s", e)
         return
 
-    # 4.2: Ler o catálogo de produtos e inicializar o inventário.
-    print("\n  [4.2] A inicializar inventário de produtos...")
+    # 4.2: Ler o catálogo de produtos e inicializar o inventário do contrato.
+    # Os snapshots já publicados não são repetidos: republicá-los anularia o
+    # consumo registado desde então pelos deltas. Basta um item com a chave do
+    # produto para o considerar inicializado (ex: um snapshot anterior à
+    # partição por contrato, migrado por utils/partition_contracts.py).
+    logger.info("\n  [4.2] A inicializar inventário de produtos...")
     try:
         with open(PRODUCT_CATALOG_PATH, 'r', encoding='utf-8') as f:
             product_catalog = json.load(f)
 
+        inventory_entries = []
         for group in product_catalog:
             initial_stock = group.get("quantidade_inicial_contrato", 0)
             if group.get("variants") and len(group["variants"]) > 0:
@@ -173,16 +291,26 @@ def initialize_blockchain_data():
                     "product_code": inventory_key,
                     "product_group": group["product_group"],
                     "available_stock": int(initial_stock),
-                    "consumed_stock": 0
+                    "consumed_stock": 0,
+                    "contract_id": contracts.DEFAULT_CONTRACT_ID
                 }
-                blockchain_utils.publish_to_blockchain('inventory_stream', inventory_key, inventory_data)
-        print("    -> Inventário inicializado com sucesso.")
+                inventory_entries.append((inventory_key, inventory_data))
+        inventory_hash = blockchain_utils.content_sha256(inventory_entries)
+        if manifest.is_done('inventory', inventory_hash):
+            logger.info("    -> Inventário já inicializado numa execução anterior. A pular.")
+        else:
+            published_products = {key for key, _ in registered_hashes('inventory_stream')}
+            inventory_entries = [(key, data) for key, data in inventory_entries if key not in published_products]
+            if publish_new_records('inventory_stream', inventory_entries, contract_id=contracts.DEFAULT_CONTRACT_ID) is None:
+                raise Exception("Falha ao publicar o inventário na blockchain.")
+            manifest.mark_done('inventory', inventory_hash)
+            logger.info("    -> Inventário inicializado com sucesso.")
     except Exception as e:
-        print(f"    -> ERRO ao processar catálogo de produtos: {e}")
+        logger.error("    -> ERRO ao processar catálogo de produtos: %s", e)
         return
 
     # 4.3: Inicializar o status financeiro (parcelas).
-    print("\n  [4.3] A inicializar status financeiro...")
+    logger.info("\n  [4.3] A inicializar status financeiro...")
     try:
         installments = [
             {"id_nomus": 20748, "due_date": "2024-09-27", "value": 41632.65, "paid": True},
@@ -192,70 +320,127 @@ def initialize_blockchain_data():
             {"id_nomus": 23510, "due_date": "2025-01-26", "value": 16653.06, "paid": False},
             {"id_nomus": 23914, "due_date": "2025-01-26", "value": 16653.06, "paid": True}
         ]
-        for inst in installments:
-            key = f"installment_{inst['id_nomus']}"
-            blockchain_utils.publish_to_blockchain('financial_stream', key, inst)
-        print("    -> Dados financeiros inicializados com sucesso.")
+        installment_entries = [(f"installment_{inst['id_nomus']}", inst) for inst in installments]
+        installments_hash = blockchain_utils.content_sha256(installment_entries)
+        if manifest.is_done('installments', installments_hash):
+            logger.info("    -> Dados financeiros já inicializados numa execução anterior. A pular.")
+        else:
+            if publish_new_records('financial_stream', installment_entries, contracts.DEFAULT_CONTRACT_ID) is None:
+                raise Exception("Falha ao publicar as parcelas na blockchain.")
+            manifest.mark_done('installments', installments_hash)
+            logger.info("    -> Dados financeiros inicializados com sucesso.")
     except Exception as e:
-        print(f"    -> ERRO ao inicializar dados financeiros: {e}")
+        logger.error("    -> ERRO ao inicializar dados financeiros: %s", e)
         return
 
     # 4.4: Encriptar e registar PDFs de entregas iniciais.
-    print("\n  [4.4] A processar PDFs de entregas iniciais...")
+    # O hash do PDF original é guardado no registo, pelo que as entregas já
+    # registadas nem sequer são encriptadas de novo.
+    logger.info("\n  [4.4] A processar PDFs de entregas iniciais...")
     try:
         key_str = os.getenv('DELIVERIES_DECRYPTION_KEY')
         if not key_str:
             raise ValueError("A chave DELIVERIES_DECRYPTION_KEY não foi encontrada no .env")
         
-        delivery_files = glob.glob(os.path.join(DELIVERIES_PDF_DIR, '*.pdf'))
+        delivery_files = sorted(glob.glob(os.path.join(DELIVERIES_PDF_DIR, '*.pdf')))
         if not delivery_files:
-            print("    -> AVISO: Nenhum PDF de entrega encontrado em 'config/deliveries'. A pular.")
-        
-        for pdf_path in delivery_files:
+            logger.warning("    -> AVISO: Nenhum PDF de entrega encontrado em 'config/deliveries'. A pular.")
+
+        file_hashes = {pdf_path: file_sha256(pdf_path) for pdf_path in delivery_files}
+        deliveries_hash = blockchain_utils.content_sha256(sorted(
+            [os.path.basename(pdf_path), pdf_hash] for pdf_path, pdf_hash in file_hashes.items()))
+        if manifest.is_done('deliveries', deliveries_hash):
+            logger.info("    -> Entregas já registadas numa execução anterior. A pular.")
+            logger.info("\n--- POPULAÇÃO DE DADOS NA BLOCKCHAIN FINALIZADA ---")
+            return
+
+        registered = registered_hashes('deliveries_stream')
+        delivery_key_id = ipfs_utils.key_id(key_str.encode('utf-8'))
+        pending, to_upload = {}, []
+        for pdf_path, pdf_hash in file_hashes.items():
             delivery_id = os.path.splitext(os.path.basename(pdf_path))[0]
-            print(f"    - A processar entrega: {delivery_id}.pdf")
-            
-            with open(pdf_path, 'rb') as f:
-                pdf_bytes = f.read()
-            
-            encrypted_pdf = ipfs_utils.encrypt_data(pdf_bytes, key_str.encode('utf-8'))
-            ipfs_hash = ipfs_utils.add_to_ipfs(encrypted_pdf)
-            
-            if ipfs_hash:
-                delivery_metadata = {
-                    "delivery_id": delivery_id,
-                    "ipfs_hash_encrypted": ipfs_hash,
-                    "status": "Confirmado", # Marca como confirmado para não aparecer como pendente.
-                    "approved_by": "Sistema (Inicialização)",
-                    "approved_at_utc": datetime.datetime.now(datetime.timezone.utc).isoformat()
-                }
-                blockchain_utils.publish_to_blockchain('deliveries_stream', delivery_id, delivery_metadata)
-                print(f"      -> Entrega {delivery_id} registada com sucesso.")
+            if (delivery_id, pdf_hash) in registered:
+                logger.info("    - Entrega %s já registada. A pular.", delivery_id)
+                continue
+            pending[pdf_path] = (delivery_id, pdf_hash)
+            if manifest.get_file('deliveries', delivery_id, pdf_hash):
+                continue
+            # O mesmo PDF já enviado com a mesma chave (por esta ou outra via).
+            known_cid = ipfs_utils.lookup_cid(pdf_hash, delivery_key_id)
+            if known_cid:
+                manifest.record_file('deliveries', delivery_id, pdf_hash, ipfs_hash=known_cid)
             else:
-                print(f"      -> ERRO: Falha ao enviar {delivery_id}.pdf para o IPFS.")
+                to_upload.append(pdf_path)
+
+        def remember_upload(pdf_path, ipfs_hash):
+            delivery_id, pdf_hash = pending[pdf_path]
+            ipfs_utils.remember_cid(pdf_hash, delivery_key_id, ipfs_hash)
+            manifest.record_file('deliveries', delivery_id, pdf_hash, ipfs_hash=ipfs_hash)
+
+        logger.info("    - A encriptar e enviar %d PDFs para o IPFS...", len(to_upload))
+        encrypt_and_upload(to_upload, key_str.encode('utf-8'), on_uploaded=remember_upload)
+
+        delivery_entries = []
+        for pdf_path, (delivery_id, pdf_hash) in pending.items():
+            uploaded = manifest.get_file('deliveries', delivery_id, pdf_hash)
+            ipfs_hash = uploaded["ipfs_hash"] if uploaded else None
+            if not ipfs_hash:
+                logger.error("      -> ERRO: Falha ao enviar %s.pdf para o IPFS.", delivery_id)
+                continue
+            delivery_metadata = {
+                "delivery_id": delivery_id,
+                "ipfs_hash_encrypted": ipfs_hash,
+                "content_sha256": pdf_hash,
+                "status": "Confirmado", # Marca como confirmado para não aparecer como pendente.
+                "approved_by": "Sistema (Inicialização)",
+                "approved_at_utc": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "contract_id": contracts.DEFAULT_CONTRACT_ID
+            }
+            delivery_entries.append((contracts.item_keys(delivery_id, contracts.DEFAULT_CONTRACT_ID), delivery_metadata))
+
+        if blockchain_utils.publish_many_to_blockchain('deliveries_stream', delivery_entries) is None:
+            raise Exception("Falha ao registar as entregas na blockchain.")
+        logger.info("      -> %d entregas registadas com sucesso.", len(delivery_entries))
+        if len(delivery_entries) == len(pending):
+            manifest.mark_done('deliveries', deliveries_hash)
     except Exception as e:
-        print(f"    -> ERRO CRÍTICO ao processar PDFs de entregas: {e}")
+        logger.error("    -> ERRO CRÍTICO ao processar PDFs de entregas: %s", e)
         return
     
-    print("\n--- POPULAÇÃO DE DADOS NA BLOCKCHAIN FINALIZADA ---")
+    logger.info("\n--- POPULAÇÃO DE DADOS NA BLOCKCHAIN FINALIZADA ---")
 
 
 # --- 5. PONTO DE ENTRADA DO SCRIPT ---
 if __name__ == "__main__":
-    print("==========================================================")
-    print("== INICIANDO SCRIPT DE CONFIGURAÇÃO INICIAL DA APLICAÇÃO ==")
-    print("==========================================================")
+    # A saída do script é apenas a mensagem, sem carimbo de data ou nível.
+    from app.logging_config import setup_logging
+    setup_logging(fmt='%(message)s')
+
+    logger.info("==========================================================")
+    logger.info("== INICIANDO SCRIPT DE CONFIGURAÇÃO INICIAL DA APLICAÇÃO ==")
+    logger.info("==========================================================")
     
+    # --force descarta o manifesto (ex.: a blockchain foi recriada do zero).
+    import argparse
+    parser = argparse.ArgumentParser(description="Configuração inicial da aplicação.")
+    parser.add_argument('--force', action='store_true', help="Ignora o progresso guardado no manifesto.")
+    args = parser.parse_args()
+
     # Carrega as variáveis de ambiente do ficheiro .env para o ambiente atual.
     from dotenv import load_dotenv
     load_dotenv(ENV_FILE_PATH)
 
+    manifest = InitManifest(INIT_MANIFEST_PATH)
+    if args.force:
+        logger.info("A descartar o manifesto de progresso '%s'.", INIT_MANIFEST_PATH)
+        manifest.reset()
+
     # Executa as funções de inicialização na ordem correta e necessária.
     initialize_security_keys()
-    initialize_blockchain_structure()
+    initialize_blockchain_structure(manifest)
     
-    initialize_blockchain_data()
+    initialize_blockchain_data(manifest)
     
-    print("\n==========================================================")
-    print("=== SCRIPT DE INICIALIZAÇÃO COMPLETO ===")
-    print("==========================================================")
+    logger.info("\n==========================================================")
+    logger.info("=== SCRIPT DE INICIALIZAÇÃO COMPLETO ===")
+    logger.info("==========================================================")
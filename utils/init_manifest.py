@@ -0,0 +1,85 @@
+# ==============================================================================
+# ARQUIVO:    utils/init_manifest.py
+# DESCRIÇÃO:  Manifesto de progresso da inicialização (first_initialization.py).
+#             Regista, num ficheiro JSON local, os passos concluídos e os
+#             ficheiros já enviados para o IPFS, com os hashes do conteúdo de
+#             entrada, para que uma nova execução salte o trabalho feito e
+#             retome a partir do ponto onde falhou.
+# VERSÃO:     1.0
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import os
+import json
+import logging
+import datetime
+import tempfile
+
+logger = logging.getLogger('utils.init_manifest')
+
+# --- 2. MANIFESTO ---
+
+class InitManifest:
+    """
+    Estado persistido da inicialização:
+
+        {"steps": {passo: {"content_sha256": ..., "completed_at_utc": ...}},
+         "files": {passo: {nome: {"content_sha256": ..., "ipfs_hash": ..., ...}}}}
+
+    Um passo só conta como concluído se o hash do seu conteúdo de entrada não
+    tiver mudado. Cada alteração é gravada de imediato (escrita atómica).
+    """
+    def __init__(self, path):
+        self.path = path
+        self._data = {"steps": {}, "files": {}}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    loaded = json.load(f)
+                self._data["steps"].update(loaded.get("steps", {}))
+                self._data["files"].update(loaded.get("files", {}))
+            except (OSError, ValueError) as e:
+                logger.warning("Manifesto '%s' ilegível (%s); a começar do zero.", path, e)
+
+    def is_done(self, step, content_hash=None):
+        """Indica se o passo foi concluído com o mesmo conteúdo de entrada."""
+        entry = self._data["steps"].get(step)
+        return entry is not None and entry.get("content_sha256") == content_hash
+
+    def mark_done(self, step, content_hash=None):
+        self._data["steps"][step] = {
+            "content_sha256": content_hash,
+            "completed_at_utc": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        self.save()
+
+    def get_file(self, step, name, content_hash):
+        """Registo de um ficheiro do passo, se corresponder ao mesmo conteúdo."""
+        entry = self._data["files"].get(step, {}).get(name)
+        if entry and entry.get("content_sha256") == content_hash:
+            return entry
+        return None
+
+    def record_file(self, step, name, content_hash, **fields):
+        self._data["files"].setdefault(step, {})[name] = {"content_sha256": content_hash, **fields}
+        self.save()
+
+    def reset(self):
+        self._data = {"steps": {}, "files": {}}
+        self.save()
+
+    def save(self):
+        """Grava o manifesto num ficheiro temporário e substitui o original."""
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.init_manifest.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
@@ -0,0 +1,126 @@
+# ==============================================================================
+# ARQUIVO:    utils/partition_contracts.py
+# DESCRIÇÃO:  Migração dos registos publicados antes da partição por contrato.
+#             As leituras por contrato só veem os itens publicados com a chave
+#             'contract:<id>'; para cada registo cuja partição não reproduz o
+#             seu estado completo, este script publica o estado atual (com o
+#             'contract_id') com a chave do registo e a da partição. Os
+#             registos sem contrato ficam no contrato padrão
+#             (DEFAULT_CONTRACT_ID). Pode ser executado mais de uma vez: os
+#             registos já migrados são ignorados. No inventário, o estado
+#             publicado é o snapshot do produto com os deltas já somados.
+#
+#             python utils/partition_contracts.py --dry-run
+#             python utils/partition_contracts.py
+# VERSÃO:     1.1 (Migração do inventário)
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import os
+import sys
+import argparse
+import logging
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Logger com nome fixo, como em first_initialization.py.
+logger = logging.getLogger('utils.partition_contracts')
+
+# --- 2. CONSTANTES ---
+PARTITIONED_STREAMS = ['orders_stream', 'deliveries_stream', 'financial_stream', 'notes_stream', 'inventory_stream']
+# Stream cujo estado não é a fusão dos itens (ver pending_inventory_snapshots).
+INVENTORY_STREAM = 'inventory_stream'
+
+# --- 3. MIGRAÇÃO ---
+
+def pending_snapshots(stream_name):
+    """
+    Percorre a stream e devolve os pares (chaves, registo) a publicar para que
+    a partição de cada registo contenha o seu estado completo.
+    """
+    from app.integration_server.utils import blockchain_utils, contracts
+    from app.integration_server.utils.stream_index import StreamTail
+
+    full, partitioned, contract_by_key = {}, {}, {}
+    for _, keys, data, _ in StreamTail(stream_name).poll():
+        if not isinstance(data, dict):
+            continue
+        partitions = [key for key in keys if blockchain_utils.is_partition_key(key)]
+        for key in blockchain_utils.record_keys(keys):
+            full[key] = blockchain_utils.merge_record(full.get(key), data)
+            if partitions:
+                partitioned[key] = blockchain_utils.merge_record(partitioned.get(key), data)
+                contract_by_key.setdefault(key, partitions[0][len(blockchain_utils.PARTITION_KEY_PREFIX):])
+
+    entries = []
+    for key, state in full.items():
+        if partitioned.get(key) == state:
+            continue
+        contract_id = contract_by_key.get(key) or contracts.contract_of(state)
+        entries.append((contracts.item_keys(key, contract_id), {**state, 'contract_id': contract_id}))
+    return entries
+
+def pending_inventory_snapshots():
+    """
+    Como `pending_snapshots`, para a inventory_stream: o estado de um produto
+    num contrato é o último snapshot com os deltas seguintes somados
+    (`inventory_service.apply_record`), e é publicado como um novo snapshot.
+    """
+    from app.integration_server.utils import blockchain_utils, contracts
+    from app.integration_server.utils.inventory_service import apply_record
+    from app.integration_server.utils.stream_index import StreamTail
+
+    full, partitioned = {}, {}  # contrato -> estado por product_code
+    for _, keys, data, _ in StreamTail(INVENTORY_STREAM).poll():
+        if not isinstance(data, dict):
+            continue
+        partitions = [key for key in keys if blockchain_utils.is_partition_key(key)]
+        if partitions:
+            contract_id = partitions[0][len(blockchain_utils.PARTITION_KEY_PREFIX):]
+            apply_record(partitioned.setdefault(contract_id, {}), data)
+        else:
+            contract_id = contracts.contract_of(data)
+        apply_record(full.setdefault(contract_id, {}), data)
+
+    entries = []
+    for contract_id, products in full.items():
+        for product_code, state in products.items():
+            if partitioned.get(contract_id, {}).get(product_code) == state:
+                continue
+            entries.append((contracts.item_keys(product_code, contract_id), {**state, 'contract_id': contract_id}))
+    return entries
+
+def migrate(streams, dry_run=False):
+    """Migra as streams indicadas. Retorna False se alguma publicação falhar."""
+    from app.integration_server.utils import blockchain_utils
+    ok = True
+    for stream_name in streams:
+        if stream_name == INVENTORY_STREAM:
+            entries = pending_inventory_snapshots()
+        else:
+            entries = pending_snapshots(stream_name)
+        logger.info("'%s': %d registos a publicar na partição do contrato.", stream_name, len(entries))
+        if dry_run or not entries:
+            continue
+        if blockchain_utils.publish_many_to_blockchain(stream_name, entries) is None:
+            logger.error("Falha ao migrar a stream '%s'; volte a executar o script.", stream_name)
+            ok = False
+    return ok
+
+# --- 4. EXECUÇÃO ---
+
+def main():
+    from dotenv import load_dotenv
+    from app.logging_config import setup_logging
+    load_dotenv()
+    setup_logging(fmt='%(message)s')
+
+    parser = argparse.ArgumentParser(description="Publica os registos antigos na partição do seu contrato.")
+    parser.add_argument('--streams', nargs='+', default=PARTITIONED_STREAMS, choices=PARTITIONED_STREAMS)
+    parser.add_argument('--dry-run', action='store_true', help="Apenas conta os registos a migrar.")
+    args = parser.parse_args()
+    if not migrate(args.streams, args.dry_run):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
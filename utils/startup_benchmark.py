@@ -0,0 +1,111 @@
+# ==============================================================================
+# ARQUIVO:    utils/startup_benchmark.py
+# DESCRIÇÃO:  Mede o tempo de arranque da aplicação (import + create_app) por
+#             papel, em processos novos (arranque a frio), e o perfil de
+#             importações de `python -X importtime`. Regista também quais das
+#             dependências pesadas ficaram carregadas no arranque.
+#
+#             python utils/startup_benchmark.py --runs 10
+#             python utils/startup_benchmark.py --roles web -o startup.json
+# VERSÃO:     1.0
+# ==============================================================================
+
+# --- 1. IMPORTAÇÕES ---
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Dependências que só devem ser carregadas quando usadas.
+HEAVY_MODULES = ('fpdf', 'PIL', 'ipfshttpclient', 'cryptography', 'psycopg2', 'numpy', 'pyarrow', 'fitz')
+
+# Código executado em cada processo: mede o import e a factory e devolve, na
+# saída padrão, o tempo e os módulos pesados presentes em sys.modules.
+PROBE = """
+import sys, json, time
+start = time.perf_counter()
+from app import create_app
+create_app({role!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed,
+                   "heavy_modules": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+# --- 2. MEDIÇÃO ---
+
+def parse_importtime(stderr, top=15):
+    """
+    Lê a saída de `-X importtime` e devolve os módulos com maior tempo
+    acumulado (em ms), incluindo os seus próprios imports.
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        # Formato: "import time:  <self us> | <cumulative us> | <módulo indentado>"
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            modules[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+        except ValueError:
+            continue
+    ranked = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    return [{"module": name, "self_ms": round(s, 2), "cumulative_ms": round(c, 2)} for name, (s, c) in ranked]
+
+def run_once(role, importtime=False):
+    """Arranca a aplicação num processo novo e devolve (resultado, stderr)."""
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', PROBE.format(role=role, heavy=HEAVY_MODULES)]
+    # Silencia o logging da aplicação para não misturar com o importtime.
+    env = dict(os.environ, LOG_LEVEL='CRITICAL', PYTHONDONTWRITEBYTECODE='1')
+    completed = subprocess.run(command, cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+def benchmark_role(role, runs, top):
+    """Mede `runs` arranques a frio de um papel e o perfil de importações."""
+    # O primeiro arranque compila os .pyc; não entra na estatística.
+    run_once(role)
+    samples = [run_once(role)[0]["seconds"] * 1000 for _ in range(runs)]
+    probe, stderr = run_once(role, importtime=True)
+    return {
+        "role": role,
+        "runs": runs,
+        "median_ms": round(statistics.median(samples), 1),
+        "min_ms": round(min(samples), 1),
+        "max_ms": round(max(samples), 1),
+        "heavy_modules": probe["heavy_modules"],
+        "top_imports": parse_importtime(stderr, top),
+    }
+
+# --- 3. EXECUÇÃO ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de arranque da aplicação por papel.")
+    parser.add_argument('--roles', nargs='+', default=['web', 'integration', 'all'],
+                        choices=['web', 'integration', 'all'])
+    parser.add_argument('--runs', type=int, default=5, help="Arranques medidos por papel.")
+    parser.add_argument('--top', type=int, default=10, help="Módulos listados no perfil de importações.")
+    parser.add_argument('--output', '-o', help="Grava os resultados em JSON neste ficheiro.")
+    args = parser.parse_args()
+
+    results = []
+    for role in args.roles:
+        result = benchmark_role(role, args.runs, args.top)
+        results.append(result)
+        print(f"[{role}] mediana {result['median_ms']} ms (mín. {result['min_ms']}, máx. {result['max_ms']}) "
+              f"em {result['runs']} arranques")
+        print(f"  dependências pesadas carregadas: {', '.join(result['heavy_modules']) or 'nenhuma'}")
+        for entry in result['top_imports']:
+            print(f"  {entry['cumulative_ms']:>9.2f} ms  {entry['module']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+# ==============================================================================
+# ARQUIVO: wsgi.py
+# DESCRIÇÃO: Objeto WSGI para servidores externos, com o papel da aplicação
+#            definido por APP_ROLE. Exemplo:
+#              APP_ROLE=integration gunicorn -k gthread -w 4 --threads 8 wsgi:app
+# v1
+# ==============================================================================
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app import create_app
+
+app = create_app()